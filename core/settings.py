@@ -135,6 +135,29 @@ CACHES = {
     }
 }
 
+# Threads per process running background AI searches (game/jobs.py).
+# Job records live in the cache above; when several processes serve the
+# site it must be a shared backend (e.g. Redis) so any of them can
+# answer a poll.
+AI_JOB_WORKERS = int(os.environ.get('AI_JOB_WORKERS', '2'))
+
+# Admission control for engine processes (game/admission.py): engine
+# commands run at once per process (default: CPU count), how many of them
+# may be searches, how many of each class may queue, and seconds a
+# queued command waits before the request is answered with 503.
+ENGINE_SLOTS = int(os.environ.get('ENGINE_SLOTS', '0')) or None
+ENGINE_SEARCH_SLOTS = int(os.environ.get('ENGINE_SEARCH_SLOTS', '0')) or None
+ENGINE_INTERACTIVE_QUEUE = int(os.environ.get('ENGINE_INTERACTIVE_QUEUE', '64'))
+ENGINE_SEARCH_QUEUE = int(os.environ.get('ENGINE_SEARCH_QUEUE', '8'))
+ENGINE_QUEUE_TIMEOUT = float(os.environ.get('ENGINE_QUEUE_TIMEOUT', '5'))
+
+# How saved games are announced to open event streams and sockets
+# (game/events.py).  The local backend only reaches this process; with
+# several processes on PostgreSQL use 'game.events.PostgresBackend'.
+GAME_EVENTS_BACKEND = os.environ.get(
+    'GAME_EVENTS_BACKEND', 'game.events.LocalBackend'
+)
+
 PASSWORD_RESET_EMAIL_COOLDOWN_SECONDS = 300
 PASSWORD_RESET_IP_WINDOW_SECONDS = 900
 PASSWORD_RESET_IP_MAX_REQUESTS = 3
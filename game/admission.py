@@ -0,0 +1,182 @@
+"""Admission control for engine processes.
+
+Every ``ChessGame._call_engine`` runs inside ``slot``, which caps how
+many engine processes this web process runs at once.  Commands come in
+two classes: interactive ones (``MOVES``, ``LEGAL``, ``STATUS``, ...)
+answer a player's click and take milliseconds, searches (``BESTMOVE``,
+``ANALYZE``, ``MATE``) take seconds.  Interactive commands are admitted
+ahead of queued searches, and searches may not fill every slot, so a
+spike of AI requests cannot starve move validation.
+
+A command that finds its class's queue full, or that waits longer than
+``ENGINE_QUEUE_TIMEOUT``, raises ``EngineBusy``; views turn it into a
+429 or 503 answer with ``Retry-After``.
+"""
+import heapq
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+INTERACTIVE = 0
+SEARCH = 1
+
+SEARCH_COMMANDS = frozenset({'BESTMOVE', 'ANALYZE', 'MATE'})
+
+# Seconds a client is told to wait before retrying, by class
+RETRY_AFTER = {INTERACTIVE: 1, SEARCH: 5}
+
+# Weight of the newest command in the running average of durations
+DURATION_SMOOTHING = 0.2
+
+
+class EngineBusy(Exception):
+    """No engine slot was free in time.
+
+    ``status`` is 429 when the queue was already full (the client should
+    back off) and 503 when the command queued but timed out.
+    """
+
+    def __init__(self, message, status, retry_after):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+def priority_for(command):
+    """Class of the engine *command* line: ``SEARCH`` or ``INTERACTIVE``."""
+    name = command.split(None, 1)[0] if command else ''
+    return SEARCH if name in SEARCH_COMMANDS else INTERACTIVE
+
+
+class Limiter:
+    """Engine slots shared by the threads of one process.
+
+    At most *slots* commands run at once, searches in no more than
+    *search_slots* of them.  Waiting commands are admitted by class, then
+    in arrival order; at most ``max_queue[class]`` wait at a time.
+    """
+
+    def __init__(self, slots, search_slots, max_queue, queue_timeout):
+        self.slots = slots
+        self.search_slots = min(search_slots, slots)
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.running = [0, 0]
+        self.queued = [0, 0]
+        # Running average of command seconds by class, from a first guess
+        self.seconds = [0.05, 1.0]
+        self._waiting = []  # heap of (priority, arrival) tickets
+        self._arrivals = itertools.count()
+        self._cond = threading.Condition()
+
+    def _has_room(self, priority):
+        if sum(self.running) >= self.slots:
+            return False
+        return priority != SEARCH or self.running[SEARCH] < self.search_slots
+
+    def acquire(self, priority, timeout=None):
+        """Take a slot for a command of class *priority*, waiting in the
+        queue (at most *timeout* seconds, default ``queue_timeout``) if
+        needed; raise ``EngineBusy`` when none comes."""
+        with self._cond:
+            ahead = self._waiting and self._waiting[0][0] <= priority
+            if not ahead and self._has_room(priority):
+                self.running[priority] += 1
+                return
+            if self.queued[priority] >= self.max_queue[priority]:
+                raise EngineBusy(
+                    'The engine is busy. Please retry shortly.',
+                    429, RETRY_AFTER[priority])
+
+            ticket = (priority, next(self._arrivals))
+            heapq.heappush(self._waiting, ticket)
+            self.queued[priority] += 1
+            if timeout is None:
+                timeout = self.queue_timeout
+            deadline = time.monotonic() + min(timeout, self.queue_timeout)
+            try:
+                while not (self._waiting[0] == ticket
+                           and self._has_room(priority)):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise EngineBusy(
+                            'The engine is overloaded. Please retry.',
+                            503, RETRY_AFTER[priority])
+                    self._cond.wait(remaining)
+                self.running[priority] += 1
+            finally:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                self.queued[priority] -= 1
+                # The next ticket may now be at the head
+                self._cond.notify_all()
+
+    def release(self, priority, seconds=None):
+        """Free a slot; *seconds* is how long the command ran."""
+        with self._cond:
+            self.running[priority] -= 1
+            if seconds is not None:
+                self.seconds[priority] += DURATION_SMOOTHING * (
+                    seconds - self.seconds[priority])
+            self._cond.notify_all()
+
+    def expected_wait(self, priority):
+        """Estimate the seconds a new command of class *priority* would
+        queue before it starts."""
+        with self._cond:
+            ahead = sum(1 for ticket in self._waiting if ticket[0] <= priority)
+            if not ahead and self._has_room(priority):
+                return 0.0
+            slots = self.search_slots if priority == SEARCH else self.slots
+            return (ahead + 1) / slots * self.seconds[priority]
+
+    def load(self):
+        """Return ``{'running': [...], 'queued': [...], 'seconds': [...]}``
+        by class."""
+        with self._cond:
+            return {'running': list(self.running),
+                    'queued': list(self.queued),
+                    'seconds': list(self.seconds)}
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_limiter():
+    """Return this process's limiter, created from settings on first use."""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            slots = getattr(settings, 'ENGINE_SLOTS', None) or (
+                os.cpu_count() or 2)
+            search_slots = getattr(settings, 'ENGINE_SEARCH_SLOTS', None)
+            _limiter = Limiter(
+                slots=slots,
+                search_slots=search_slots or max(1, slots - 1),
+                max_queue={
+                    INTERACTIVE: getattr(
+                        settings, 'ENGINE_INTERACTIVE_QUEUE', 64),
+                    SEARCH: getattr(settings, 'ENGINE_SEARCH_QUEUE', 8),
+                },
+                queue_timeout=getattr(settings, 'ENGINE_QUEUE_TIMEOUT', 5),
+            )
+    return _limiter
+
+
+@contextmanager
+def slot(command, timeout=None):
+    """Hold an engine slot for *command* while the block runs, queueing
+    at most *timeout* seconds for it."""
+    limiter = get_limiter()
+    priority = priority_for(command)
+    limiter.acquire(priority, timeout)
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        limiter.release(priority, time.monotonic() - started)
@@ -0,0 +1,271 @@
+"""Endgame bitbases for king + queen/rook/pawn against a lone king.
+
+Each table stores one bit per position telling whether the side with the
+extra piece (the *strong* side) wins with best play.  Positions are
+normalised so that the strong side is white -- a black strong side is
+mirrored top to bottom -- and indexed as::
+
+    stm * 64**3 + white_king * 64**2 + piece * 64 + black_king
+
+where ``stm`` is 0 when the strong side is to move and 1 otherwise, and
+squares are numbered ``row * 8 + col`` with row 0 being rank 8 (the
+engine's board order).  Draws and illegal positions are 0, so every file
+is exactly ``2 * 64**3`` bits (64 KB).
+
+The tables are produced offline by retrograde analysis (``manage.py
+build_bitbases``) and stored next to the engines, which probe them with
+the same indexing scheme.  KPK is generated last because promotions lead
+into the KQK and KRK tables.
+"""
+
+import os
+from collections import deque
+
+BITBASE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'engine')
+
+# Generation order matters: KPK looks up KQK/KRK after promotion.
+TABLES = {'kqk': 'q', 'krk': 'r', 'kpk': 'p'}
+SIDE = 64 * 64 * 64
+SIZE = 2 * SIDE
+
+_ROOK_DIRS = ((0, 1), (0, -1), (1, 0), (-1, 0))
+_BISHOP_DIRS = ((1, 1), (1, -1), (-1, 1), (-1, -1))
+
+
+def _square(row, col):
+    return row * 8 + col
+
+
+def _build_tables():
+    king_moves = []
+    rays = []
+    for sq in range(64):
+        row, col = divmod(sq, 8)
+        king_moves.append([
+            _square(row + dr, col + dc)
+            for dr in (-1, 0, 1) for dc in (-1, 0, 1)
+            if (dr or dc) and 0 <= row + dr < 8 and 0 <= col + dc < 8
+        ])
+        sq_rays = {}
+        for kind, dirs in (('r', _ROOK_DIRS), ('b', _BISHOP_DIRS)):
+            sq_rays[kind] = []
+            for dr, dc in dirs:
+                ray = []
+                r, c = row + dr, col + dc
+                while 0 <= r < 8 and 0 <= c < 8:
+                    ray.append(_square(r, c))
+                    r += dr
+                    c += dc
+                sq_rays[kind].append(ray)
+        sq_rays['q'] = sq_rays['r'] + sq_rays['b']
+        rays.append(sq_rays)
+    return king_moves, rays
+
+
+KING_MOVES, RAYS = _build_tables()
+KING_ADJ = [frozenset(moves) for moves in KING_MOVES]
+
+
+def _slider_attacks(kind, piece, target, blocker):
+    """True when a queen/rook on *piece* hits *target*, *blocker* in the way."""
+    for ray in RAYS[piece][kind]:
+        for sq in ray:
+            if sq == target:
+                return True
+            if sq == blocker:
+                break
+    return False
+
+
+def _attacked(kind, wk, piece, target):
+    """Is *target* attacked by white (black king ignored as a blocker)?"""
+    if target in KING_ADJ[wk]:
+        return True
+    if kind == 'p':
+        row, col = divmod(piece, 8)
+        return row - 1 == target // 8 and abs(col - target % 8) == 1
+    return _slider_attacks(kind, piece, target, wk)
+
+
+def index(stm, wk, piece, bk):
+    return stm * SIDE + wk * 4096 + piece * 64 + bk
+
+
+def _valid(kind, wk, piece, bk):
+    if wk == piece or wk == bk or piece == bk or bk in KING_ADJ[wk]:
+        return False
+    return kind != 'p' or 1 <= piece // 8 <= 6
+
+
+def generate(name, lookup=None):
+    """Return the bit array for table *name* as a ``bytearray``.
+
+    *lookup* maps table names to already generated arrays and is needed
+    for KPK, whose promotions are resolved in KQK and KRK.
+    """
+    kind = TABLES[name]
+    won = bytearray(SIDE)    # white (strong side) to move and wins
+    lost = bytearray(SIDE)   # black to move and loses
+    counter = [0] * SIDE     # legal black replies not yet known to lose
+    queue = deque()
+
+    for wk in range(64):
+        for piece in range(64):
+            for bk in range(64):
+                if not _valid(kind, wk, piece, bk):
+                    continue
+                pos = wk * 4096 + piece * 64 + bk
+
+                # Black to move: count replies, spot mates and escapes
+                replies = 0
+                escape = False
+                for to in KING_MOVES[bk]:
+                    if to in KING_ADJ[wk]:
+                        continue
+                    if to == piece:
+                        escape = True  # Undefended piece falls: a draw
+                    elif not _attacked(kind, wk, piece, to):
+                        replies += 1
+                if escape:
+                    counter[pos] = -1
+                else:
+                    counter[pos] = replies
+                    if not replies and _attacked(kind, wk, piece, bk):
+                        lost[pos] = 1
+                        queue.append((1, wk, piece, bk))
+
+                # White to move: promotions leave this table
+                if (kind == 'p' and piece // 8 == 1
+                        and piece - 8 not in (wk, bk)
+                        and not _attacked(kind, wk, piece, bk)):
+                    after = wk * 4096 + (piece - 8) * 64 + bk
+                    if any(_bit(lookup[table], SIDE + after)
+                           for table in ('kqk', 'krk')):
+                        won[pos] = 1
+                        queue.append((0, wk, piece, bk))
+
+    while queue:
+        stm, wk, piece, bk = queue.popleft()
+        if stm == 1:
+            # Black is lost here, so every white move leading here wins
+            for pred in _white_unmoves(kind, wk, piece, bk):
+                if not won[pred]:
+                    won[pred] = 1
+                    queue.append((0, *_split(pred)))
+        else:
+            for from_bk in KING_MOVES[bk]:
+                if (from_bk in (wk, piece) or from_bk in KING_ADJ[wk]):
+                    continue
+                pred = wk * 4096 + piece * 64 + from_bk
+                if counter[pred] > 0:
+                    counter[pred] -= 1
+                    if not counter[pred]:
+                        lost[pred] = 1
+                        queue.append((1, wk, piece, from_bk))
+
+    bits = bytearray(SIZE // 8)
+    for pos in range(SIDE):
+        if won[pos]:
+            bits[pos >> 3] |= 1 << (pos & 7)
+        if lost[pos]:
+            bits[(SIDE + pos) >> 3] |= 1 << ((SIDE + pos) & 7)
+    return bits
+
+
+def _split(pos):
+    return pos // 4096, (pos // 64) % 64, pos % 64
+
+
+def _white_unmoves(kind, wk, piece, bk):
+    """Yield white-to-move positions one white move before (wk, piece, bk)."""
+    candidates = []
+    for from_wk in KING_MOVES[wk]:
+        if from_wk not in (piece, bk) and from_wk not in KING_ADJ[bk]:
+            candidates.append((from_wk, piece))
+    if kind == 'p':
+        row = piece // 8
+        if row + 1 <= 6 and piece + 8 not in (wk, bk):
+            candidates.append((wk, piece + 8))
+            if row == 4 and piece + 16 not in (wk, bk):
+                candidates.append((wk, piece + 16))
+    else:
+        for ray in RAYS[piece][kind]:
+            for sq in ray:
+                if sq in (wk, bk):
+                    break
+                candidates.append((wk, sq))
+
+    for from_wk, from_piece in candidates:
+        # The position before must not leave black in check with white to move
+        if not _attacked(kind, from_wk, from_piece, bk):
+            yield from_wk * 4096 + from_piece * 64 + bk
+
+
+def _bit(bits, idx):
+    return (bits[idx >> 3] >> (idx & 7)) & 1
+
+
+def path(name, directory=BITBASE_DIR):
+    return os.path.join(directory, f'{name}.bb')
+
+
+_loaded = {}
+
+
+def load(name, directory=BITBASE_DIR):
+    """Read a table from disk (cached per process); None if missing."""
+    key = (name, directory)
+    if key not in _loaded:
+        try:
+            with open(path(name, directory), 'rb') as fh:
+                data = fh.read()
+        except OSError:
+            data = None
+        _loaded[key] = data if data and len(data) == SIZE // 8 else None
+    return _loaded[key]
+
+
+def probe(board64, turn, castling='-', directory=BITBASE_DIR):
+    """Return the result of a covered ending with best play, else None.
+
+    *board64* is the engine's 64-char board string.  The result is
+    ``'white'`` or ``'black'`` for a win and ``'draw'`` otherwise.
+    Positions with castling rights are never covered.
+    """
+    if castling not in ('-', ''):
+        return None
+    squares = {}
+    for sq, ch in enumerate(board64):
+        if ch != '.':
+            if len(squares) == 3 or ch in squares:
+                return None
+            squares[ch] = sq
+    extra = [ch for ch in squares if ch not in 'Kk']
+    if len(squares) != 3 or 'K' not in squares or 'k' not in squares:
+        return None
+    piece = extra[0]
+    name = f'k{piece.lower()}k'
+    if name not in TABLES:
+        return None
+    bits = load(name, directory)
+    if bits is None:
+        return None
+
+    strong = 'white' if piece.isupper() else 'black'
+    wk, ps, bk = squares['K'], squares[piece], squares['k']
+    if strong == 'black':
+        # Mirror so the strong side plays "up" the board as white
+        wk, ps, bk = bk ^ 56, ps ^ 56, wk ^ 56
+    stm = 0 if turn == strong else 1
+    return strong if _bit(bits, index(stm, wk, ps, bk)) else 'draw'
+
+
+def build(directory=BITBASE_DIR):
+    """Generate every table in order and write them to *directory*."""
+    generated = {}
+    for name in TABLES:
+        generated[name] = generate(name, generated)
+        with open(path(name, directory), 'wb') as fh:
+            fh.write(generated[name])
+        _loaded.pop((name, directory), None)
+    return generated
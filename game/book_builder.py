@@ -0,0 +1,201 @@
+"""Building opening books from their sources.
+
+Turns the curated JSON book, PGN files and the games played on this
+site into the ``{zobrist_key: {move: weight}}`` entries that
+``opening_book.write_book`` compiles.  Moves are
+``(fr, fc, tr, tc, promotion)`` tuples, each checked against the engine
+here so the AI can play book moves without validating them.
+"""
+import re
+
+from .engine import ChessGame
+from .json_state import load_json_state, save_json_state
+from .opening_book import decode_move, encode_move, iter_pgn_games
+
+
+SAN_PATTERN = re.compile(
+    r'^([NBRQK])?([a-h])?([1-8])?x?([a-h][1-8])(?:=?([NBRQ]))?$')
+CASTLING_SAN = {'O-O': 6, '0-0': 6, 'O-O-O': 2, '0-0-0': 2}
+
+
+def _could_reach(piece, fr, fc, tr, tc):
+    """Cheap geometric pre-filter so only plausible pieces hit the engine."""
+    dr, dc = abs(tr - fr), abs(tc - fc)
+    kind = piece.lower()
+    if kind == 'n':
+        return {dr, dc} == {1, 2}
+    if kind == 'b':
+        return dr == dc != 0
+    if kind == 'r':
+        return (dr == 0) != (dc == 0)
+    if kind == 'q':
+        return dr == dc != 0 or (dr == 0) != (dc == 0)
+    if kind == 'k':
+        return max(dr, dc) == 1
+    step = -1 if piece.isupper() else 1
+    return dc <= 1 and 0 < (tr - fr) * step <= 2
+
+
+def resolve_san(game, san):
+    """
+    Map a SAN move to a ``move_history``-style dict for *game*.
+    Returns None when the move is unparseable or illegal.
+    """
+    san = san.rstrip('+#!?')
+    is_white = game.current_turn == 'white'
+    files = ChessGame.FILES
+
+    if san in CASTLING_SAN:
+        row = 7 if is_white else 0
+        candidates = [(row, 4, row, CASTLING_SAN[san], None)]
+    else:
+        match = SAN_PATTERN.match(san)
+        if not match:
+            return None
+        letter, from_file, from_rank, target, promo = match.groups()
+        tr, tc = 8 - int(target[1]), files.index(target[0])
+        piece = letter or 'P'
+        if not letter and not from_file:
+            # Pawn pushes stay on their file; captures always name it
+            from_file = target[0]
+        if not is_white:
+            piece = piece.lower()
+        if promo:
+            promo = promo if is_white else promo.lower()
+        candidates = [
+            (fr, fc, tr, tc, promo)
+            for fr in range(8) for fc in range(8)
+            if game.board[fr][fc] == piece
+            and (not from_file or files[fc] == from_file)
+            and (not from_rank or 8 - fr == int(from_rank))
+            and _could_reach(piece, fr, fc, tr, tc)
+        ]
+
+    for fr, fc, tr, tc, promo in candidates:
+        if game.board[fr][fc] and game.validate_move(fr, fc, tr, tc)[0]:
+            return {'from': [fr, fc], 'to': [tr, tc], 'promoted_to': promo}
+    return None
+
+
+def book_entries_from_json(book, rejected=None):
+    """
+    Convert the curated JSON book into ``{zobrist_key: {move: weight}}``.
+    Every move is checked against the engine's legal moves; illegal ones
+    are left out and, if *rejected* is a list, recorded as ``(fen, move)``.
+    """
+    entries = {}
+    for fen_key, moves in book.items():
+        if fen_key.startswith('_') or not isinstance(moves, list):
+            continue
+        try:
+            game = ChessGame.from_fen(fen_key)
+        except ValueError:
+            continue
+        key = game.zobrist_key()
+        for move in moves:
+            if (
+                ChessGame._is_board_move(move)
+                and game.validate_move(*move)[0]
+            ):
+                entries.setdefault(key, {})[(*move, None)] = 1
+            elif rejected is not None:
+                rejected.append((fen_key, move))
+    return entries
+
+
+def book_entries_from_pgn(text, max_plies=20):
+    """
+    Build ``{zobrist_key: {move: weight}}`` from the main lines of a PGN
+    document, weighting each move by how often it was played.
+    """
+    entries = {}
+    for san_moves, _ in iter_pgn_games(text):
+        game = ChessGame()
+        for san in san_moves[:max_plies]:
+            move = resolve_san(game, san)
+            if not move:
+                break
+            key = game.zobrist_key()
+            fr, fc = move['from']
+            tr, tc = move['to']
+            promo = move['promoted_to'].lower() if move['promoted_to'] else None
+            moves = entries.setdefault(key, {})
+            moves[(fr, fc, tr, tc, promo)] = moves.get(
+                (fr, fc, tr, tc, promo), 0) + 1
+            game.apply_recorded_move(move)
+    return entries
+
+
+def merge_book_entries(target, source):
+    """Add the weights of *source* into *target* and return *target*."""
+    for key, moves in source.items():
+        merged = target.setdefault(key, {})
+        for move, weight in moves.items():
+            merged[move] = merged.get(move, 0) + weight
+    return target
+
+
+LEARNED_BOOK_VERSION = 1
+
+
+def mine_book_moves(results, max_plies=20, include_draws=False):
+    """
+    Count the moves played by winning sides in stored games.
+    Returns ``({zobrist_key: {move: count}}, last_game_id)`` where moves are
+    ``(fr, fc, tr, tc, promotion)`` tuples. Both sides of drawn games are
+    learned only when *include_draws* is set; moves of the losing side are
+    never learned.
+    """
+    counts = {}
+    last_game_id = 0
+
+    for result in results:
+        last_game_id = max(last_game_id, result.pk)
+        if result.winner == 'draw' and not include_draws:
+            continue
+        game = ChessGame()
+        for move in (result.moves or [])[:max_plies]:
+            key = game.zobrist_key()
+            mover = game.current_turn
+            try:
+                game.apply_recorded_move(move)
+            except (KeyError, TypeError, ValueError, IndexError):
+                break
+            if result.winner not in (mover, 'draw'):
+                continue
+            fr, fc = move['from']
+            tr, tc = move['to']
+            promoted_to = move.get('promoted_to')
+            book_move = (fr, fc, tr, tc,
+                         promoted_to.lower() if promoted_to else None)
+            moves = counts.setdefault(key, {})
+            moves[book_move] = moves.get(book_move, 0) + 1
+
+    return counts, last_game_id
+
+
+def load_learned_book_state(path):
+    """Read the learned-book sidecar and decode its move counts."""
+    state = load_json_state(path, {
+        'version': LEARNED_BOOK_VERSION,
+        'last_game_id': 0,
+        'filters': {},
+        'counts': {},
+    })
+    state['counts'] = {
+        int(key, 16): {
+            decode_move(int(move)): count for move, count in moves.items()
+        }
+        for key, moves in state['counts'].items()
+    }
+    return state
+
+
+def save_learned_book_state(path, state):
+    """Encode move counts compactly and write the learned-book sidecar."""
+    save_json_state(path, dict(state, counts={
+        f"{key:016x}": {
+            str(encode_move(*move)): count for move, count in moves.items()
+        }
+        for key, moves in state['counts'].items()
+    }))
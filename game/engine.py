@@ -13,7 +13,13 @@ minimax search.  Keys are minimal FEN strings (board layout + side to
 move + castling rights, **no** en-passant / half-move / full-move
 counters) and values are lists of ``[from_row, from_col, to_row,
 to_col]`` move coordinates.  When multiple book moves are available one
-is chosen at random to add variety.
+is chosen at random to add variety.  Book moves are checked against the
+engine when the book is built (``build_book`` and the curated-book test),
+so a lookup never spawns the engine.
+
+When ``game/engine/opening_book.bin`` exists (see ``manage.py build_book``)
+it replaces the JSON book: a sorted, memory-mapped table of Zobrist keys
+and weighted moves that is probed with a binary search.
 """
 
 import os
@@ -24,6 +30,9 @@ import sys
 import time
 from datetime import date
 
+from . import admission, bitbase, zobrist
+from .opening_book import OpeningBook
+
 class ChessGame:
     """Manage a single chess game: state, validation,
       and engine communication."""
@@ -46,12 +55,41 @@ class ChessGame:
 
     FILES = 'abcdefgh'
 
+    # Zobrist castling letters for the ``castling_rights`` keys
+    CASTLING_HASH_KEYS = (
+        ('K', 'w_k'), ('Q', 'w_q'), ('k', 'b_k'), ('q', 'b_q'))
+
     # Path to the JSON opening book
     OPENING_BOOK_PATH = os.path.join(ENGINE_DIR, 'opening_book.json')
 
     # Class-level cache so the file is read only once per process
     _opening_book: dict | None = None
 
+    # Binary Zobrist-keyed book built by ``build_book`` (preferred if present)
+    OPENING_BOOK_BIN_PATH = os.path.join(ENGINE_DIR, 'opening_book.bin')
+    _binary_book: OpeningBook | bool | None = None
+
+    # Book learned from games played here by ``build_learned_book``,
+    # probed when the binary book has no move for the position
+    LEARNED_BOOK_BIN_PATH = os.path.join(ENGINE_DIR, 'learned_book.bin')
+    _learned_book: OpeningBook | bool | None = None
+
+    # Deep search results precomputed offline by ``warm_positions``
+    POSITION_CACHE_PATH = os.path.join(ENGINE_DIR, 'position_cache.json')
+    _position_cache: dict | None = None
+    # Modification time (ns) of the file ``_position_cache`` was read from
+    _position_cache_mtime: int | None = None
+
+    # Seconds to wait for a single engine command
+    ENGINE_TIMEOUT = 5
+
+    # Whether engine commands wait for a slot of ``admission``; offline
+    # jobs that bound their own parallelism turn it off
+    ENGINE_ADMISSION = True
+
+    # Version of the compact session encoding written by ``to_dict``
+    SESSION_VERSION = 2
+
     INITIAL_BOARD = [
         ['r', 'n', 'b', 'q', 'k', 'b', 'n', 'r'],
         ['p', 'p', 'p', 'p', 'p', 'p', 'p', 'p'],
@@ -89,18 +127,29 @@ class ChessGame:
         # (row, col) of the square a pawn can capture en passant
         self.en_passant_target = None
         self.halfmove_clock = 0
-        self.repetition_history = [self.generate_position_key()]
-        self.repetition_counts = {self.repetition_history[0]: 1}
+        # Zobrist hash of the current position, updated by ``_apply_move``
+        self.position_hash = self.zobrist_key()
+        self._reset_repetition()
+        # (plies, text) behind ``pgn_movetext`` and
+        # ((hash, side), key) behind ``generate_fen_key``
+        self._movetext = (0, '')
+        self._fen_key = None
         self.game_status = 'active'
         self.draw_reason = None
         self.threefold_warning = False
+        # ``to_dict()`` as last loaded or saved; None until first stored
+        self._saved = None
 
     def serialize_board(self):
         """Flatten the 2-D board into a 64-char string for the C++ engine."""
         return ''.join(c if c else '.' for row in self.board for c in row)
 
     def generate_pgn(self, white_name='White', black_name='Black'):
-        """Generate a PGN string from move history."""
+        """Generate a PGN string from move history.
+
+        The movetext comes from ``pgn_movetext()``; only the headers are
+        built here.
+        """
         if not self.move_history:
             return ""
         
@@ -113,16 +162,6 @@ class ChessGame:
         elif self.game_status == 'resignation':
             result = '1-0' if self.current_turn == 'black' else '0-1'
 
-        pgn_moves = []
-        for i in range(0, len(self.move_history), 2):
-            move_number = i // 2 + 1
-            white_move = self.move_history[i]['notation']
-            if i + 1 < len(self.move_history):
-                black_move = self.move_history[i + 1]['notation']
-                pgn_moves.append(f"{move_number}. {white_move} {black_move}")
-            else:
-                pgn_moves.append(f"{move_number}. {white_move}")
-        
         today = date.today().strftime('%Y.%m.%d')
         headers = [
             '[Event "Checkora Match"]',
@@ -131,17 +170,43 @@ class ChessGame:
             f'[Date "{today}"]',
             f'[Result "{result}"]',
         ]
-        moves = " ".join(pgn_moves)
-        return "\n".join(headers) + "\n\n" + moves
+        return "\n".join(headers) + "\n\n" + self.pgn_movetext()
+
+    def pgn_movetext(self):
+        """Return the PGN movetext (``1. e4 e5 2. Nf3``) of the game.
+
+        The text is cached together with the number of plies it covers
+        and only the moves played since are appended, so the cost does
+        not grow with the length of the game.
+        """
+        plies, text = self._movetext
+        total = len(self.move_history)
+        if plies != total:
+            # A shorter history means it was replaced: start over
+            parts = [text] if text and plies < total else []
+            for i in range(plies if plies < total else 0, total):
+                notation = self.move_history[i]['notation']
+                parts.append(f"{i // 2 + 1}. {notation}" if i % 2 == 0
+                             else notation)
+            self._movetext = (total, ' '.join(parts))
+        return self._movetext[1]
 
     def to_dict(self):
         """Serialise state for Django session storage.
-DP cache is intentionally excluded to save cookie space."""
+
+        The DP cache is intentionally excluded to save space.  The
+        encoding is compact (version ``SESSION_VERSION``): the board is
+        the 64-char engine string, castling rights ``KQkq``, captured
+        pieces and repetition hashes are joined strings and the move
+        history is packed by ``_pack_moves``.  ``from_dict`` still reads
+        the nested layout of older sessions.
+        """
         return {
-            'board': self.board,
+            'v': self.SESSION_VERSION,
+            'board': self.serialize_board(),
             'current_turn': self.current_turn,
-            'move_history': self.move_history,
-            'captured': self.captured,
+            'captured': {color: ''.join(pieces)
+                         for color, pieces in self.captured.items()},
             'white_time': self.white_time,
             'black_time': self.black_time,
             'time_limit': self.time_limit,
@@ -149,24 +214,76 @@ DP cache is intentionally excluded to save cookie space."""
             'last_ts': self.last_ts,
             'paused': self.paused,
             'mode': self.mode,
-            'castling_rights': self.castling_rights,
+            'castling_rights': self.serialize_castling_rights(),
             'en_passant_target': self.en_passant_target,
             'player_color': self.player_color,
             'halfmove_clock': self.halfmove_clock,
-            'repetition_history': self.repetition_history,
+            'repetition_history': ''.join(
+                zobrist.format_hash(key) for key in self.repetition_history),
             'game_status': self.game_status,
             'draw_reason': self.draw_reason,
             'threefold_warning': self.threefold_warning,
+            'moves': self._pack_moves(self.move_history),
+            'pgn': self.pgn_movetext(),
         }
 
+    @staticmethod
+    def _pack_moves(moves):
+        """Pack a move history into one string.
+
+        Each move is ``<fr><fc><tr><tc><piece><captured><promoted><SAN>``
+        with ``.`` for no capture / promotion, moves separated by spaces.
+        The mover's colour follows from the case of the piece.
+        """
+        return ' '.join(
+            f"{move['from'][0]}{move['from'][1]}{move['to'][0]}{move['to'][1]}"
+            f"{move['piece']}{move.get('captured') or '.'}"
+            f"{move.get('promoted_to') or '.'}{move['notation']}"
+            for move in moves)
+
+    @staticmethod
+    def _unpack_moves(packed):
+        """Inverse of ``_pack_moves``."""
+        moves = []
+        for token in packed.split():
+            piece = token[4]
+            moves.append({
+                'notation': token[7:],
+                'piece': piece,
+                'from': [int(token[0]), int(token[1])],
+                'to': [int(token[2]), int(token[3])],
+                'captured': None if token[5] == '.' else token[5],
+                'color': 'white' if piece.isupper() else 'black',
+                'promoted_to': None if token[6] == '.' else token[6],
+            })
+        return moves
+
+    @classmethod
+    def moves_from_session(cls, data):
+        """Return the move history stored in a session dictionary,
+        whichever encoding wrote it."""
+        if 'moves' in data:
+            return cls._unpack_moves(data['moves'])
+        return data.get('move_history', [])
+
+    @classmethod
+    def board_from_session(cls, data):
+        """Return the 8x8 board stored in a session dictionary."""
+        board = data['board']
+        if isinstance(board, str):
+            return cls._parse_board64(board)
+        return board
+
     @classmethod
     def from_dict(cls, data):
         """Restore a game from a session dictionary."""
         game = cls.__new__(cls)
-        game.board = data['board']
+        game.board = cls.board_from_session(data)
         game.current_turn = data['current_turn']
-        game.move_history = data.get('move_history', [])
-        game.captured = data.get('captured', {'white': [], 'black': []})
+        game.move_history = cls.moves_from_session(data)
+        captured = data.get('captured', {'white': [], 'black': []})
+        game.captured = {color: list(pieces)
+                         for color, pieces in captured.items()}
         game.paused = data.get('paused', False)
         game.white_time = data['white_time']
         game.black_time = data['black_time']
@@ -175,25 +292,40 @@ DP cache is intentionally excluded to save cookie space."""
         game.last_ts = data['last_ts']
         game.mode = data.get('mode', 'pvp')
         game.player_color = data.get('player_color', 'white')
-        game.castling_rights = data.get(
-            'castling_rights',
-            {'w_k': True, 'w_q': True, 'b_k': True, 'b_q': True})
+        castling_rights = data.get('castling_rights', 'KQkq')
+        game.castling_rights = (
+            cls._parse_fen_castling(castling_rights)
+            if isinstance(castling_rights, str) else castling_rights)
         game.en_passant_target = data.get('en_passant_target', None)
         game.halfmove_clock = data.get('halfmove_clock', 0)
         game.game_status = data.get('game_status', 'active')
         game.draw_reason = data.get('draw_reason', None)
         game.threefold_warning = data.get('threefold_warning', False)
-        repetition_history = data.get('repetition_history')
-        if isinstance(repetition_history, list) and repetition_history:
-            game.repetition_history = repetition_history
-        else:
-            game.repetition_history = [game.generate_position_key()]
-
-        game._rebuild_repetition_counts()
+        game.position_hash = game.zobrist_key()
+        game.repetition_history = (
+            cls._parse_repetition_history(data.get('repetition_history'))
+            or [game.position_hash])
+        # Counted on first use: most requests never check for repetition
+        game._repetition_counts = None
 
         game.valid_moves_cache = {}
+        # Sessions written before the movetext was stored rebuild it
+        # on first use
+        game._movetext = ((len(game.move_history), data['pgn'])
+                          if 'pgn' in data else (0, ''))
+        game._fen_key = None
+        game._saved = data
         return game
 
+    def is_dirty(self):
+        """Return True when the persisted state differs from the state
+        last loaded by ``from_dict`` or passed to ``mark_saved``."""
+        return self._saved is None or self.to_dict() != self._saved
+
+    def mark_saved(self, data):
+        """Record *data* (this game's ``to_dict()``) as persisted."""
+        self._saved = data
+
     @classmethod
     def from_fen(cls, fen: str, time_limit=600, increment=0):
         """Create a new game state from a FEN string (board, side, castling)."""
@@ -231,8 +363,8 @@ DP cache is intentionally excluded to save cookie space."""
         game.move_history = []
         game.captured = {'white': [], 'black': []}
         game.valid_moves_cache = {}
-        game.repetition_history = [game.generate_position_key()]
-        game._rebuild_repetition_counts()
+        game.position_hash = game.zobrist_key()
+        game._reset_repetition()
         game.game_status = 'active'
         game.draw_reason = None
         game.threefold_warning = False
@@ -311,11 +443,38 @@ DP cache is intentionally excluded to save cookie space."""
             return [sys.executable, engine_path]
         return [engine_path]
 
-    def _call_engine(self, command):
-        """Run the C++ engine with *command* on stdin and return stdout."""
+    def _call_engine(self, command, timeout=None, queue_timeout=None,
+                     deadline=None):
+        """Run the C++ engine with *command* on stdin and return stdout.
+
+        *timeout* caps the run (default ``ENGINE_TIMEOUT``) and
+        *queue_timeout* the wait for an engine slot.  A *deadline*
+        (``time.monotonic()``) instead bounds both together: the run gets
+        only the time the queue left, and None is returned when nothing
+        is left.  Raises ``admission.EngineBusy`` when no slot is free
+        in time.
+        """
         engine_path = self._resolve_engine_path()
         if not engine_path:
             return None
+        if deadline is not None:
+            queue_timeout = deadline - time.monotonic()
+        if not self.ENGINE_ADMISSION:
+            return self._run_engine_until(
+                engine_path, command, timeout, deadline)
+        with admission.slot(command, queue_timeout):
+            return self._run_engine_until(
+                engine_path, command, timeout, deadline)
+
+    def _run_engine_until(self, engine_path, command, timeout, deadline):
+        """``_run_engine``, capped at the time left before *deadline*."""
+        if deadline is not None:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                return None
+        return self._run_engine(engine_path, command, timeout)
+
+    def _run_engine(self, engine_path, command, timeout=None):
         try:
             proc = subprocess.Popen(
                 self._build_engine_command(engine_path),
@@ -324,9 +483,14 @@ DP cache is intentionally excluded to save cookie space."""
                 stderr=subprocess.PIPE,
                 text=True,
             )
-            stdout, _ = proc.communicate(input=command, timeout=5)
+            stdout, _ = proc.communicate(
+                input=command, timeout=timeout or self.ENGINE_TIMEOUT)
             return stdout.strip()
-        except (subprocess.TimeoutExpired, OSError):
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.communicate()
+            return None
+        except OSError:
             return None
 
     def _count_active_pieces(self):
@@ -345,6 +509,10 @@ DP cache is intentionally excluded to save cookie space."""
         if engine_path.endswith('.py'):
             return self.AI_SEARCH_DEPTH_PYTHON
 
+        # Bitbase endings are probed exactly inside the search
+        if self.probe_endgame() is not None:
+            return self.AI_SEARCH_DEPTH_CPP
+
         piece_count = self._count_active_pieces()
 
         # Adaptive Search Depth for C++ engine in endgame
@@ -355,6 +523,16 @@ DP cache is intentionally excluded to save cookie space."""
 
         return self.AI_SEARCH_DEPTH_CPP
 
+    def probe_endgame(self):
+        """Look the position up in the KQK/KRK/KPK bitbases.
+
+        Returns ``'white'`` or ``'black'`` for a forced win, ``'draw'``,
+        or None when the position is not covered.
+        """
+        return bitbase.probe(
+            self.serialize_board(), self.current_turn,
+            self.serialize_castling_rights())
+
     def serialize_castling_rights(self):
         """Serialize castling rights to a string for the C++ engine."""
         rights = ''
@@ -380,16 +558,17 @@ DP cache is intentionally excluded to save cookie space."""
             return '-'
         return f"{self.en_passant_target[0]},{self.en_passant_target[1]}"
 
-    def _has_legal_en_passant_capture(self):
-        """Return True when the side to move can
+    def _has_legal_en_passant_capture(self, side=None):
+        """Return True when *side* (default: the side to move) can
         legally capture en passant."""
         if not self.en_passant_target:
             return False
 
+        side = side or self.current_turn
         target_row, target_col = self.en_passant_target
-        is_w = self.current_turn == 'white'
+        is_w = side == 'white'
         pawn_row = target_row + 1 if is_w else target_row - 1
-        pawn_piece = 'P' if self.current_turn == 'white' else 'p'
+        pawn_piece = 'P' if is_w else 'p'
 
         if not (0 <= pawn_row < 8):
             return False
@@ -402,25 +581,89 @@ DP cache is intentionally excluded to save cookie space."""
 
         return False
 
+    def zobrist_key(self):
+        """Return the 64-bit Zobrist hash of the current position,
+        computed from scratch (``position_hash`` is kept incrementally)."""
+        ep_file = (self.en_passant_target[1]
+                   if self._has_legal_en_passant_capture() else None)
+        return zobrist.hash_position(
+            self.serialize_board(), self.serialize_castling_rights(),
+            self.current_turn, ep_file)
+
+    def _castling_hash(self):
+        """XOR of the Zobrist keys of the castling rights still held."""
+        h = 0
+        for right, key in self.CASTLING_HASH_KEYS:
+            if self.castling_rights[key]:
+                h ^= zobrist.CASTLING_KEYS[right]
+        return h
+
+    def _en_passant_hash(self, side):
+        """Zobrist key of the en-passant file if *side* can capture there."""
+        if not self._has_legal_en_passant_capture(side):
+            return 0
+        return zobrist.EP_FILE_KEYS[self.en_passant_target[1]]
+
     def generate_position_key(self):
         """Build the full repetition key for the current board state."""
         return f"{self.generate_fen_key()} {self._en_passant_key()}"
 
+    @staticmethod
+    def _position_key_hash(key):
+        """Return the Zobrist hash of a ``generate_position_key`` string
+        (the repetition key stored by older sessions)."""
+        placement, side, castling, ep = key.split()
+        board64 = ''.join('.' * int(ch) if ch.isdigit() else ch
+                          for ch in placement.replace('/', ''))
+        ep_file = None if ep == '-' else int(ep.split(',')[1])
+        return zobrist.hash_position(
+            board64, castling, 'white' if side == 'w' else 'black', ep_file)
+
+    @classmethod
+    def _parse_repetition_history(cls, entries):
+        """Decode the hex hashes stored in the session; FEN repetition
+        keys from older sessions are hashed, malformed entries dropped."""
+        if isinstance(entries, str):
+            entries = [entries[i:i + 16] for i in range(0, len(entries), 16)]
+        history = []
+        for entry in entries if isinstance(entries, list) else []:
+            try:
+                history.append(cls._position_key_hash(entry) if ' ' in entry
+                               else int(entry, 16))
+            except (TypeError, ValueError, KeyError):
+                continue
+        return history
+
+    def _serialize_history(self):
+        """Serialize the halfmove clock and repetition history for the
+        engine: ``<halfmove> <n> <hash> ...``, oldest position first."""
+        hashes = [zobrist.format_hash(key) for key in self.repetition_history]
+        return ' '.join([str(self.halfmove_clock), str(len(hashes))] + hashes)
+
+    @property
+    def repetition_counts(self):
+        """Occurrences of each position hash since the last irreversible
+        move."""
+        if self._repetition_counts is None:
+            counts = {}
+            for key in self.repetition_history:
+                counts[key] = counts.get(key, 0) + 1
+            self._repetition_counts = counts
+        return self._repetition_counts
+
+    def _reset_repetition(self):
+        """Start a new repetition history at the current position."""
+        self.repetition_history = [self.position_hash]
+        self._repetition_counts = {self.position_hash: 1}
+
     def _update_repetition(self):
         """Increment and return the repetition count
         for the current position."""
-        key = self.generate_position_key()
+        key = self.position_hash
         self.repetition_history.append(key)
-        self._rebuild_repetition_counts()
-        return self.repetition_counts[key]
-
-    def _rebuild_repetition_counts(self):
-        """Rebuild the repetition counter
-          from the stored history list."""
-        counts = {}
-        for key in self.repetition_history:
-            counts[key] = counts.get(key, 0) + 1
-        self.repetition_counts = counts
+        counts = self.repetition_counts
+        counts[key] = counts.get(key, 0) + 1
+        return counts[key]
 
     # ------------------------------------------------------------------
     #  Public API
@@ -455,80 +698,13 @@ DP cache is intentionally excluded to save cookie space."""
         if self.black_time == 0:
             return False, "Black ran out of time", None, 'timeout'
 
-        captured = self.board[tr][tc]
         is_pawn_move = piece.lower() == 'p'
         board_before = self.serialize_board()
         rights_before = self.serialize_castling_rights()
         ep_before = self._serialize_ep()
 
-        # Detect En Passant capture before moving piece
-        if piece.lower() == 'p' and fc != tc and not captured:
-            if (self.en_passant_target
-                    and tr == self.en_passant_target[0]
-                    and tc == self.en_passant_target[1]):
-                # The captured piece is of opposite color
-                captured = 'p' if piece.isupper() else 'P'
-                # In EP, the captured pawn is at (fr, tc)
-                self.board[fr][tc] = None
-
-        if piece == 'K':
-            self.castling_rights['w_k'] = False
-            self.castling_rights['w_q'] = False
-        elif piece == 'k':
-            self.castling_rights['b_k'] = False
-            self.castling_rights['b_q'] = False
-        elif piece == 'R':
-            if fr == 7 and fc == 0:
-                self.castling_rights['w_q'] = False
-            elif fr == 7 and fc == 7:
-                self.castling_rights['w_k'] = False
-        elif piece == 'r':
-            if fr == 0 and fc == 0:
-                self.castling_rights['b_q'] = False
-            elif fr == 0 and fc == 7:
-                self.castling_rights['b_k'] = False
-
-        if captured == 'R':
-            if tr == 7 and tc == 0:
-                self.castling_rights['w_q'] = False
-            elif tr == 7 and tc == 7:
-                self.castling_rights['w_k'] = False
-        elif captured == 'r':
-            if tr == 0 and tc == 0:
-                self.castling_rights['b_q'] = False
-            elif tr == 0 and tc == 7:
-                self.castling_rights['b_k'] = False
-
-        # Pawn promotion: delegate to C++ engine for validation + board update
-        promoted = False
-        if self._is_promotion(piece, tr):
-            choice = (promotion_piece or 'q').lower()
-            new_board = self._call_engine_promote(fr, fc, tr, tc, choice)
-            if new_board:
-                # C++ returned the updated board - apply it directly
-                self.board = self._parse_board64(new_board)
-                promoted = True
-            else:
-                # Fallback: apply promotion in Python
-                self.board[tr][tc] = self._promote(piece, promotion_piece)
-                self.board[fr][fc] = None
-                promoted = True
-        else:
-            self.board[tr][tc] = piece
-            self.board[fr][fc] = None
-            if piece.lower() == 'k' and abs(tc - fc) == 2:
-                if tc == 6:
-                    self.board[tr][5] = self.board[tr][7]
-                    self.board[tr][7] = None
-                elif tc == 2:
-                    self.board[tr][3] = self.board[tr][0]
-                    self.board[tr][0] = None
-
-        # Update En Passant target for the NEXT turn
-        if piece.lower() == 'p' and abs(tr - fr) == 2:
-            self.en_passant_target = ((fr + tr) // 2, fc)
-        else:
-            self.en_passant_target = None
+        captured, promoted = self._apply_move(
+            fr, fc, tr, tc, promotion_piece)
 
         if captured:
             self.captured[self.current_turn].append(captured)
@@ -566,8 +742,8 @@ DP cache is intentionally excluded to save cookie space."""
         is_irreversible = is_pawn_move or bool(
             captured) or current_rights != rights_before
         if is_irreversible:
-            self.repetition_history = [self.generate_position_key()]
-            self._rebuild_repetition_counts()
+            self._reset_repetition()
+            repetition_count = 1
         else:
             repetition_count = self._update_repetition()
 
@@ -602,9 +778,6 @@ DP cache is intentionally excluded to save cookie space."""
             self.draw_reason = 'insufficient_material'
             return True, notation, captured, game_status
 
-        repetition_count = self.repetition_counts.get(
-            self.generate_position_key(), 1)
-        
         # Warning on second occurrence
         self.threefold_warning = (repetition_count == 2)
 
@@ -626,6 +799,137 @@ DP cache is intentionally excluded to save cookie space."""
     
         return True, notation, captured, game_status
 
+    def _apply_move(self, fr, fc, tr, tc, promotion_piece=None,
+                    use_engine=True):
+        """Move the piece on the board and update castling / en-passant state.
+
+        ``position_hash`` is updated for the new position with the
+        opponent to move; turn, clocks and history are left to the caller.
+        Returns a ``(captured, promoted)`` tuple.
+        """
+        piece = self.board[fr][fc]
+        captured = self.board[tr][tc]
+        mover = self._color(piece)
+        keys = zobrist.PIECE_KEYS
+        h = (self.position_hash ^ self._en_passant_hash(mover)
+             ^ self._castling_hash() ^ keys[piece][fr * 8 + fc])
+        captured_square = tr * 8 + tc
+
+        # Detect En Passant capture before moving piece
+        if piece.lower() == 'p' and fc != tc and not captured:
+            if (self.en_passant_target
+                    and tr == self.en_passant_target[0]
+                    and tc == self.en_passant_target[1]):
+                # The captured piece is of opposite color
+                captured = 'p' if piece.isupper() else 'P'
+                # In EP, the captured pawn is at (fr, tc)
+                self.board[fr][tc] = None
+                captured_square = fr * 8 + tc
+
+        if captured:
+            h ^= keys[captured][captured_square]
+
+        if piece == 'K':
+            self.castling_rights['w_k'] = False
+            self.castling_rights['w_q'] = False
+        elif piece == 'k':
+            self.castling_rights['b_k'] = False
+            self.castling_rights['b_q'] = False
+        elif piece == 'R':
+            if fr == 7 and fc == 0:
+                self.castling_rights['w_q'] = False
+            elif fr == 7 and fc == 7:
+                self.castling_rights['w_k'] = False
+        elif piece == 'r':
+            if fr == 0 and fc == 0:
+                self.castling_rights['b_q'] = False
+            elif fr == 0 and fc == 7:
+                self.castling_rights['b_k'] = False
+
+        if captured == 'R':
+            if tr == 7 and tc == 0:
+                self.castling_rights['w_q'] = False
+            elif tr == 7 and tc == 7:
+                self.castling_rights['w_k'] = False
+        elif captured == 'r':
+            if tr == 0 and tc == 0:
+                self.castling_rights['b_q'] = False
+            elif tr == 0 and tc == 7:
+                self.castling_rights['b_k'] = False
+
+        # Pawn promotion: delegate to C++ engine for validation + board update
+        promoted = False
+        if self._is_promotion(piece, tr):
+            choice = (promotion_piece or 'q').lower()
+            new_board = None
+            if use_engine:
+                new_board = self._call_engine_promote(
+                    fr, fc, tr, tc, choice)
+            if new_board:
+                # C++ returned the updated board - apply it directly
+                self.board = self._parse_board64(new_board)
+                promoted = True
+            else:
+                # Fallback: apply promotion in Python
+                self.board[tr][tc] = self._promote(piece, promotion_piece)
+                self.board[fr][fc] = None
+                promoted = True
+        else:
+            self.board[tr][tc] = piece
+            self.board[fr][fc] = None
+            if piece.lower() == 'k' and abs(tc - fc) == 2:
+                if tc == 6:
+                    self.board[tr][5] = self.board[tr][7]
+                    self.board[tr][7] = None
+                    rook_from, rook_to = 7, 5
+                elif tc == 2:
+                    self.board[tr][3] = self.board[tr][0]
+                    self.board[tr][0] = None
+                    rook_from, rook_to = 0, 3
+                rook = self.board[tr][rook_to]
+                h ^= (keys[rook][tr * 8 + rook_from]
+                      ^ keys[rook][tr * 8 + rook_to])
+        h ^= keys[self.board[tr][tc]][tr * 8 + tc]
+
+        # Update En Passant target for the NEXT turn
+        if piece.lower() == 'p' and abs(tr - fr) == 2:
+            self.en_passant_target = ((fr + tr) // 2, fc)
+        else:
+            self.en_passant_target = None
+
+        opponent = 'black' if mover == 'white' else 'white'
+        self.position_hash = (h ^ self._castling_hash() ^ zobrist.SIDE_KEY
+                              ^ self._en_passant_hash(opponent))
+
+        return captured, promoted
+
+    def apply_recorded_move(self, move):
+        """Replay a ``move_history`` entry without consulting the engine.
+
+        Used by offline tooling that walks stored games; the move is
+        trusted to be legal, so no validation, notation or status checks
+        are performed.
+        """
+        fr, fc = move['from']
+        tr, tc = move['to']
+        piece = self.board[fr][fc]
+        if not piece or self._color(piece) != self.current_turn:
+            raise ValueError(f"No {self.current_turn} piece on {fr},{fc}.")
+
+        promoted_to = move.get('promoted_to')
+        captured, _ = self._apply_move(
+            fr, fc, tr, tc,
+            promoted_to.lower() if promoted_to else None,
+            use_engine=False)
+
+        if piece.lower() == 'p' or captured:
+            self.halfmove_clock = 0
+        else:
+            self.halfmove_clock += 1
+        self.current_turn = (
+            'black' if self.current_turn == 'white' else 'white')
+        self.valid_moves_cache = {}
+
     def get_valid_moves(self, row, col):
         """Return legal moves from DP cache."""
         piece = self.board[row][col]
@@ -664,6 +968,45 @@ DP cache is intentionally excluded to save cookie space."""
                 })
         return moves
 
+    def get_all_valid_moves(self):
+        """Return the legal moves of every piece of the side to move,
+        keyed ``"row,col"``, from a single ``LEGAL`` engine call.
+
+        The DP cache is filled on the way, so later ``get_valid_moves``
+        calls for this position do not reach the engine.
+        """
+        return self._legal_moves() or {}
+
+    def _legal_moves(self):
+        """``get_all_valid_moves``, but None when the engine gave no
+        answer (timeout, crash) rather than an empty move list."""
+        board_str = self.serialize_board()
+        rights_str = self.serialize_castling_rights()
+        ep_str = self._serialize_ep()
+        resp = self._call_engine(
+            f"LEGAL {board_str} {rights_str} {self.current_turn} {ep_str}")
+        if not resp or not resp.startswith("LEGAL"):
+            return None
+
+        by_square = {
+            (r, c): []
+            for r, row in enumerate(self.board)
+            for c, piece in enumerate(row)
+            if piece and self._color(piece) == self.current_turn
+        }
+        parts = resp.split()[1:]
+        # 6 fields per move: fr fc tr tc is_capture is_promotion
+        for i in range(0, len(parts), 6):
+            by_square.setdefault((int(parts[i]), int(parts[i+1])), []).append({
+                'row': int(parts[i+2]),
+                'col': int(parts[i+3]),
+                'is_capture': bool(int(parts[i+4])),
+                'is_promotion': bool(int(parts[i+5])),
+            })
+        self.valid_moves_cache.update(by_square)
+        return {f"{r},{c}": moves
+                for (r, c), moves in by_square.items() if moves}
+
     # ------------------------------------------------------------------
     #  C++ engine promotion
     # ------------------------------------------------------------------
@@ -800,20 +1143,21 @@ DP cache is intentionally excluded to save cookie space."""
         return 'white' if piece.isupper() else 'black'
 
     def update_clock(self):
-        if self.paused:
-            self.last_ts = time.time()
-            return
-
         now = time.time()
-        elapsed = int(now - self.last_ts)
+        self.white_time, self.black_time = self.clock_at(now)
+        self.last_ts = now
 
-        if elapsed > 0:
+    def clock_at(self, now):
+        """Return ``(white_time, black_time)`` as ``update_clock`` would
+        leave them at time *now*, without changing the game."""
+        white_time, black_time = self.white_time, self.black_time
+        elapsed = int(now - self.last_ts)
+        if not self.paused and elapsed > 0:
             if self.current_turn == 'white':
-                self.white_time = max(0, self.white_time - elapsed)
+                white_time = max(0, white_time - elapsed)
             else:
-                self.black_time = max(0, self.black_time - elapsed)
-
-        self.last_ts = now
+                black_time = max(0, black_time - elapsed)
+        return white_time, black_time
 
     # ------------------------------------------------------------------
     #  Game status detection (check / checkmate / stalemate)
@@ -824,6 +1168,10 @@ DP cache is intentionally excluded to save cookie space."""
 
         Returns one of: 'checkmate', 'stalemate', 'check', 'ok'.
         """
+        cached = self.get_cached_position()
+        if cached and cached.get('status'):
+            return cached['status']
+
         board_str = self.serialize_board()
         rights_str = self.serialize_castling_rights()
         ep_str = self._serialize_ep()
@@ -841,20 +1189,65 @@ DP cache is intentionally excluded to save cookie space."""
 
     @classmethod
     def _load_opening_book(cls) -> dict:
-        """Load the opening book JSON from disk (cached after first load)."""
+        """Load the opening book JSON from disk (cached after first load).
+
+        Comments and malformed moves are dropped here, once, so lookups
+        can use the remaining entries as they are.
+        """
         if cls._opening_book is None:
             try:
                 with open(cls.OPENING_BOOK_PATH, encoding='utf-8') as fh:
-                    cls._opening_book = json.load(fh)
+                    raw = json.load(fh)
             except (OSError, json.JSONDecodeError):
-                cls._opening_book = {}  # Graceful fallback: no book
+                raw = {}  # Graceful fallback: no book
+            cls._opening_book = {
+                key: [tuple(m) for m in moves if cls._is_board_move(m)]
+                for key, moves in (
+                    raw.items() if isinstance(raw, dict) else ())
+                if not key.startswith('_') and isinstance(moves, list)
+            }
         return cls._opening_book
 
+    @staticmethod
+    def _is_board_move(move):
+        """Return True for a ``[fr, fc, tr, tc]`` sequence of ints in 0..7."""
+        return (
+            isinstance(move, (list, tuple))
+            and len(move) == 4
+            and all(isinstance(c, int) and 0 <= c <= 7 for c in move)
+        )
+
+    @classmethod
+    def _load_binary_book(cls) -> OpeningBook | None:
+        """Map the binary opening book, or return None when there is none."""
+        if cls._binary_book is None:
+            try:
+                cls._binary_book = OpeningBook(cls.OPENING_BOOK_BIN_PATH)
+            except (OSError, ValueError):
+                cls._binary_book = False  # Remember the miss
+        return cls._binary_book or None
+
+    @classmethod
+    def _load_learned_book(cls) -> OpeningBook | None:
+        """Map the learned opening book, or return None when there is none."""
+        if cls._learned_book is None:
+            try:
+                cls._learned_book = OpeningBook(cls.LEARNED_BOOK_BIN_PATH)
+            except (OSError, ValueError):
+                cls._learned_book = False  # Remember the miss
+        return cls._learned_book or None
+
     def generate_fen_key(self) -> str:
         """Build a minimal FEN key (board + side + castling, no counters).
 
-        This matches the key format used in ``opening_book.json``.
+        This matches the key format used in ``opening_book.json``.  The
+        key is cached against the Zobrist hash and side to move, which
+        every move updates.
         """
+        cache_key = (self.position_hash, self.current_turn)
+        if self._fen_key and self._fen_key[0] == cache_key:
+            return self._fen_key[1]
+
         # Piece-placement section
         fen_rows = []
         for row in self.board:
@@ -880,69 +1273,263 @@ DP cache is intentionally excluded to save cookie space."""
         # Already returns '-' if none
         castling = self.serialize_castling_rights()
 
-        return f"{placement} {side} {castling}"
+        fen_key = f"{placement} {side} {castling}"
+        self._fen_key = (cache_key, fen_key)
+        return fen_key
 
     def get_opening_book_move(self) -> dict | None:
         """Return a random book move for the current position, or ``None``.
 
-        The move is validated against the engine before being returned so
-        the AI never plays an illegal book move.
+        Books are validated against the engine when they are built, so this
+        is a pure lookup: no engine call is made.  Binary book moves are
+        picked in proportion to their weight, from the learned book when
+        the compiled one has none for the position, and from the JSON
+        book when neither has.
         """
+        for binary_book in (self._load_binary_book(),
+                            self._load_learned_book()):
+            entries = binary_book and binary_book.probe(self.position_hash)
+            if not entries:
+                continue
+            (fr, fc, tr, tc, promotion), = random.choices(
+                [move for move, _ in entries],
+                weights=[weight for _, weight in entries])
+            move = {
+                'from_row': fr,
+                'from_col': fc,
+                'to_row': tr,
+                'to_col': tc,
+            }
+            if promotion:
+                move['promotion'] = promotion
+            return move
+
         book = self._load_opening_book()
-        fen_key = self.generate_fen_key()
-        candidates = book.get(fen_key)
+        # Sanity-check: must be a 4-item sequence of ints, all in 0..7.
+        # The loader already filters the JSON file; this also covers
+        # books injected directly into the class cache.
+        candidates = [
+            move for move in book.get(self.generate_fen_key()) or ()
+            if self._is_board_move(move)
+        ]
         if not candidates:
             return None
 
-        # Shuffle so variety is uniform across the candidate list
-        candidates = list(candidates)  # copy – do not mutate the book
-        random.shuffle(candidates)
-
-        for move in candidates:
-            # Sanity-check: must be a 4-item sequence of ints, all in 0..7.
-            # This prevents IndexError inside validate_move if the JSON ever
-            # contains malformed entries like [9, 9, 9, 9].
-            if (
-                not isinstance(move, (list, tuple))
-                or len(move) != 4
-                or not all(isinstance(c, int) and 0 <= c <= 7 for c in move)
-            ):
-                continue
-            fr, fc, tr, tc = move
-            is_valid, _ = self.validate_move(fr, fc, tr, tc)
-            if is_valid:
-                return {
-                    'from_row': fr,
-                    'from_col': fc,
-                    'to_row': tr,
-                    'to_col': tc,
-                }
-
-        return None  # No valid book move found
+        fr, fc, tr, tc = random.choice(candidates)
+        return {
+            'from_row': fr,
+            'from_col': fc,
+            'to_row': tr,
+            'to_col': tc,
+        }
 
     # ------------------------------------------------------------------
-    #  AI -- Minimax via C++ engine
+    #  AI -- Precomputed position cache
     # ------------------------------------------------------------------
 
-    AI_SEARCH_DEPTH_CPP = 4  # C++ is much faster, can search deeper
-    AI_SEARCH_DEPTH_PYTHON = 3  # Python engine needs conservative depth
+    @classmethod
+    def _load_position_cache(cls) -> dict:
+        """Load the warmed position cache from disk (cached until the
+        file's modification time changes, so every process picks up a
+        new ``warm_positions`` run).
+
+        Returns the ``positions`` mapping of position key to
+        ``{'move': [fr, fc, tr, tc], 'status': ..., 'depth': ...}``.
+        """
+        try:
+            mtime = os.stat(cls.POSITION_CACHE_PATH).st_mtime_ns
+        except OSError:
+            mtime = None
+        if cls._position_cache is None or mtime != cls._position_cache_mtime:
+            try:
+                with open(cls.POSITION_CACHE_PATH, encoding='utf-8') as fh:
+                    cls._position_cache = json.load(fh).get('positions', {})
+            except (OSError, json.JSONDecodeError, AttributeError):
+                cls._position_cache = {}  # Nothing warmed yet
+            cls._position_cache_mtime = mtime
+        return cls._position_cache
+
+    def get_cached_position(self) -> dict | None:
+        """Return the precomputed entry for the current position, if any."""
+        return self._load_position_cache().get(self.generate_position_key())
+
+    def get_cached_move(self, depth=None) -> dict | None:
+        """Return the precomputed best move for the current position.
+
+        Entries are produced offline by deep searches, so no validation
+        round-trip to the engine is needed here.  With *depth*, entries
+        searched shallower than *depth* plies are ignored.
+        """
+        entry = self.get_cached_position()
+        if entry and depth is not None and entry.get('depth', 0) < depth:
+            entry = None
+        move = entry.get('move') if entry else None
+        if not self._is_board_move(move):
+            return None
+        fr, fc, tr, tc = move
+        return {
+            'from_row': fr,
+            'from_col': fc,
+            'to_row': tr,
+            'to_col': tc,
+        }
 
-    def get_ai_move(self, depth=None):
-        """Return the best move for the current position.
+    # ------------------------------------------------------------------
+    #  AI -- Minimax via C++ engine
+    # ------------------------------------------------------------------
 
-        Checks the opening book first for an instant theory response.
-        Falls back to the C++ minimax engine when the position is not
-        in the book or the book move fails validation.
+    AI_SEARCH_DEPTH_CPP = 4  # C++ also searches deeper in endgames
+    # The table-driven main.py searches 4 plies in about 0.2-3 s, inside
+    # ENGINE_TIMEOUT; it gets no endgame deepening
+    AI_SEARCH_DEPTH_PYTHON = 4
+
+    # Degradation ladder of ``get_ai_move``: seconds a move may take,
+    # plies dropped by the shallow search, and the share of the full
+    # search's average time it is expected to need
+    AI_LATENCY_BUDGET = 4
+    AI_SHALLOW_DEPTH_DROP = 2
+    AI_SHALLOW_COST = 0.25
+
+    # Rung of the ladder that produced the last ``get_ai_move`` answer:
+    # 'book', 'cache', 'search', 'shallow' or 'heuristic'
+    ai_rung = None
+
+    # Piece values for the one-ply heuristic move
+    HEURISTIC_VALUES = {'p': 1, 'n': 3, 'b': 3, 'r': 5, 'q': 9, 'k': 0}
+
+    def get_ai_move(self, depth=None, budget=None):
+        """Return the best move the engine can give within *budget*
+        seconds (default ``AI_LATENCY_BUDGET``).
+
+        Checks the opening book first for an instant theory response,
+        then the offline position cache.  Otherwise it walks down a
+        ladder picked from the engine queue: the full minimax search when
+        the engine is idle or it should finish within the budget, a
+        shallower time-capped search when only that fits or the full one
+        fails, and a one-ply heuristic move as the last resort.  The
+        budget only binds while searches queue.  ``ai_rung`` records which
+        rung answered.
 
         Returns a dict with from/to coordinates, or None when no
-        legal move exists (checkmate / stalemate).
+        legal move exists (checkmate / stalemate).  Raises
+        ``admission.EngineBusy`` when even the heuristic rung cannot
+        reach the engine.
         """
         # 1. Opening-book lookup (fast path)
+        self.ai_rung = 'book'
         book_move = self.get_opening_book_move()
         if book_move:
             return book_move
 
-        # 2. Minimax search (slow path)
+        # 2. Precomputed deep search result.  It stands in for a search
+        # at full strength only: a lower difficulty searches at its own
+        # depth instead of playing the deep move
+        full_depth = self._get_ai_search_depth()
+        if depth is None:
+            depth = full_depth
+        if depth >= full_depth:
+            self.ai_rung = 'cache'
+            cached_move = self.get_cached_move(depth)
+            if cached_move:
+                return cached_move
+
+        if budget is None:
+            budget = self.AI_LATENCY_BUDGET
+        deadline = time.monotonic() + budget
+        # The full search leaves the shallow one its share of the budget
+        reserve = budget * self.AI_SHALLOW_COST
+        wait, search_seconds = 0.0, 0.0
+        if self.ENGINE_ADMISSION:
+            limiter = admission.get_limiter()
+            wait = limiter.expected_wait(admission.SEARCH)
+            search_seconds = limiter.load()['seconds'][admission.SEARCH]
+        # Only a queue makes the budget bind: an idle engine gets the
+        # full ENGINE_TIMEOUT
+        loaded = wait > 0
+
+        # 3. Minimax search (slow path), when the queue leaves time for it.
+        # An answer, even "no legal move", ends the ladder
+        if not loaded or wait + search_seconds <= budget - reserve:
+            self.ai_rung = 'search'
+            answered, best = self._search_within(
+                depth, deadline - reserve if loaded else None)
+            if answered:
+                return best
+
+        # 4. Shallower search capped at the time left
+        shallow = max(1, depth - self.AI_SHALLOW_DEPTH_DROP)
+        remaining = deadline - time.monotonic()
+        if (shallow < depth
+                and wait + search_seconds * self.AI_SHALLOW_COST
+                <= remaining):
+            self.ai_rung = 'shallow'
+            answered, best = self._search_within(shallow, deadline)
+            if answered:
+                return best
+
+        # 5. One-ply heuristic over the legal moves
+        self.ai_rung = 'heuristic'
+        return self.heuristic_move()
+
+    def _search_within(self, depth, deadline=None):
+        """Search at *depth*, queueing and running only until *deadline*
+        (``time.monotonic()``; None for the usual engine limits).
+
+        Returns ``(answered, move)`` as ``_bestmove`` does; *answered* is
+        also False when no engine slot came in time.
+        """
+        if deadline is not None and deadline <= time.monotonic():
+            return False, None
+        try:
+            return self._bestmove(depth, deadline=deadline)
+        except admission.EngineBusy:
+            return False, None
+
+    def heuristic_move(self):
+        """Pick a move one ply deep without searching: the most valuable
+        capture by the cheapest piece, then promotions, then the most
+        central square.  None when there is no legal move.
+
+        Raises ``admission.EngineBusy`` (503) when the engine did not
+        list the moves, so a failure is never taken for a stalemate.
+        """
+        legal = self._legal_moves()
+        if legal is None:
+            raise admission.EngineBusy(
+                'The engine did not answer. Please retry.',
+                503, admission.RETRY_AFTER[admission.SEARCH])
+        best, best_score = None, None
+        for square, moves in legal.items():
+            fr, fc = (int(value) for value in square.split(','))
+            attacker = self.HEURISTIC_VALUES[self.board[fr][fc].lower()]
+            for move in moves:
+                tr, tc = move['row'], move['col']
+                score = -(abs(3.5 - tr) + abs(3.5 - tc)) / 10
+                if move['is_capture']:
+                    victim = self.board[tr][tc]
+                    value = self.HEURISTIC_VALUES[victim.lower()] if victim else 1
+                    score += 10 * value - attacker
+                if move['is_promotion']:
+                    score += 8 * 10
+                if best_score is None or score > best_score:
+                    best_score = score
+                    best = {'from_row': fr, 'from_col': fc,
+                            'to_row': tr, 'to_col': tc}
+        return best
+
+    def search_best_move(self, depth=None, timeout=None, queue_timeout=None):
+        """Run the engine's minimax search, bypassing book and caches.
+
+        *timeout* and *queue_timeout* are passed to ``_call_engine``.
+        """
+        return self._bestmove(depth, timeout, queue_timeout)[1]
+
+    def _bestmove(self, depth=None, timeout=None, queue_timeout=None,
+                  deadline=None):
+        """Run ``BESTMOVE`` and return ``(answered, move)``: *answered*
+        is False when the engine gave no answer, *move* None when it
+        answered that there is no legal move.  The limits are passed to
+        ``_call_engine``."""
         board_str = self.serialize_board()
         rights_str = self.serialize_castling_rights()
         if depth is None:
@@ -951,19 +1538,91 @@ DP cache is intentionally excluded to save cookie space."""
         cmd = (
             f"BESTMOVE {board_str} {rights_str}"
             f" {self.current_turn} {ep_str} {depth}"
+            f" {self._serialize_history()}"
         )
-        resp = self._call_engine(cmd)
+        resp = self._call_engine(
+            cmd, timeout=timeout, queue_timeout=queue_timeout,
+            deadline=deadline)
 
         if not resp or not resp.startswith("BESTMOVE"):
-            return None
+            return False, None
 
         parts = resp.split()
-        if len(parts) < 5 or parts[1] == "NONE":
-            return None
+        if parts[1:2] == ["NONE"]:
+            return True, None
+        if len(parts) < 5:
+            return False, None
 
-        return {
+        return True, {
             'from_row': int(parts[1]),
             'from_col': int(parts[2]),
             'to_row':   int(parts[3]),
             'to_col':   int(parts[4]),
         }
+
+    def analyze_moves(self, depth=None):
+        """Score every legal move, best first.
+
+        Scores are centipawns from the point of view of the side to move
+        (mates are worth about +-99999).  Returns a list of dicts with
+        from/to coordinates and ``score``; empty when the engine fails or
+        there is no legal move.
+        """
+        if depth is None:
+            depth = self._get_ai_search_depth()
+        cmd = (
+            f"ANALYZE {self.serialize_board()}"
+            f" {self.serialize_castling_rights()}"
+            f" {self.current_turn} {self._serialize_ep()} {depth}"
+        )
+        resp = self._call_engine(cmd)
+        if not resp or not resp.startswith("ANALYZE"):
+            return []
+
+        values = [int(value) for value in resp.split()[1:]]
+        return [
+            {
+                'from_row': values[i],
+                'from_col': values[i + 1],
+                'to_row':   values[i + 2],
+                'to_col':   values[i + 3],
+                'score':    values[i + 4],
+            }
+            for i in range(0, len(values) - 4, 5)
+        ]
+
+    MATE_SEARCH_MOVES = 3
+
+    def find_mate(self, max_moves=None):
+        """Look for a forced mate by the side to move, checks only.
+
+        Returns ``{'mate_in': n, 'moves': [...]}`` with the full mating
+        line (defender's longest resistance) as from/to dicts, or None
+        when there is no such mate within *max_moves* moves.
+        """
+        if max_moves is None:
+            max_moves = self.MATE_SEARCH_MOVES
+        cmd = (
+            f"MATE {self.serialize_board()} {self.serialize_castling_rights()}"
+            f" {self.current_turn} {self._serialize_ep()} {max_moves}"
+        )
+        resp = self._call_engine(cmd)
+        if not resp or not resp.startswith("MATE"):
+            return None
+
+        parts = resp.split()
+        if len(parts) < 6 or parts[1] == "NONE":
+            return None
+        coords = [int(value) for value in parts[2:]]
+        return {
+            'mate_in': int(parts[1]),
+            'moves': [
+                {
+                    'from_row': coords[i],
+                    'from_col': coords[i + 1],
+                    'to_row':   coords[i + 2],
+                    'to_col':   coords[i + 3],
+                }
+                for i in range(0, len(coords) - 3, 4)
+            ],
+        }
@@ -19,6 +19,13 @@
  *    Validates the promotion move, applies it to the board,
  *    and returns the resulting 64-char board string.
  *    Returns INVALID if the move is not a legal promotion.
+ *
+ * MATE <board64> <castling> <turn> <ep_row> <ep_col> <max_moves>
+ * -> MATE <n> <fr> <fc> <tr> <tc> [...]   (shortest mate by checks)
+ * -> MATE NONE
+ *
+ * ANALYZE <board64> <castling> <turn> <ep_row> <ep_col> <depth>
+ * -> ANALYZE [<fr> <fc> <tr> <tc> <score> ...]   (best first, mover's view)
  */
 
 #include <iostream>
@@ -28,6 +35,8 @@
 #include <vector>
 #include <climits>
 #include <algorithm>
+#include <fstream>
+#include <cstdint>
 
 using namespace std;
 
@@ -300,13 +309,13 @@ bool leavesKingInCheck(const Move &m, const string &side);
 //  Command Handlers
 // ============================================================
 
-void handleMoves(const string &turn, int row, int col) {
+/**
+ * Appends " tr tc is_capture is_promotion" to *out* for every legal
+ * destination of the piece on (row, col).
+ */
+void appendPieceMoves(const string &turn, int row, int col, bool withFrom,
+                      string &out) {
     char piece = board[row][col];
-    if (isEmpty(piece) || colorOf(piece) != turn) {
-        cout << "MOVES" << endl;
-        return;
-    }
-    cout << "MOVES";
     for (int tr = 0; tr < 8; tr++) {
         for (int tc = 0; tc < 8; tc++) {
             if (validateMove(turn, row, col, tr, tc, true)) {
@@ -321,11 +330,42 @@ void handleMoves(const string &turn, int row, int col) {
                 bool isEP = (tolower(piece) == 'p' && col != tc && isEmpty(board[tr][tc]));
                 int cap = (!isEmpty(board[tr][tc]) || isEP) ? 1 : 0;
                 int promo = isPromotionMove(piece, tr) ? 1 : 0;
-                cout << " " << tr << " " << tc << " " << cap << " " << promo;
+                if (withFrom)
+                    out += " " + to_string(row) + " " + to_string(col);
+                out += " " + to_string(tr) + " " + to_string(tc)
+                     + " " + to_string(cap) + " " + to_string(promo);
             }
         }
     }
-    cout << endl;
+}
+
+void handleMoves(const string &turn, int row, int col) {
+    char piece = board[row][col];
+    string out = "MOVES";
+    if (!isEmpty(piece) && colorOf(piece) == turn)
+        appendPieceMoves(turn, row, col, false, out);
+    cout << out << endl;
+}
+
+/**
+ * LEGAL handler.
+ *
+ * Protocol:
+ *   LEGAL <board64> <rights> <turn> <epR> <epC>
+ *   -> LEGAL [<fr> <fc> <tr> <tc> <is_capture> <is_promotion> ...]
+ *
+ * Every legal move of the side to move in one call, so a client can be
+ * sent the whole move map instead of asking piece by piece.
+ */
+void handleLegal(const string &turn) {
+    string out = "LEGAL";
+    for (int r = 0; r < 8; r++) {
+        for (int c = 0; c < 8; c++) {
+            if (!isEmpty(board[r][c]) && colorOf(board[r][c]) == turn)
+                appendPieceMoves(turn, r, c, true, out);
+        }
+    }
+    cout << out << endl;
 }
 
 // ============================================================
@@ -590,23 +630,191 @@ vector<Move> generateMoves(const string &side) {
 }
 
 /**
- * Simple move-ordering heuristic: captures first, then promotions.
- * Helps alpha-beta prune more effectively.
+ * Generate the pseudo-legal captures (en passant excluded) for the given
+ * side by looking outwards from every enemy piece for the side's pawns,
+ * knights, sliders and king that attack it.
  */
-void orderMoves(vector<Move> &moves) {
-    sort(moves.begin(), moves.end(), [](const Move &a, const Move &b) {
-        int sa = 0, sb = 0;
+vector<Move> generateCaptures(const string &side) {
+    bool white = side == "white";
+    char pawn = white ? 'P' : 'p', knight = white ? 'N' : 'n', bishop = white ? 'B' : 'b';
+    char rook = white ? 'R' : 'r', queen = white ? 'Q' : 'q', king = white ? 'K' : 'k';
+    int dir = white ? 1 : -1;
+    int nr[] = {-2, -2, -1, -1, 1, 1, 2, 2}, nc[] = {-1, 1, -2, 2, -2, 2, -1, 1};
+    int dr[] = {0, 0, 1, -1, 1, 1, -1, -1}, dc[] = {1, -1, 0, 0, 1, -1, 1, -1};
+
+    vector<Move> moves;
+    for (int tr = 0; tr < 8; tr++) {
+        for (int tc = 0; tc < 8; tc++) {
+            char target = board[tr][tc];
+            if (isEmpty(target) || isWhite(target) == white) continue;
+            auto add = [&](int fr, int fc) {
+                char p = board[fr][fc];
+                Move m;
+                m.fr = fr; m.fc = fc;
+                m.tr = tr; m.tc = tc;
+                m.promoPiece = isPromotionMove(p, tr) ? (isWhite(p) ? 'Q' : 'q') : '\0';
+                moves.push_back(m);
+            };
+
+            for (int c = tc - 1; c <= tc + 1; c += 2)
+                if (inBounds(tr + dir, c) && board[tr + dir][c] == pawn) add(tr + dir, c);
+            for (int i = 0; i < 8; i++) {
+                int r = tr + nr[i], c = tc + nc[i];
+                if (inBounds(r, c) && board[r][c] == knight) add(r, c);
+            }
+            for (int i = 0; i < 8; i++) {
+                char slider = i < 4 ? rook : bishop;
+                int r = tr + dr[i], c = tc + dc[i];
+                while (inBounds(r, c)) {
+                    char p = board[r][c];
+                    if (p != '.') {
+                        if (p == slider || p == queen) add(r, c);
+                        break;
+                    }
+                    r += dr[i]; c += dc[i];
+                }
+            }
+            for (int r = tr - 1; r <= tr + 1; r++)
+                for (int c = tc - 1; c <= tc + 1; c++)
+                    if (inBounds(r, c) && (r != tr || c != tc) && board[r][c] == king) add(r, c);
+        }
+    }
+    return moves;
+}
 
-        // Captures scored by victim value
-        if (!isEmpty(board[a.tr][a.tc])) sa += pieceValue(board[a.tr][a.tc]) + 1000;
-        if (!isEmpty(board[b.tr][b.tc])) sb += pieceValue(board[b.tr][b.tc]) + 1000;
+/**
+ * Find the cheapest white (`white`) or black piece attacking (tr, tc).
+ * Sets (ar, ac) and returns true if there is one.
+ */
+bool leastValuableAttacker(int tr, int tc, bool white, int &ar, int &ac) {
+    char pawn = white ? 'P' : 'p', knight = white ? 'N' : 'n', bishop = white ? 'B' : 'b';
+    char rook = white ? 'R' : 'r', queen = white ? 'Q' : 'q', king = white ? 'K' : 'k';
+
+    int dir = white ? 1 : -1;
+    for (int dc = -1; dc <= 1; dc += 2) {
+        int r = tr + dir, c = tc + dc;
+        if (inBounds(r, c) && board[r][c] == pawn) { ar = r; ac = c; return true; }
+    }
 
-        // Promotions
-        if (a.promoPiece) sa += 900;
-        if (b.promoPiece) sb += 900;
+    int nr[] = {-2, -2, -1, -1, 1, 1, 2, 2}, nc[] = {-1, 1, -2, 2, -2, 2, -1, 1};
+    for (int i = 0; i < 8; i++) {
+        int r = tr + nr[i], c = tc + nc[i];
+        if (inBounds(r, c) && board[r][c] == knight) { ar = r; ac = c; return true; }
+    }
 
-        return sa > sb;  // higher score first
-    });
+    // Diagonals first so a bishop is preferred to any rook
+    int qr = -1, qc = -1;
+    int dr[] = {1, 1, -1, -1, 0, 0, 1, -1}, dcs[] = {1, -1, 1, -1, 1, -1, 0, 0};
+    for (int i = 0; i < 8; i++) {
+        char slider = i < 4 ? bishop : rook;
+        int r = tr + dr[i], c = tc + dcs[i];
+        while (inBounds(r, c)) {
+            char p = board[r][c];
+            if (p != '.') {
+                if (p == slider) { ar = r; ac = c; return true; }
+                if (p == queen) { qr = r; qc = c; }
+                break;
+            }
+            r += dr[i]; c += dcs[i];
+        }
+    }
+    if (qr >= 0) { ar = qr; ac = qc; return true; }
+
+    for (int r = tr - 1; r <= tr + 1; r++)
+        for (int c = tc - 1; c <= tc + 1; c++)
+            if (inBounds(r, c) && (r != tr || c != tc) && board[r][c] == king) {
+                ar = r; ac = c; return true;
+            }
+    return false;
+}
+
+/**
+ * Static exchange evaluation of the capture `m`.
+ *
+ * Plays out the recaptures on the target square, each side using its
+ * least valuable attacker and stopping as soon as recapturing no longer
+ * pays, and returns the material won from the mover's point of view.
+ * Pieces are lifted off the board as they capture so x-ray attackers
+ * join in; pins are ignored.
+ */
+int see(const Move &m) {
+    struct Lifted { int r, c; char piece; };
+    Lifted lifted[32];
+    int gains[32];
+    int n = 0;
+
+    char attacker = board[m.fr][m.fc];
+    gains[n] = pieceValue(board[m.tr][m.tc]);
+    lifted[n++] = {m.fr, m.fc, attacker};
+    board[m.fr][m.fc] = '.';
+    int occupant = pieceValue(m.promoPiece ? m.promoPiece : attacker);
+
+    bool white = !isWhite(attacker);
+    int ar, ac;
+    while (n < 32 && leastValuableAttacker(m.tr, m.tc, white, ar, ac)) {
+        gains[n] = occupant - gains[n - 1];
+        occupant = pieceValue(board[ar][ac]);
+        lifted[n++] = {ar, ac, board[ar][ac]};
+        board[ar][ac] = '.';
+        white = !white;
+    }
+    for (int i = 0; i < n; i++) board[lifted[i].r][lifted[i].c] = lifted[i].piece;
+
+    for (int i = n - 1; i > 0; i--) gains[i - 1] = -max(-gains[i - 1], gains[i]);
+    return gains[0];
+}
+
+/**
+ * Exchange value of a capture.  SEE is only run when the capturing
+ * piece is worth more than its victim, as otherwise it cannot lose.
+ */
+int captureScore(const Move &m) {
+    int victim = pieceValue(board[m.tr][m.tc]);
+    if (pieceValue(board[m.fr][m.fc]) <= victim) return victim;
+    return see(m);
+}
+
+/**
+ * Sort `moves` in place by `scores` (kept alongside), highest first and
+ * equal scores in their original order.  An insertion sort: most moves
+ * score 0, so only the few scored ones travel.
+ */
+void sortByScore(vector<Move> &moves, vector<int> &scores) {
+    for (size_t i = 1; i < moves.size(); i++) {
+        int score = scores[i];
+        if (score <= scores[i - 1]) continue;
+        Move m = moves[i];
+        size_t j = i;
+        for (; j > 0 && scores[j - 1] < score; j--) {
+            scores[j] = scores[j - 1];
+            moves[j] = moves[j - 1];
+        }
+        scores[j] = score;
+        moves[j] = m;
+    }
+}
+
+/**
+ * Move ordering: winning and even captures first (by victim value),
+ * then promotions and quiet moves, and captures that lose material by
+ * SEE last.  Helps alpha-beta prune more effectively.
+ */
+void orderMoves(vector<Move> &moves) {
+    vector<int> scores(moves.size());
+    bool scored = false;
+    for (size_t i = 0; i < moves.size(); i++) {
+        const Move &m = moves[i];
+        char target = board[m.tr][m.tc];
+        if (!isEmpty(target)) {
+            scores[i] = captureScore(m) >= 0 ? pieceValue(target) + 1000 : -1000;
+            scored = true;
+        }
+        if (m.promoPiece) {
+            scores[i] += 900;
+            scored = true;
+        }
+    }
+    if (scored) sortByScore(moves, scores);
 }
 
 /**
@@ -653,6 +861,256 @@ bool leavesKingInCheck(const Move &m, const string &side) {
     return inCheck;
 }
 
+// ============================================================
+//  Endgame bitbases (see game/bitbase.py for the format)
+// ============================================================
+//
+// One bit per position says whether the side with the extra piece wins
+// KQK, KRK or KPK.  The strong side is normalised to white and squares
+// are numbered row * 8 + col.
+
+const int BITBASE_SIDE = 64 * 64 * 64;
+const int BITBASE_WIN = 10000;
+string bitbaseDir = ".";
+
+struct Bitbase {
+    bool loaded = false;
+    vector<unsigned char> bits;
+};
+
+const vector<unsigned char> *loadBitbase(char kind) {
+    static Bitbase tables[3];
+    int slot = kind == 'q' ? 0 : kind == 'r' ? 1 : 2;
+    Bitbase &table = tables[slot];
+    if (!table.loaded) {
+        table.loaded = true;
+        string name = string("k") + kind + "k.bb";
+        ifstream in(bitbaseDir + "/" + name, ios::binary);
+        vector<unsigned char> data((istreambuf_iterator<char>(in)),
+                                   istreambuf_iterator<char>());
+        if (data.size() == static_cast<size_t>(BITBASE_SIDE / 4))
+            table.bits.swap(data);
+    }
+    return table.bits.empty() ? nullptr : &table.bits;
+}
+
+/**
+ * Progress bonus for a won ending, strong side as white: push the pawn
+ * and escort it, or shrink the lone king's box, drive it to the edge
+ * and bring the kings together.
+ */
+int bitbaseMopUp(char kind, int wk, int piece, int bk) {
+    int wr = wk / 8, wc = wk % 8, br = bk / 8, bc = bk % 8;
+    int pr = piece / 8, pc = piece % 8;
+    if (kind == 'p')
+        return 20 * (6 - pr) + 4 * (7 - max(abs(wr - pr + 1), abs(wc - pc)));
+    int rows = br < pr ? pr : br > pr ? 7 - pr : 8;
+    int cols = bc < pc ? pc : bc > pc ? 7 - pc : 8;
+    int edge = max(3 - br, br - 4) + max(3 - bc, bc - 4);
+    return 2 * (64 - rows * cols) + 10 * edge + 4 * (14 - abs(wr - br) - abs(wc - bc));
+}
+
+/**
+ * Score a KQK/KRK/KPK position from the bitbases, white-positive.
+ * Sets `covered` to false when the position has more material, castling
+ * rights, or the table file is missing.  Draws score 0.
+ */
+int probeBitbase(const string &side, bool &covered) {
+    covered = false;
+    if (W_K_CASTLE || W_Q_CASTLE || B_K_CASTLE || B_Q_CASTLE) return 0;
+    int count = 0, wk = -1, bk = -1, ps = -1;
+    char piece = '.';
+    for (int r = 0; r < 8; r++) {
+        for (int c = 0; c < 8; c++) {
+            char p = board[r][c];
+            if (p == '.') continue;
+            if (++count > 3) return 0;
+            if (p == 'K') wk = r * 8 + c;
+            else if (p == 'k') bk = r * 8 + c;
+            else { piece = p; ps = r * 8 + c; }
+        }
+    }
+    char kind = static_cast<char>(tolower(static_cast<unsigned char>(piece)));
+    if (count != 3 || wk < 0 || bk < 0 || (kind != 'q' && kind != 'r' && kind != 'p'))
+        return 0;
+    const vector<unsigned char> *bits = loadBitbase(kind);
+    if (!bits) return 0;
+    covered = true;
+
+    bool strongWhite = isWhite(piece);
+    if (!strongWhite) {
+        int oldWk = wk;
+        wk = bk ^ 56; ps ^= 56; bk = oldWk ^ 56;
+    }
+    bool strongToMove = (side == "white") == strongWhite;
+    int index = (strongToMove ? 0 : BITBASE_SIDE) + wk * 4096 + ps * 64 + bk;
+    if (!(((*bits)[index >> 3] >> (index & 7)) & 1)) return 0;
+    int score = BITBASE_WIN + pieceValue(kind) + bitbaseMopUp(kind, wk, ps, bk);
+    return strongWhite ? score : -score;
+}
+
+// ============================================================
+//  Make / unmake, Zobrist hashing and repetition
+// ============================================================
+//
+// Zobrist keys are generated exactly as in game/zobrist.py so hashes
+// match the rest of Checkora: 12 x 64 piece-square keys (pieces
+// PNBRQKpnbrqk), the black-to-move key, four castling keys (KQkq) and
+// eight en-passant file keys.  The en-passant file only counts when the
+// side to move has a pawn that can capture there.
+
+const int ZOBRIST_SIDE = 12 * 64;
+const int ZOBRIST_CASTLING = ZOBRIST_SIDE + 1;
+const int ZOBRIST_EP_FILE = ZOBRIST_CASTLING + 4;
+uint64_t zobristKeys[ZOBRIST_EP_FILE + 8];
+// Row of each piece letter in the piece-square keys
+int zobristPiece[128];
+
+void initZobrist() {
+    uint64_t state = 0x436865636B6F7261ULL;
+    for (uint64_t &key : zobristKeys) {
+        state += 0x9E3779B97F4A7C15ULL;
+        uint64_t z = state;
+        z = (z ^ (z >> 30)) * 0xBF58476D1CE4E5B9ULL;
+        z = (z ^ (z >> 27)) * 0x94D049BB133111EBULL;
+        key = z ^ (z >> 31);
+    }
+    const string pieces = "PNBRQKpnbrqk";
+    for (int i = 0; i < 12; i++) zobristPiece[static_cast<int>(pieces[i])] = i;
+}
+
+inline uint64_t pieceKey(char piece, int r, int c) {
+    return zobristKeys[zobristPiece[static_cast<int>(piece)] * 64 + r * 8 + c];
+}
+
+uint64_t castlingHash() {
+    uint64_t h = 0;
+    if (W_K_CASTLE) h ^= zobristKeys[ZOBRIST_CASTLING];
+    if (W_Q_CASTLE) h ^= zobristKeys[ZOBRIST_CASTLING + 1];
+    if (B_K_CASTLE) h ^= zobristKeys[ZOBRIST_CASTLING + 2];
+    if (B_Q_CASTLE) h ^= zobristKeys[ZOBRIST_CASTLING + 3];
+    return h;
+}
+
+bool enPassantCapturable(const string &side) {
+    if (EN_PASSANT_R < 0) return false;
+    char pawn = side == "white" ? 'P' : 'p';
+    int row = EN_PASSANT_R + (side == "white" ? 1 : -1);
+    for (int c = EN_PASSANT_C - 1; c <= EN_PASSANT_C + 1; c += 2)
+        if (inBounds(row, c) && board[row][c] == pawn) return true;
+    return false;
+}
+
+uint64_t positionHash(const string &side) {
+    uint64_t h = side == "black" ? zobristKeys[ZOBRIST_SIDE] : 0;
+    for (int r = 0; r < 8; r++)
+        for (int c = 0; c < 8; c++)
+            if (board[r][c] != '.') h ^= pieceKey(board[r][c], r, c);
+    h ^= castlingHash();
+    if (enPassantCapturable(side)) h ^= zobristKeys[ZOBRIST_EP_FILE + EN_PASSANT_C];
+    return h;
+}
+
+// Hash of the current position, kept up to date by makeMove/unmakeMove
+// once a search has set it with positionHash().  positionHistory holds
+// the hashes of the game and the search path up to the parent of the
+// node being searched, HALFMOVE_CLOCK the plies since the last capture
+// or pawn move.
+uint64_t HASH = 0;
+vector<uint64_t> positionHistory;
+int HALFMOVE_CLOCK = 0;
+
+/**
+ * True if the position hashed `h` already occurred, with the same side
+ * to move, since the last capture or pawn move.
+ */
+bool isRepetition(uint64_t h) {
+    int size = static_cast<int>(positionHistory.size());
+    for (int i = size - 4; i >= max(size - HALFMOVE_CLOCK, 0); i -= 2)
+        if (positionHistory[i] == h) return true;
+    return false;
+}
+
+struct Undo {
+    char src, dst;
+    bool wk, wq, bk, bq;
+    int epR, epC;
+    int halfmove;
+    uint64_t hash;
+};
+
+Undo makeMove(const Move &m) {
+    char src = board[m.fr][m.fc];
+    char dst = board[m.tr][m.tc];
+    Undo u = {src, dst, W_K_CASTLE, W_Q_CASTLE, B_K_CASTLE, B_Q_CASTLE,
+              EN_PASSANT_R, EN_PASSANT_C, HALFMOVE_CLOCK, HASH};
+    HALFMOVE_CLOCK = (tolower(src) == 'p' || dst != '.') ? 0 : HALFMOVE_CLOCK + 1;
+
+    bool whiteMoved = isupper(src);
+    uint64_t h = HASH ^ zobristKeys[ZOBRIST_SIDE] ^ castlingHash();
+    if (EN_PASSANT_R >= 0 && enPassantCapturable(whiteMoved ? "white" : "black"))
+        h ^= zobristKeys[ZOBRIST_EP_FILE + EN_PASSANT_C];
+
+    char placed = m.promoPiece ? m.promoPiece : src;
+    h ^= pieceKey(src, m.fr, m.fc) ^ pieceKey(placed, m.tr, m.tc);
+    if (dst != '.') h ^= pieceKey(dst, m.tr, m.tc);
+    board[m.tr][m.tc] = placed;
+    board[m.fr][m.fc] = '.';
+    if (tolower(src) == 'p' && m.fc != m.tc && dst == '.') {
+        h ^= pieceKey(board[m.fr][m.tc], m.fr, m.tc);
+        board[m.fr][m.tc] = '.';
+    }
+    if (tolower(src) == 'k' && abs(m.tc - m.fc) == 2) {
+        int rookFrom = m.tc == 6 ? 7 : 0, rookTo = m.tc == 6 ? 5 : 3;
+        char rook = board[m.fr][rookFrom];
+        h ^= pieceKey(rook, m.fr, rookFrom) ^ pieceKey(rook, m.fr, rookTo);
+        board[m.fr][rookTo] = rook;
+        board[m.fr][rookFrom] = '.';
+    }
+
+    if (src == 'K') { W_K_CASTLE = false; W_Q_CASTLE = false; }
+    if (src == 'k') { B_K_CASTLE = false; B_Q_CASTLE = false; }
+    const int squares[2][2] = {{m.fr, m.fc}, {m.tr, m.tc}};
+    for (const auto &sq : squares) {
+        if (sq[0] == 7 && sq[1] == 0) W_Q_CASTLE = false;
+        if (sq[0] == 7 && sq[1] == 7) W_K_CASTLE = false;
+        if (sq[0] == 0 && sq[1] == 0) B_Q_CASTLE = false;
+        if (sq[0] == 0 && sq[1] == 7) B_K_CASTLE = false;
+    }
+
+    h ^= castlingHash();
+
+    EN_PASSANT_R = -1; EN_PASSANT_C = -1;
+    if (tolower(src) == 'p' && abs(m.tr - m.fr) == 2) {
+        EN_PASSANT_R = (m.fr + m.tr) / 2; EN_PASSANT_C = m.fc;
+        if (enPassantCapturable(whiteMoved ? "black" : "white"))
+            h ^= zobristKeys[ZOBRIST_EP_FILE + EN_PASSANT_C];
+    }
+    HASH = h;
+    return u;
+}
+
+void unmakeMove(const Move &m, const Undo &u) {
+    W_K_CASTLE = u.wk; W_Q_CASTLE = u.wq; B_K_CASTLE = u.bk; B_Q_CASTLE = u.bq;
+    EN_PASSANT_R = u.epR; EN_PASSANT_C = u.epC;
+    HALFMOVE_CLOCK = u.halfmove;
+    HASH = u.hash;
+
+    board[m.fr][m.fc] = u.src;
+    board[m.tr][m.tc] = u.dst;
+    if (tolower(u.src) == 'p' && m.fc != m.tc && u.dst == '.')
+        board[m.fr][m.tc] = u.src == 'P' ? 'p' : 'P';
+    if (tolower(u.src) == 'k' && abs(m.tc - m.fc) == 2) {
+        int rookFrom = m.tc == 6 ? 7 : 0, rookTo = m.tc == 6 ? 5 : 3;
+        board[m.fr][rookFrom] = board[m.fr][rookTo];
+        board[m.fr][rookTo] = '.';
+    }
+}
+
+vector<Move> legalMovesFor(const string &side);
+bool inCheck(const string &side);
+int quiesce(int alpha, int beta, bool maximizing, int ply = 0);
+
 /**
  * Minimax with alpha-beta pruning.
  *
@@ -663,9 +1121,22 @@ bool leavesKingInCheck(const Move &m, const string &side) {
  * Returns the static evaluation at leaf nodes.
  */
 int minimax(int depth, int alpha, int beta, bool maximizing) {
-    if (depth == 0) return evaluate();
-
     string side = maximizing ? "white" : "black";
+
+    // A repeated position is a draw, and so is the fifty-move rule unless
+    // the last move mated
+    uint64_t key = HASH;
+    if (isRepetition(key)) return 0;
+    if (HALFMOVE_CLOCK >= 100 && !(inCheck(side) && legalMovesFor(side).empty())) return 0;
+
+    // Drawn endings need no search; won ones are searched on so mates are
+    // found, with the mop-up score standing in for evaluate() at the horizon.
+    bool covered;
+    int known = probeBitbase(side, covered);
+    if (covered && known == 0) return 0;
+
+    if (depth == 0) return covered ? known : quiesce(alpha, beta, maximizing);
+
     vector<Move> moves = generateMoves(side);
     orderMoves(moves);
 
@@ -687,109 +1158,211 @@ int minimax(int depth, int alpha, int beta, bool maximizing) {
         return 0;  // stalemate
     }
 
-    if (maximizing) {
-        int maxEval = INT_MIN;
-        for (auto &m : legal) {
-            char src = board[m.fr][m.fc];
-            char dst = board[m.tr][m.tc];
-            board[m.tr][m.tc] = m.promoPiece ? m.promoPiece : src;
-            board[m.fr][m.fc] = '.';
-
-            int ep_r = -1, ep_c = -1;
-            char ep_captured = '.';
-            if (tolower(src) == 'p' && m.fc != m.tc && dst == '.') {
-                ep_r = m.fr; ep_c = m.tc;
-                ep_captured = board[ep_r][ep_c];
-                board[ep_r][ep_c] = '.';
-            }
+    positionHistory.push_back(key);
+    int best = maximizing ? INT_MIN : INT_MAX;
+    for (auto &m : legal) {
+        Undo u = makeMove(m);
+        int eval = minimax(depth - 1, alpha, beta, !maximizing);
+        unmakeMove(m, u);
 
-            int rook_fr = -1, rook_fc = -1, rook_tr = -1, rook_tc = -1;
-            if (tolower(src) == 'k' && abs(m.tc - m.fc) == 2) {
-                if (m.tc == 6) { rook_fr = m.fr; rook_fc = 7; rook_tr = m.tr; rook_tc = 5; }
-                else if (m.tc == 2) { rook_fr = m.fr; rook_fc = 0; rook_tr = m.tr; rook_tc = 3; }
-                if (rook_fr != -1) {
-                    board[rook_tr][rook_tc] = board[rook_fr][rook_fc];
-                    board[rook_fr][rook_fc] = '.';
-                }
-            }
+        if (maximizing) {
+            best = max(best, eval);
+            alpha = max(alpha, eval);
+        } else {
+            best = min(best, eval);
+            beta = min(beta, eval);
+        }
+        if (beta <= alpha) break;
+    }
+    positionHistory.pop_back();
+    return best;
+}
 
-            bool old_wk = W_K_CASTLE, old_wq = W_Q_CASTLE, old_bk = B_K_CASTLE, old_bq = B_Q_CASTLE;
-            if (src == 'K') { W_K_CASTLE = false; W_Q_CASTLE = false; }
-            if (src == 'k') { B_K_CASTLE = false; B_Q_CASTLE = false; }
-            if (src == 'R') { if (m.fr == 7 && m.fc == 0) W_Q_CASTLE = false; else if (m.fr == 7 && m.fc == 7) W_K_CASTLE = false; }
-            if (src == 'r') { if (m.fr == 0 && m.fc == 0) B_Q_CASTLE = false; else if (m.fr == 0 && m.fc == 7) B_K_CASTLE = false; }
-            if (dst == 'R') { if (m.tr == 7 && m.tc == 0) W_Q_CASTLE = false; else if (m.tr == 7 && m.tc == 7) W_K_CASTLE = false; }
-            if (dst == 'r') { if (m.tr == 0 && m.tc == 0) B_Q_CASTLE = false; else if (m.tr == 0 && m.tc == 7) B_K_CASTLE = false; }
+// ============================================================
+//  Mate search - checks only
+// ============================================================
 
-            int eval = minimax(depth - 1, alpha, beta, false);
+vector<Move> legalMovesFor(const string &side) {
+    vector<Move> moves = generateMoves(side);
+    orderMoves(moves);
+    vector<Move> legal;
+    legal.reserve(moves.size());
+    for (auto &m : moves)
+        if (!leavesKingInCheck(m, side)) legal.push_back(m);
+    return legal;
+}
 
-            W_K_CASTLE = old_wk; W_Q_CASTLE = old_wq; B_K_CASTLE = old_bk; B_Q_CASTLE = old_bq;
+bool inCheck(const string &side) {
+    pair<int,int> kpos = findKing(side);
+    return kpos.first >= 0 &&
+           isSquareAttacked(kpos.first, kpos.second, side == "white" ? "black" : "white");
+}
 
-            if (ep_r != -1) board[ep_r][ep_c] = ep_captured;
-            board[m.fr][m.fc] = src;
-            board[m.tr][m.tc] = dst;
-            if (rook_fr != -1) {
-                board[rook_fr][rook_fc] = board[rook_tr][rook_tc];
-                board[rook_tr][rook_tc] = '.';
-            }
+// Quiescence limits: plies searched past the horizon, and the margin by
+// which winning a capture's victim outright must still miss the window
+// before the capture is skipped (delta pruning)
+const int QUIESCE_MAX_PLY = 6;
+const int QUIESCE_DELTA = 200;
 
-            maxEval = max(maxEval, eval);
+/**
+ * Capture-only search at the horizon so positions are not scored in the
+ * middle of an exchange.  The side to move may stand pat; captures that
+ * lose material by SEE, or that cannot lift the score into the window
+ * even with QUIESCE_DELTA to spare, are not searched, and nothing is
+ * searched past QUIESCE_MAX_PLY.
+ */
+int quiesce(int alpha, int beta, bool maximizing, int ply) {
+    string side = maximizing ? "white" : "black";
+    int best = evaluate();
+    if (maximizing) {
+        if (best >= beta) return best;
+        alpha = max(alpha, best);
+    } else {
+        if (best <= alpha) return best;
+        beta = min(beta, best);
+    }
+    if (ply >= QUIESCE_MAX_PLY) return best;
+
+    vector<Move> captures = generateCaptures(side);
+    vector<int> gains;
+    gains.reserve(captures.size());
+    size_t kept = 0;
+    for (auto &m : captures) {
+        int swing = pieceValue(board[m.tr][m.tc]) + QUIESCE_DELTA;
+        if (m.promoPiece) swing += pieceValue(m.promoPiece) - pieceValue('p');
+        if (maximizing ? best + swing <= alpha : best - swing >= beta) continue;
+        int gain = captureScore(m);
+        if (gain < 0) continue;
+        captures[kept++] = m;
+        gains.push_back(gain);
+    }
+    captures.resize(kept);
+    sortByScore(captures, gains);
+
+    for (auto &m : captures) {
+        if (leavesKingInCheck(m, side)) continue;
+        Undo u = makeMove(m);
+        int eval = quiesce(alpha, beta, !maximizing, ply + 1);
+        unmakeMove(m, u);
+        if (maximizing) {
+            best = max(best, eval);
             alpha = max(alpha, eval);
-            if (beta <= alpha) break;
+        } else {
+            best = min(best, eval);
+            beta = min(beta, eval);
         }
-        return maxEval;
-    } else {
-        int minEval = INT_MAX;
-        for (auto &m : legal) {
-            char src = board[m.fr][m.fc];
-            char dst = board[m.tr][m.tc];
-            board[m.tr][m.tc] = m.promoPiece ? m.promoPiece : src;
-            board[m.fr][m.fc] = '.';
-
-            int ep_r = -1, ep_c = -1;
-            char ep_captured = '.';
-            if (tolower(src) == 'p' && m.fc != m.tc && dst == '.') {
-                ep_r = m.fr; ep_c = m.tc;
-                ep_captured = board[ep_r][ep_c];
-                board[ep_r][ep_c] = '.';
-            }
+        if (beta <= alpha) break;
+    }
+    return best;
+}
 
-            int rook_fr = -1, rook_fc = -1, rook_tr = -1, rook_tc = -1;
-            if (tolower(src) == 'k' && abs(m.tc - m.fc) == 2) {
-                if (m.tc == 6) { rook_fr = m.fr; rook_fc = 7; rook_tr = m.tr; rook_tc = 5; }
-                else if (m.tc == 2) { rook_fr = m.fr; rook_fc = 0; rook_tr = m.tr; rook_tc = 3; }
-                if (rook_fr != -1) {
-                    board[rook_tr][rook_tc] = board[rook_fr][rook_fc];
-                    board[rook_fr][rook_fc] = '.';
+// Budget for the mate search run before every BESTMOVE; 0 means unlimited.
+const int MATE_SHORTCUT_MOVES = 3;
+const long MATE_SHORTCUT_NODES = 20000;
+long mateNodeLimit = 0;
+long mateNodes = 0;
+
+/**
+ * Depth-limited mate search over checking moves only, so every defending
+ * node is in check and has few replies.  Fills `line` with the mate
+ * (defender's longest resistance) and returns true if one is found within
+ * `plies`.  Gives up once `mateNodeLimit` move generations have been spent.
+ */
+bool mateSearch(const string &side, int plies, vector<Move> &line) {
+    string opponent = side == "white" ? "black" : "white";
+    if (mateNodeLimit && ++mateNodes > mateNodeLimit) return false;
+
+    for (auto &m : legalMovesFor(side)) {
+        Undo u = makeMove(m);
+        bool mated = false;
+        vector<Move> longest;
+        if (inCheck(opponent)) {
+            ++mateNodes;
+            vector<Move> replies = legalMovesFor(opponent);
+            if (replies.empty()) {
+                mated = true;
+            } else if (plies >= 3) {
+                mated = true;
+                for (auto &r : replies) {
+                    Undo ru = makeMove(r);
+                    vector<Move> rest;
+                    bool found = mateSearch(side, plies - 2, rest);
+                    unmakeMove(r, ru);
+                    if (!found) { mated = false; break; }
+                    if (rest.size() + 1 > longest.size()) {
+                        longest.clear();
+                        longest.push_back(r);
+                        longest.insert(longest.end(), rest.begin(), rest.end());
+                    }
                 }
             }
+        }
+        unmakeMove(m, u);
+        if (mated) {
+            line.clear();
+            line.push_back(m);
+            line.insert(line.end(), longest.begin(), longest.end());
+            return true;
+        }
+    }
+    return false;
+}
 
-            bool old_wk = W_K_CASTLE, old_wq = W_Q_CASTLE, old_bk = B_K_CASTLE, old_bq = B_Q_CASTLE;
-            if (src == 'K') { W_K_CASTLE = false; W_Q_CASTLE = false; }
-            if (src == 'k') { B_K_CASTLE = false; B_Q_CASTLE = false; }
-            if (src == 'R') { if (m.fr == 7 && m.fc == 0) W_Q_CASTLE = false; else if (m.fr == 7 && m.fc == 7) W_K_CASTLE = false; }
-            if (src == 'r') { if (m.fr == 0 && m.fc == 0) B_Q_CASTLE = false; else if (m.fr == 0 && m.fc == 7) B_K_CASTLE = false; }
-            if (dst == 'R') { if (m.tr == 7 && m.tc == 0) W_Q_CASTLE = false; else if (m.tr == 7 && m.tc == 7) W_K_CASTLE = false; }
-            if (dst == 'r') { if (m.tr == 0 && m.tc == 0) B_Q_CASTLE = false; else if (m.tr == 0 && m.tc == 7) B_K_CASTLE = false; }
-
-            int eval = minimax(depth - 1, alpha, beta, true);
-
-            W_K_CASTLE = old_wk; W_Q_CASTLE = old_wq; B_K_CASTLE = old_bk; B_Q_CASTLE = old_bq;
+/** Shortest checking mate in at most `maxMoves` moves. */
+bool findMate(const string &side, int maxMoves, long nodeLimit, vector<Move> &line) {
+    mateNodes = 0;
+    mateNodeLimit = nodeLimit;
+    for (int moves = 1; moves <= maxMoves; moves++)
+        if (mateSearch(side, 2 * moves - 1, line)) return true;
+    return false;
+}
 
-            if (ep_r != -1) board[ep_r][ep_c] = ep_captured;
-            board[m.fr][m.fc] = src;
-            board[m.tr][m.tc] = dst;
-            if (rook_fr != -1) {
-                board[rook_fr][rook_fc] = board[rook_tr][rook_tc];
-                board[rook_tr][rook_tc] = '.';
-            }
+/**
+ * MATE <board64> <castling> <turn> <ep_row> <ep_col> <max_moves>
+ * -> MATE <n> <fr> <fc> <tr> <tc> [<fr> <fc> <tr> <tc> ...]
+ * -> MATE NONE
+ */
+void handleMate(const string &turn, int maxMoves) {
+    vector<Move> line;
+    if (!findMate(turn, maxMoves, 0, line)) {
+        cout << "MATE NONE" << endl;
+        return;
+    }
+    cout << "MATE " << (line.size() + 1) / 2;
+    for (auto &m : line)
+        cout << " " << m.fr << " " << m.fc << " " << m.tr << " " << m.tc;
+    cout << endl;
+}
 
-            minEval = min(minEval, eval);
-            beta = min(beta, eval);
-            if (beta <= alpha) break;
-        }
-        return minEval;
+/**
+ * ANALYZE <board64> <castling> <turn> <ep_row> <ep_col> <depth>
+ * Scores every legal move with a full-window search, from the point of
+ * view of the side to move, best first.
+ */
+void handleAnalyze(const string &turn, int depth) {
+    bool maximizing = (turn == "white");
+    HALFMOVE_CLOCK = 0;
+    HASH = positionHash(turn);
+    positionHistory.assign(1, HASH);
+    vector<pair<int, Move>> scored;
+    for (auto &m : legalMovesFor(turn)) {
+        Undo u = makeMove(m);
+        int eval = minimax(depth - 1, INT_MIN, INT_MAX, !maximizing);
+        unmakeMove(m, u);
+        scored.push_back({maximizing ? eval : -eval, m});
+    }
+    stable_sort(scored.begin(), scored.end(),
+                [](const pair<int, Move> &a, const pair<int, Move> &b) {
+                    return a.first > b.first;
+                });
+
+    cout << "ANALYZE";
+    for (auto &entry : scored) {
+        const Move &m = entry.second;
+        cout << " " << m.fr << " " << m.fc << " " << m.tr << " " << m.tc
+             << " " << entry.first;
     }
+    cout << endl;
 }
 
 // ============================================================
@@ -960,15 +1533,21 @@ void handleNotation(const string &turn, int fr, int fc, int tr, int tc, char pro
  * BESTMOVE handler.
  *
  * Protocol:
- *   BESTMOVE <board64> <turn> <depth>
+ *   BESTMOVE <board64> <castling> <turn> <ep_r> <ep_c> <depth>
+ *            <halfmove_clock> <n> [<hash> ...]
  *   -> BESTMOVE <fr> <fc> <tr> <tc>
  *   -> BESTMOVE NONE            (no legal moves)
  *
  * Runs minimax to the requested depth and returns the best move
- * for the given side.
+ * for the given side.  The hex Zobrist hashes are the game's positions
+ * since the last capture or pawn move, oldest first; the search scores
+ * repetitions of them (or of its own path) and fifty-move draws as 0.
  */
 void handleBestMove(const string &turn, int depth) {
     bool maximizing = (turn == "white");
+    HASH = positionHash(turn);
+    if (positionHistory.empty() || positionHistory.back() != HASH)
+        positionHistory.push_back(HASH);
     vector<Move> moves = generateMoves(turn);
     orderMoves(moves);
 
@@ -984,52 +1563,21 @@ void handleBestMove(const string &turn, int depth) {
         return;
     }
 
+    // A short forced mate beats anything the full-width search can find
+    vector<Move> mateLine;
+    if (findMate(turn, MATE_SHORTCUT_MOVES, MATE_SHORTCUT_NODES, mateLine)) {
+        const Move &m = mateLine[0];
+        cout << "BESTMOVE " << m.fr << " " << m.fc << " " << m.tr << " " << m.tc << endl;
+        return;
+    }
+
     Move best = legal[0];
     int bestVal = maximizing ? INT_MIN : INT_MAX;
 
     for (auto &m : legal) {
-        char src = board[m.fr][m.fc];
-        char dst = board[m.tr][m.tc];
-        board[m.tr][m.tc] = m.promoPiece ? m.promoPiece : src;
-        board[m.fr][m.fc] = '.';
-
-        int ep_r = -1, ep_c = -1;
-        char ep_captured = '.';
-        if (tolower(src) == 'p' && m.fc != m.tc && dst == '.') {
-            ep_r = m.fr; ep_c = m.tc;
-            ep_captured = board[ep_r][ep_c];
-            board[ep_r][ep_c] = '.';
-        }
-
-        int rook_fr = -1, rook_fc = -1, rook_tr = -1, rook_tc = -1;
-        if (tolower(src) == 'k' && abs(m.tc - m.fc) == 2) {
-            if (m.tc == 6) { rook_fr = m.fr; rook_fc = 7; rook_tr = m.tr; rook_tc = 5; }
-            else if (m.tc == 2) { rook_fr = m.fr; rook_fc = 0; rook_tr = m.tr; rook_tc = 3; }
-            if (rook_fr != -1) {
-                board[rook_tr][rook_tc] = board[rook_fr][rook_fc];
-                board[rook_fr][rook_fc] = '.';
-            }
-        }
-
-        bool old_wk = W_K_CASTLE, old_wq = W_Q_CASTLE, old_bk = B_K_CASTLE, old_bq = B_Q_CASTLE;
-        if (src == 'K') { W_K_CASTLE = false; W_Q_CASTLE = false; }
-        if (src == 'k') { B_K_CASTLE = false; B_Q_CASTLE = false; }
-        if (src == 'R') { if (m.fr == 7 && m.fc == 0) W_Q_CASTLE = false; else if (m.fr == 7 && m.fc == 7) W_K_CASTLE = false; }
-        if (src == 'r') { if (m.fr == 0 && m.fc == 0) B_Q_CASTLE = false; else if (m.fr == 0 && m.fc == 7) B_K_CASTLE = false; }
-        if (dst == 'R') { if (m.tr == 7 && m.tc == 0) W_Q_CASTLE = false; else if (m.tr == 7 && m.tc == 7) W_K_CASTLE = false; }
-        if (dst == 'r') { if (m.tr == 0 && m.tc == 0) B_Q_CASTLE = false; else if (m.tr == 0 && m.tc == 7) B_K_CASTLE = false; }
-
+        Undo u = makeMove(m);
         int eval = minimax(depth - 1, INT_MIN, INT_MAX, !maximizing);
-
-        W_K_CASTLE = old_wk; W_Q_CASTLE = old_wq; B_K_CASTLE = old_bk; B_Q_CASTLE = old_bq;
-
-        if (ep_r != -1) board[ep_r][ep_c] = ep_captured;
-        board[m.fr][m.fc] = src;
-        board[m.tr][m.tc] = dst;
-        if (rook_fr != -1) {
-            board[rook_fr][rook_fc] = board[rook_tr][rook_tc];
-            board[rook_tr][rook_tc] = '.';
-        }
+        unmakeMove(m, u);
 
         if (maximizing) {
             if (eval > bestVal) { bestVal = eval; best = m; }
@@ -1042,7 +1590,16 @@ void handleBestMove(const string &turn, int depth) {
          << " " << best.tr << " " << best.tc << endl;
 }
 
-int main() {
+int main(int argc, char *argv[]) {
+    // Bitbases live next to the executable
+    if (argc > 0) {
+        string self = argv[0];
+        size_t slash = self.find_last_of("/\\");
+        if (slash != string::npos) bitbaseDir = self.substr(0, slash);
+    }
+
+    initZobrist();
+
     string command;
     while (cin >> command) {
         if (command == "VALIDATE") {
@@ -1061,6 +1618,14 @@ int main() {
             EN_PASSANT_R = epR; EN_PASSANT_C = epC;
             handleMoves(t, r, c);
         } 
+        else if (command == "LEGAL") {
+            string b, rights, t; int epR, epC;
+            cin >> b >> rights >> t >> epR >> epC;
+            loadBoard(b);
+            loadCastlingRights(rights);
+            EN_PASSANT_R = epR; EN_PASSANT_C = epC;
+            handleLegal(t);
+        }
         else if (command == "ATTACKED") {
             string b, rights, attackerColor; int r, c;
             cin >> b >> rights >> attackerColor >> r >> c;
@@ -1086,12 +1651,35 @@ int main() {
             handleStatus(t);
         }
         else if (command == "BESTMOVE") {
+            string b, rights, t; int epR, epC, depth, halfmove, count;
+            cin >> b >> rights >> t >> epR >> epC >> depth >> halfmove >> count;
+            positionHistory.clear();
+            for (int i = 0; i < count; i++) {
+                string hex;
+                cin >> hex;
+                positionHistory.push_back(stoull(hex, nullptr, 16));
+            }
+            loadBoard(b);
+            loadCastlingRights(rights);
+            EN_PASSANT_R = epR; EN_PASSANT_C = epC;
+            HALFMOVE_CLOCK = halfmove;
+            handleBestMove(t, depth);
+        }
+        else if (command == "MATE") {
+            string b, rights, t; int epR, epC, maxMoves;
+            cin >> b >> rights >> t >> epR >> epC >> maxMoves;
+            loadBoard(b);
+            loadCastlingRights(rights);
+            EN_PASSANT_R = epR; EN_PASSANT_C = epC;
+            handleMate(t, maxMoves);
+        }
+        else if (command == "ANALYZE") {
             string b, rights, t; int epR, epC, depth;
             cin >> b >> rights >> t >> epR >> epC >> depth;
             loadBoard(b);
             loadCastlingRights(rights);
             EN_PASSANT_R = epR; EN_PASSANT_C = epC;
-            handleBestMove(t, depth);
+            handleAnalyze(t, depth);
         }
         else if (command == "NOTATION") {
             string b, rights, t; int epR, epC, fr, fc, tr, tc;
@@ -8,6 +8,9 @@ VALIDATE <board64> <castling_rights> <turn> <ep_row> <ep_col> <fr> <fc> <tr> <tc
 MOVES <board64> <castling_rights> <turn> <ep_row> <ep_col> <row> <col>
 -> MOVES [<row> <col> <is_capture> <is_promotion> ...]
 
+LEGAL <board64> <castling_rights> <turn> <ep_row> <ep_col>
+-> LEGAL [<fr> <fc> <tr> <tc> <is_capture> <is_promotion> ...]
+
 ATTACKED <board64> <castling_rights> <attackerColor> <row> <col>
 -> YES | NO
 
@@ -19,17 +22,29 @@ STATUS <board64> <castling_rights> <turn> <ep_row> <ep_col>
 -> STATUS CHECK | CHECKMATE | STALEMATE | OK
 
 BESTMOVE <board64> <castling_rights> <turn> <ep_row> <ep_col> <depth>
+         <halfmove_clock> <n> [<hash> ...]
 -> BESTMOVE <fr> <fc> <tr> <tc>
+   (hashes: hex Zobrist keys since the last capture or pawn move, oldest
+   first; the search scores repetitions and fifty-move draws as 0)
 -> BESTMOVE NONE
+
+MATE <board64> <castling_rights> <turn> <ep_row> <ep_col> <max_moves>
+-> MATE <n> <fr> <fc> <tr> <tc> [<fr> <fc> <tr> <tc> ...]
+-> MATE NONE
+
+ANALYZE <board64> <castling_rights> <turn> <ep_row> <ep_col> <depth>
+-> ANALYZE [<fr> <fc> <tr> <tc> <score> ...]   (best first, mover's view)
 """
 
 from __future__ import annotations
 
+import os
 import sys
-from dataclasses import dataclass
 
 
-BOARD = [['.'] * 8 for _ in range(8)]
+# The board is a flat list of 64 squares numbered row * 8 + col, with row 0
+# being rank 8 -- the same order as the protocol's board64 string.
+BOARD = ['.'] * 64
 NO_PROMOTION = '\0'
 W_K_CASTLE = False
 W_Q_CASTLE = False
@@ -38,10 +53,79 @@ B_Q_CASTLE = False
 EN_PASSANT_R = -1
 EN_PASSANT_C = -1
 
+WHITE_PIECES = frozenset('PNBRQK')
+BLACK_PIECES = frozenset('pnbrqk')
+SIDE_PIECES = {'white': WHITE_PIECES, 'black': BLACK_PIECES}
+ENEMY_PIECES = {'white': BLACK_PIECES, 'black': WHITE_PIECES}
+
+KNIGHT_OFFSETS = (
+    (-2, -1), (-2, 1), (-1, -2), (-1, 2),
+    (1, -2), (1, 2), (2, -1), (2, 1),
+)
+# Orthogonal directions first, then diagonals
+DIRECTIONS = (
+    (0, 1), (0, -1), (1, 0), (-1, 0),
+    (1, 1), (1, -1), (-1, 1), (-1, -1),
+)
+
+
+def in_bounds(row, col):
+    return 0 <= row < 8 and 0 <= col < 8
+
+
+def _build_tables():
+    """Precompute per-square target lists so move generation never has to
+    test board bounds or walk offsets again."""
+    knight, king, orthogonal, diagonal = [], [], [], []
+    pawn_push = {'white': [], 'black': []}
+    pawn_captures = {'white': [], 'black': []}
+    for sq in range(64):
+        row, col = divmod(sq, 8)
+        knight.append(tuple(
+            (row + dr) * 8 + col + dc for dr, dc in KNIGHT_OFFSETS
+            if in_bounds(row + dr, col + dc)))
+        king.append(tuple(
+            (row + dr) * 8 + col + dc for dr, dc in DIRECTIONS
+            if in_bounds(row + dr, col + dc)))
+        rays = []
+        for dr, dc in DIRECTIONS:
+            ray = []
+            r, c = row + dr, col + dc
+            while in_bounds(r, c):
+                ray.append(r * 8 + c)
+                r += dr
+                c += dc
+            if ray:
+                rays.append(tuple(ray))
+        orthogonal.append(tuple(
+            ray for ray in rays if ray[0] // 8 == row or ray[0] % 8 == col))
+        diagonal.append(tuple(
+            ray for ray in rays if ray[0] // 8 != row and ray[0] % 8 != col))
+        for color, dr in (('white', -1), ('black', 1)):
+            pawn_push[color].append((row + dr) * 8 + col if 0 <= row + dr < 8 else -1)
+            pawn_captures[color].append(tuple(
+                (row + dr) * 8 + col + dc for dc in (-1, 1)
+                if in_bounds(row + dr, col + dc)))
+    queen = [orthogonal[sq] + diagonal[sq] for sq in range(64)]
+    return knight, king, orthogonal, diagonal, queen, pawn_push, pawn_captures
+
+
+(KNIGHT_TARGETS, KING_TARGETS, ROOK_RAYS, BISHOP_RAYS, QUEEN_RAYS,
+ PAWN_PUSH, PAWN_CAPTURES) = _build_tables()
+SLIDER_RAYS = {'r': ROOK_RAYS, 'b': BISHOP_RAYS, 'q': QUEEN_RAYS}
+# A square is attacked by a pawn standing where an enemy pawn could capture
+PAWN_ATTACKERS = {'white': PAWN_CAPTURES['black'], 'black': PAWN_CAPTURES['white']}
+ATTACKER_LETTERS = {
+    'white': ('N', 'K', 'P', 'R', 'B', 'Q'),
+    'black': ('n', 'k', 'p', 'r', 'b', 'q'),
+}
+START_KING = {'white': 60, 'black': 4}
+CASTLING_CORNERS = frozenset((0, 7, 56, 63))
+PAWN_START_ROW = {'white': 6, 'black': 1}
+
 
 def load_board(board64):
-    for index, piece in enumerate(board64):
-        BOARD[index // 8][index % 8] = piece
+    BOARD[:] = board64[:64]
 
 
 def load_castling_rights(rights_str):
@@ -59,8 +143,12 @@ def load_en_passant(row, col):
     EN_PASSANT_C = col
 
 
+def en_passant_square():
+    return EN_PASSANT_R * 8 + EN_PASSANT_C if EN_PASSANT_R >= 0 else -1
+
+
 def serialize_board():
-    return ''.join(''.join(row) for row in BOARD)
+    return ''.join(BOARD)
 
 
 def is_white(piece):
@@ -83,10 +171,6 @@ def color_of(piece):
     return 'none'
 
 
-def in_bounds(row, col):
-    return 0 <= row < 8 and 0 <= col < 8
-
-
 def is_promotion_move(piece, to_row):
     return (piece == 'P' and to_row == 0) or (piece == 'p' and to_row == 7)
 
@@ -98,153 +182,139 @@ def resolve_promotion(pawn, choice):
     return lower.upper() if is_white(pawn) else lower
 
 
-def path_clear(fr, fc, tr, tc):
-    row_step = 1 if tr > fr else -1 if tr < fr else 0
-    col_step = 1 if tc > fc else -1 if tc < fc else 0
-    row = fr + row_step
-    col = fc + col_step
-    while row != tr or col != tc:
-        if not is_empty(BOARD[row][col]):
-            return False
-        row += row_step
-        col += col_step
-    return True
-
-
-def is_square_attacked(target_row, target_col, attacker_color):
-    knight_offsets = [
-        (-2, -1), (-2, 1), (-1, -2), (-1, 2),
-        (1, -2), (1, 2), (2, -1), (2, 1),
-    ]
-    target_knight = 'N' if attacker_color == 'white' else 'n'
-    for dr, dc in knight_offsets:
-        row = target_row + dr
-        col = target_col + dc
-        if in_bounds(row, col) and BOARD[row][col] == target_knight:
+def is_square_attacked(square, attacker_color):
+    board = BOARD
+    knight, king, pawn, rook, bishop, queen = ATTACKER_LETTERS[attacker_color]
+    for sq in KNIGHT_TARGETS[square]:
+        if board[sq] == knight:
             return True
-
-    directions = [
-        (0, 1), (0, -1), (1, 0), (-1, 0),
-        (1, 1), (1, -1), (-1, 1), (-1, -1),
-    ]
-    for index, (dr, dc) in enumerate(directions):
-        row = target_row + dr
-        col = target_col + dc
-        while in_bounds(row, col):
-            piece = BOARD[row][col]
-            if not is_empty(piece):
-                if color_of(piece) == attacker_color:
-                    piece_type = piece.lower()
-                    if index < 4 and piece_type in {'r', 'q'}:
-                        return True
-                    if index >= 4 and piece_type in {'b', 'q'}:
-                        return True
-                break
-            row += dr
-            col += dc
-
-    pawn_dir = 1 if attacker_color == 'white' else -1
-    target_pawn = 'P' if attacker_color == 'white' else 'p'
-    for dc in (-1, 1):
-        row = target_row + pawn_dir
-        col = target_col + dc
-        if in_bounds(row, col) and BOARD[row][col] == target_pawn:
+    for sq in PAWN_ATTACKERS[attacker_color][square]:
+        if board[sq] == pawn:
             return True
-
-    target_king = 'K' if attacker_color == 'white' else 'k'
-    for row in range(target_row - 1, target_row + 2):
-        for col in range(target_col - 1, target_col + 2):
-            if in_bounds(row, col) and (row != target_row or col != target_col):
-                if BOARD[row][col] == target_king:
+    for sq in KING_TARGETS[square]:
+        if board[sq] == king:
+            return True
+    for ray in ROOK_RAYS[square]:
+        for sq in ray:
+            piece = board[sq]
+            if piece != '.':
+                if piece == rook or piece == queen:
                     return True
-
-    return False
-
-
-def valid_pawn(color, fr, fc, tr, tc):
-    direction = -1 if color == 'white' else 1
-    start_row = 6 if color == 'white' else 1
-    row_delta = tr - fr
-    col_delta = tc - fc
-
-    if col_delta == 0 and row_delta == direction and is_empty(BOARD[tr][tc]):
-        return True
-
-    if col_delta == 0 and row_delta == 2 * direction and fr == start_row:
-        return is_empty(BOARD[fr + direction][fc]) and is_empty(BOARD[tr][tc])
-
-    if abs(col_delta) == 1 and row_delta == direction and not is_empty(BOARD[tr][tc]):
-        return True
-
-    if abs(col_delta) == 1 and row_delta == direction and tr == EN_PASSANT_R and tc == EN_PASSANT_C:
-        return True
-
+                break
+    for ray in BISHOP_RAYS[square]:
+        for sq in ray:
+            piece = board[sq]
+            if piece != '.':
+                if piece == bishop or piece == queen:
+                    return True
+                break
     return False
 
 
-def valid_rook(fr, fc, tr, tc):
-    return (fr == tr or fc == tc) and path_clear(fr, fc, tr, tc)
-
-
-def valid_knight(fr, fc, tr, tc):
-    row_delta = abs(tr - fr)
-    col_delta = abs(tc - fc)
-    return (row_delta == 2 and col_delta == 1) or (row_delta == 1 and col_delta == 2)
-
-
-def valid_bishop(fr, fc, tr, tc):
-    return abs(tr - fr) == abs(tc - fc) and path_clear(fr, fc, tr, tc)
-
-
-def valid_queen(fr, fc, tr, tc):
-    return valid_rook(fr, fc, tr, tc) or valid_bishop(fr, fc, tr, tc)
-
-
-def valid_king(color, fr, fc, tr, tc):
-    if abs(tr - fr) <= 1 and abs(tc - fc) <= 1:
-        return True
-        
-    if fr == tr and abs(tc - fc) == 2:
-        if color == 'white' and fr == 7 and fc == 4:
-            if tc == 6 and W_K_CASTLE and is_empty(BOARD[7][5]) and is_empty(BOARD[7][6]):
-                if not is_square_attacked(7, 4, 'black') and not is_square_attacked(7, 5, 'black') and not is_square_attacked(7, 6, 'black'):
-                    return True
-            if tc == 2 and W_Q_CASTLE and is_empty(BOARD[7][3]) and is_empty(BOARD[7][2]) and is_empty(BOARD[7][1]):
-                if not is_square_attacked(7, 4, 'black') and not is_square_attacked(7, 3, 'black') and not is_square_attacked(7, 2, 'black'):
-                    return True
-        elif color == 'black' and fr == 0 and fc == 4:
-            if tc == 6 and B_K_CASTLE and is_empty(BOARD[0][5]) and is_empty(BOARD[0][6]):
-                if not is_square_attacked(0, 4, 'white') and not is_square_attacked(0, 5, 'white') and not is_square_attacked(0, 6, 'white'):
-                    return True
-            if tc == 2 and B_Q_CASTLE and is_empty(BOARD[0][3]) and is_empty(BOARD[0][2]) and is_empty(BOARD[0][1]):
-                if not is_square_attacked(0, 4, 'white') and not is_square_attacked(0, 3, 'white') and not is_square_attacked(0, 2, 'white'):
-                    return True
-                    
-    return False
+class Move:
+    """A move between two squares numbered ``row * 8 + col``."""
+
+    __slots__ = ('src', 'dst', 'promo_piece')
+
+    def __init__(self, src, dst, promo_piece=NO_PROMOTION):
+        self.src = src
+        self.dst = dst
+        self.promo_piece = promo_piece
+
+    def __eq__(self, other):
+        return (isinstance(other, Move) and self.src == other.src
+                and self.dst == other.dst and self.promo_piece == other.promo_piece)
+
+    def __repr__(self):
+        return f'Move({self.fr}, {self.fc}, {self.tr}, {self.tc})'
+
+    @property
+    def fr(self):
+        return self.src >> 3
+
+    @property
+    def fc(self):
+        return self.src & 7
+
+    @property
+    def tr(self):
+        return self.dst >> 3
+
+    @property
+    def tc(self):
+        return self.dst & 7
+
+
+def add_piece_moves(side, sq, moves):
+    """Append the pseudo-legal moves of the piece on *sq* to *moves*."""
+    board = BOARD
+    piece = board[sq]
+    own = SIDE_PIECES[side]
+    kind = piece.lower()
+
+    if kind == 'p':
+        enemy = ENEMY_PIECES[side]
+        promo = NO_PROMOTION
+        one = PAWN_PUSH[side][sq]
+        if one >= 0 and (one < 8 or one >= 56):
+            promo = 'Q' if piece == 'P' else 'q'
+        if one >= 0 and board[one] == '.':
+            moves.append(Move(sq, one, promo))
+            if sq >> 3 == PAWN_START_ROW[side]:
+                two = PAWN_PUSH[side][one]
+                if board[two] == '.':
+                    moves.append(Move(sq, two))
+        ep_sq = en_passant_square()
+        for to in PAWN_CAPTURES[side][sq]:
+            if board[to] in enemy or to == ep_sq:
+                moves.append(Move(sq, to, promo))
+    elif kind == 'n':
+        for to in KNIGHT_TARGETS[sq]:
+            if board[to] not in own:
+                moves.append(Move(sq, to))
+    elif kind == 'k':
+        for to in KING_TARGETS[sq]:
+            if board[to] not in own:
+                moves.append(Move(sq, to))
+        if sq == START_KING[side]:
+            add_castling_moves(side, sq, moves)
+    else:
+        for ray in SLIDER_RAYS[kind][sq]:
+            for to in ray:
+                target = board[to]
+                if target == '.':
+                    moves.append(Move(sq, to))
+                else:
+                    if target not in own:
+                        moves.append(Move(sq, to))
+                    break
+
+
+def add_castling_moves(side, king, moves):
+    board = BOARD
+    opponent = 'black' if side == 'white' else 'white'
+    king_side, queen_side = (W_K_CASTLE, W_Q_CASTLE) if side == 'white' else (B_K_CASTLE, B_Q_CASTLE)
+    if (king_side and board[king + 1] == '.' and board[king + 2] == '.'
+            and not is_square_attacked(king, opponent)
+            and not is_square_attacked(king + 1, opponent)
+            and not is_square_attacked(king + 2, opponent)):
+        moves.append(Move(king, king + 2))
+    if (queen_side and board[king - 1] == '.' and board[king - 2] == '.' and board[king - 3] == '.'
+            and not is_square_attacked(king, opponent)
+            and not is_square_attacked(king - 1, opponent)
+            and not is_square_attacked(king - 2, opponent)):
+        moves.append(Move(king, king - 2))
 
 
 def validate_move(turn, fr, fc, tr, tc, silent=False):
-    piece = BOARD[fr][fc]
-    if is_empty(piece):
-        return False
-    if color_of(piece) != turn:
-        return False
-    if fr == tr and fc == tc:
-        return False
-
-    target = BOARD[tr][tc]
-    if not is_empty(target) and color_of(target) == turn:
+    src, dst = fr * 8 + fc, tr * 8 + tc
+    own = SIDE_PIECES[turn]
+    if BOARD[src] not in own or BOARD[dst] in own:
         return False
 
-    validators = {
-        'p': lambda: valid_pawn(turn, fr, fc, tr, tc),
-        'r': lambda: valid_rook(fr, fc, tr, tc),
-        'n': lambda: valid_knight(fr, fc, tr, tc),
-        'b': lambda: valid_bishop(fr, fc, tr, tc),
-        'q': lambda: valid_queen(fr, fc, tr, tc),
-        'k': lambda: valid_king(turn, fr, fc, tr, tc),
-    }
-    is_valid = validators.get(piece.lower(), lambda: False)()
+    moves = []
+    add_piece_moves(turn, src, moves)
+    is_valid = any(move.dst == dst for move in moves)
 
     if is_valid and not silent:
         print('VALID')
@@ -254,92 +324,62 @@ def validate_move(turn, fr, fc, tr, tc, silent=False):
     return is_valid
 
 
-@dataclass
-class Move:
-    fr: int
-    fc: int
-    tr: int
-    tc: int
-    promo_piece: str = NO_PROMOTION
-
-
 def find_king(color):
-    target = 'K' if color == 'white' else 'k'
-    for row in range(8):
-        for col in range(8):
-            if BOARD[row][col] == target:
-                return row, col
-    return -1, -1
+    try:
+        return BOARD.index('K' if color == 'white' else 'k')
+    except ValueError:
+        return -1
 
 
 def leaves_king_in_check(move, side):
-    src_piece = BOARD[move.fr][move.fc]
-    dst_piece = BOARD[move.tr][move.tc]
-    ep_capture_piece = '.'
-    ep_capture_row = move.fr
-    ep_capture_col = move.tc
-
-    if src_piece.lower() == 'p' and move.fc != move.tc and is_empty(dst_piece):
-        ep_capture_piece = BOARD[ep_capture_row][ep_capture_col]
-        BOARD[ep_capture_row][ep_capture_col] = '.'
-
-    BOARD[move.tr][move.tc] = move.promo_piece if move.promo_piece != NO_PROMOTION else src_piece
-    BOARD[move.fr][move.fc] = '.'
-
-    rook_fr, rook_fc, rook_tr, rook_tc = -1, -1, -1, -1
-    if src_piece.lower() == 'k' and abs(move.tc - move.fc) == 2:
-        if move.tc == 6:
-            rook_fr, rook_fc, rook_tr, rook_tc = move.fr, 7, move.tr, 5
-        elif move.tc == 2:
-            rook_fr, rook_fc, rook_tr, rook_tc = move.fr, 0, move.tr, 3
-        if rook_fr != -1:
-            BOARD[rook_tr][rook_tc] = BOARD[rook_fr][rook_fc]
-            BOARD[rook_fr][rook_fc] = '.'
+    make_move(move)
+    in_check_after = in_check(side)
+    unmake_move()
+    return in_check_after
 
-    opponent = 'black' if side == 'white' else 'white'
-    king_row, king_col = find_king(side)
-    in_check = king_row >= 0 and is_square_attacked(king_row, king_col, opponent)
 
-    BOARD[move.fr][move.fc] = src_piece
-    BOARD[move.tr][move.tc] = dst_piece
-    if ep_capture_piece != '.':
-        BOARD[ep_capture_row][ep_capture_col] = ep_capture_piece
-    if rook_fr != -1:
-        BOARD[rook_fr][rook_fc] = BOARD[rook_tr][rook_tc]
-        BOARD[rook_tr][rook_tc] = '.'
-    return in_check
+def piece_move_fields(turn, sq):
+    """Protocol fields ``tr tc is_capture is_promotion`` of every legal move
+    of the piece on *sq*."""
+    piece = BOARD[sq]
+    moves = []
+    add_piece_moves(turn, sq, moves)
+    moves.sort(key=lambda move: move.dst)
+    ep_sq = en_passant_square()
+    fields = []
+    for move in moves:
+        if leaves_king_in_check(move, turn):
+            continue
+        is_ep_capture = piece.lower() == 'p' and move.tc != sq % 8 and move.dst == ep_sq
+        is_capture = 1 if is_ep_capture or not is_empty(BOARD[move.dst]) else 0
+        is_promotion = 1 if move.promo_piece != NO_PROMOTION else 0
+        fields.append([str(move.tr), str(move.tc), str(is_capture), str(is_promotion)])
+    return fields
 
 
 def handle_moves(turn, row, col):
-    piece = BOARD[row][col]
-    if is_empty(piece) or color_of(piece) != turn:
+    sq = row * 8 + col
+    if BOARD[sq] not in SIDE_PIECES[turn]:
         print('MOVES')
         return
 
     output = ['MOVES']
-    for tr in range(8):
-        for tc in range(8):
-            if validate_move(turn, row, col, tr, tc, True):
-                move = Move(
-                    fr=row,
-                    fc=col,
-                    tr=tr,
-                    tc=tc,
-                    promo_piece=('Q' if is_white(piece) else 'q') if is_promotion_move(piece, tr) else NO_PROMOTION,
-                )
-                if leaves_king_in_check(move, turn):
-                    continue
-
-                is_ep_capture = piece.lower() == 'p' and col != tc and tr == EN_PASSANT_R and tc == EN_PASSANT_C
-                is_capture = 1 if is_ep_capture or not is_empty(BOARD[tr][tc]) else 0
-                is_promotion = 1 if is_promotion_move(piece, tr) else 0
-                output.extend([str(tr), str(tc), str(is_capture), str(is_promotion)])
+    for fields in piece_move_fields(turn, sq):
+        output.extend(fields)
+    print(' '.join(output))
 
+
+def handle_legal(turn):
+    output = ['LEGAL']
+    for sq in range(64):
+        if BOARD[sq] in SIDE_PIECES[turn]:
+            for fields in piece_move_fields(turn, sq):
+                output.extend([str(sq // 8), str(sq % 8), *fields])
     print(' '.join(output))
 
 
 def handle_promote(turn, fr, fc, tr, tc, promo_piece):
-    piece = BOARD[fr][fc]
+    piece = BOARD[fr * 8 + fc]
     if is_empty(piece) or color_of(piece) != turn or piece.lower() != 'p':
         print('INVALID Not a pawn')
         return
@@ -352,20 +392,17 @@ def handle_promote(turn, fr, fc, tr, tc, promo_piece):
         print('INVALID Not a promotion square')
         return
 
-    BOARD[tr][tc] = resolve_promotion(piece, promo_piece)
-    BOARD[fr][fc] = '.'
+    BOARD[tr * 8 + tc] = resolve_promotion(piece, promo_piece)
+    BOARD[fr * 8 + fc] = '.'
     print(f'PROMOTE {serialize_board()}')
 
 
+PIECE_VALUES = {'p': 100, 'n': 320, 'b': 330, 'r': 500, 'q': 900, 'k': 20000}
+PIECE_VALUES.update({kind.upper(): value for kind, value in PIECE_VALUES.items()})
+
+
 def piece_value(piece):
-    return {
-        'p': 100,
-        'n': 320,
-        'b': 330,
-        'r': 500,
-        'q': 900,
-        'k': 20000,
-    }.get(piece.lower(), 0)
+    return PIECE_VALUES.get(piece, 0)
 
 
 PAWN_TABLE = (
@@ -440,7 +477,9 @@ KING_ENDGAME_TABLE = (
 )
 
 
-def positional_bonus(piece, row, col, is_endgame=False):
+def _build_square_tables(is_endgame):
+    """Material plus positional bonus for every piece letter and square,
+    signed from white's point of view."""
     lookup = {
         'p': PAWN_TABLE,
         'n': KNIGHT_TABLE,
@@ -449,239 +488,642 @@ def positional_bonus(piece, row, col, is_endgame=False):
         'q': QUEEN_TABLE,
         'k': KING_ENDGAME_TABLE if is_endgame else KING_MIDDLE_TABLE,
     }
-    mirrored_row = row if is_white(piece) else 7 - row
-    table = lookup.get(piece.lower())
-    return table[mirrored_row][col] if table else 0
+    tables = {}
+    for kind, table in lookup.items():
+        value = PIECE_VALUES[kind]
+        tables[kind.upper()] = [value + table[sq // 8][sq % 8] for sq in range(64)]
+        tables[kind] = [-(value + table[7 - sq // 8][sq % 8]) for sq in range(64)]
+    return tables
+
+
+SQUARE_VALUES = {False: _build_square_tables(False), True: _build_square_tables(True)}
 
 
 def evaluate():
-    score = 0
-    queen_count = 0
-    minor_count = 0
+    board = BOARD
+    queen_count = board.count('Q') + board.count('q')
+    minor_count = board.count('N') + board.count('n') + board.count('B') + board.count('b')
+    tables = SQUARE_VALUES[queen_count == 0 or minor_count <= 6]
 
-    for row in range(8):
-        for col in range(8):
-            piece = BOARD[row][col]
-            if is_empty(piece):
-                continue
-            type_ = piece.lower()
-            if type_ == 'q':
-                queen_count += 1
-            elif type_ in ('n', 'b'):
-                minor_count += 1
-
-    is_endgame = (queen_count == 0 or minor_count <= 6)
-
-    for row in range(8):
-        for col in range(8):
-            piece = BOARD[row][col]
-            if is_empty(piece):
-                continue
-            value = piece_value(piece) + positional_bonus(piece, row, col, is_endgame)
-            score += value if is_white(piece) else -value
+    score = 0
+    for sq, piece in enumerate(board):
+        if piece != '.':
+            score += tables[piece][sq]
     return score
 
 
 def generate_moves(side):
     moves = []
-    for row in range(8):
-        for col in range(8):
-            piece = BOARD[row][col]
-            if is_empty(piece) or color_of(piece) != side:
-                continue
-            for tr in range(8):
-                for tc in range(8):
-                    if validate_move(side, row, col, tr, tc, True):
-                        moves.append(
-                            Move(
-                                fr=row,
-                                fc=col,
-                                tr=tr,
-                                tc=tc,
-                                promo_piece=('Q' if is_white(piece) else 'q') if is_promotion_move(piece, tr) else NO_PROMOTION,
-                            )
-                        )
+    own = SIDE_PIECES[side]
+    for sq, piece in enumerate(BOARD):
+        if piece in own:
+            add_piece_moves(side, sq, moves)
     return moves
 
 
+def least_valuable_attacker(square, color):
+    """Square of *color*'s cheapest piece attacking *square*, or -1."""
+    board = BOARD
+    knight, king, pawn, rook, bishop, queen = ATTACKER_LETTERS[color]
+    for sq in PAWN_ATTACKERS[color][square]:
+        if board[sq] == pawn:
+            return sq
+    for sq in KNIGHT_TARGETS[square]:
+        if board[sq] == knight:
+            return sq
+    queen_sq = -1
+    for rays, slider in ((BISHOP_RAYS, bishop), (ROOK_RAYS, rook)):
+        for ray in rays[square]:
+            for sq in ray:
+                piece = board[sq]
+                if piece != '.':
+                    if piece == slider:
+                        return sq
+                    if piece == queen:
+                        queen_sq = sq
+                    break
+    if queen_sq >= 0:
+        return queen_sq
+    for sq in KING_TARGETS[square]:
+        if board[sq] == king:
+            return sq
+    return -1
+
+
+def see(move):
+    """Static exchange evaluation of the capture *move*.
+
+    Plays out the recaptures on the target square, each side using its
+    least valuable attacker and stopping as soon as recapturing no longer
+    pays, and returns the material won from the mover's point of view.
+    Pieces are lifted off the board as they capture so x-ray attackers
+    join in; pins are ignored.
+    """
+    board = BOARD
+    dst = move.dst
+    attacker = board[move.src]
+    gains = [PIECE_VALUES[board[dst]]]
+    occupant = PIECE_VALUES[move.promo_piece if move.promo_piece != NO_PROMOTION else attacker]
+    lifted = [(move.src, attacker)]
+    board[move.src] = '.'
+    color = 'black' if attacker in WHITE_PIECES else 'white'
+    while True:
+        sq = least_valuable_attacker(dst, color)
+        if sq < 0:
+            break
+        gains.append(occupant - gains[-1])
+        occupant = PIECE_VALUES[board[sq]]
+        lifted.append((sq, board[sq]))
+        board[sq] = '.'
+        color = 'black' if color == 'white' else 'white'
+    for sq, piece in lifted:
+        board[sq] = piece
+
+    for index in range(len(gains) - 1, 0, -1):
+        gains[index - 1] = -max(-gains[index - 1], gains[index])
+    return gains[0]
+
+
+def capture_score(move):
+    """Exchange value of a capture; only computed when the capturing
+    piece is worth more than its victim, as otherwise it cannot lose."""
+    board = BOARD
+    victim = PIECE_VALUES[board[move.dst]]
+    if PIECE_VALUES[board[move.src]] <= victim:
+        return victim
+    return see(move)
+
+
 def order_moves(moves):
+    board = BOARD
+
     def move_score(move):
         score = 0
-        if not is_empty(BOARD[move.tr][move.tc]):
-            score += piece_value(BOARD[move.tr][move.tc]) + 1000
+        target = board[move.dst]
+        if target != '.':
+            # Winning and even captures first, by victim; losing ones
+            # after the quiet moves
+            if capture_score(move) >= 0:
+                score += PIECE_VALUES[target] + 1000
+            else:
+                score -= 1000
         if move.promo_piece != NO_PROMOTION:
             score += 900
-        return score
+        # Ties keep board order: lowest source square, then destination
+        return score * 4096 + 4095 - (move.src * 64 + move.dst)
 
     moves.sort(key=move_score, reverse=True)
 
 
-def minimax(depth, alpha, beta, maximizing):
-    global W_K_CASTLE, W_Q_CASTLE, B_K_CASTLE, B_Q_CASTLE
-    if depth == 0:
-        return evaluate()
+# Endgame bitbases (see game/bitbase.py for the format).  One bit per
+# position says whether the side with the extra piece wins; the strong
+# side is normalised to white and squares are row * 8 + col.
+BITBASE_DIR = os.path.dirname(os.path.abspath(__file__))
+BITBASE_TABLES = {}
+BITBASE_SIDE = 64 * 64 * 64
+BITBASE_WIN = 10000
 
-    side = 'white' if maximizing else 'black'
-    moves = generate_moves(side)
-    order_moves(moves)
-    legal_moves = [move for move in moves if not leaves_king_in_check(move, side)]
+
+def load_bitbase(name):
+    if name not in BITBASE_TABLES:
+        try:
+            with open(os.path.join(BITBASE_DIR, name + '.bb'), 'rb') as fh:
+                data = fh.read()
+        except OSError:
+            data = None
+        BITBASE_TABLES[name] = data if data and len(data) == BITBASE_SIDE // 4 else None
+    return BITBASE_TABLES[name]
+
+
+def bitbase_mop_up(kind, wk, piece, bk):
+    """Progress bonus for a won ending, strong side as white.
+
+    Pawn endings reward pushing the pawn and escorting it with the king.
+    Queen and rook endings shrink the box the piece confines the lone king
+    to, push that king to the edge and bring the kings together.
+    """
+    wr, wc = divmod(wk, 8)
+    br, bc = divmod(bk, 8)
+    pr, pc = divmod(piece, 8)
+    if kind == 'p':
+        return 20 * (6 - pr) + 4 * (7 - max(abs(wr - pr + 1), abs(wc - pc)))
+    rows = pr if br < pr else 7 - pr if br > pr else 8
+    cols = pc if bc < pc else 7 - pc if bc > pc else 8
+    edge = max(3 - br, br - 4) + max(3 - bc, bc - 4)
+    return 2 * (64 - rows * cols) + 10 * edge + 4 * (14 - abs(wr - br) - abs(wc - bc))
+
+
+def probe_bitbase(side):
+    """Score a KQK/KRK/KPK position from the bitbases, white-positive.
+
+    Returns None when the position is not covered (more material, castling
+    rights, or the table file is missing), 0 for a draw, and
+    +/-(BITBASE_WIN + mop-up) for a win.
+    """
+    if W_K_CASTLE or W_Q_CASTLE or B_K_CASTLE or B_Q_CASTLE:
+        return None
+    if 64 - BOARD.count('.') != 3:
+        return None
+    squares = {}
+    for sq, piece in enumerate(BOARD):
+        if piece != '.':
+            if piece in squares:
+                return None
+            squares[piece] = sq
+    extra = [piece for piece in squares if piece not in 'Kk']
+    if len(extra) != 1 or 'K' not in squares or 'k' not in squares or extra[0].lower() not in 'qrp':
+        return None
+    piece = extra[0]
+    kind = piece.lower()
+    bits = load_bitbase('k' + kind + 'k')
+    if bits is None:
+        return None
+
+    strong = 'white' if is_white(piece) else 'black'
+    wk, ps, bk = squares['K'], squares[piece], squares['k']
+    if strong == 'black':
+        wk, ps, bk = bk ^ 56, ps ^ 56, wk ^ 56
+    index = (0 if side == strong else BITBASE_SIDE) + wk * 4096 + ps * 64 + bk
+    if not (bits[index >> 3] >> (index & 7)) & 1:
+        return 0
+    score = BITBASE_WIN + piece_value(kind) + bitbase_mop_up(kind, wk, ps, bk)
+    return score if strong == 'white' else -score
+
+
+# Zobrist keys, generated exactly as in game/zobrist.py so hashes match
+# the rest of Checkora: 12 x 64 piece-square keys (pieces PNBRQKpnbrqk),
+# the black-to-move key, four castling keys (KQkq) and eight en-passant
+# file keys.  The en-passant file only counts when the side to move has a
+# pawn that can capture there.
+def _zobrist_keys():
+    mask = 0xFFFFFFFFFFFFFFFF
+    state = 0x436865636B6F7261
+    keys = []
+    for _ in range(12 * 64 + 1 + 4 + 8):
+        state = (state + 0x9E3779B97F4A7C15) & mask
+        z = state
+        z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & mask
+        z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & mask
+        keys.append(z ^ (z >> 31))
+    return keys
+
+
+_KEYS = _zobrist_keys()
+PIECE_KEYS = {piece: _KEYS[index * 64:(index + 1) * 64] for index, piece in enumerate('PNBRQKpnbrqk')}
+SIDE_KEY = _KEYS[12 * 64]
+CASTLING_KEYS = _KEYS[12 * 64 + 1:12 * 64 + 5]
+EP_FILE_KEYS = _KEYS[12 * 64 + 5:]
+
+# Hash of the current position, kept up to date by make_move/unmake_move
+# once a search has set it with position_hash().  HISTORY holds the hashes
+# of the game and search path up to and including the current position,
+# HALFMOVE_CLOCK the plies since the last capture or pawn move.
+HASH = 0
+HISTORY = []
+HALFMOVE_CLOCK = 0
+UNDO_STACK = []
+
+
+def load_history(halfmove_clock, hashes):
+    global HALFMOVE_CLOCK
+    HALFMOVE_CLOCK = halfmove_clock
+    HISTORY[:] = hashes
+
+
+def castling_hash():
+    h = 0
+    if W_K_CASTLE: h ^= CASTLING_KEYS[0]
+    if W_Q_CASTLE: h ^= CASTLING_KEYS[1]
+    if B_K_CASTLE: h ^= CASTLING_KEYS[2]
+    if B_Q_CASTLE: h ^= CASTLING_KEYS[3]
+    return h
+
+
+def en_passant_capturable(side):
+    ep_sq = en_passant_square()
+    if ep_sq < 0:
+        return False
+    pawn = 'P' if side == 'white' else 'p'
+    return any(BOARD[sq] == pawn for sq in PAWN_ATTACKERS[side][ep_sq])
+
+
+def position_hash(side):
+    h = SIDE_KEY if side == 'black' else 0
+    for sq, piece in enumerate(BOARD):
+        if piece != '.':
+            h ^= PIECE_KEYS[piece][sq]
+    h ^= castling_hash()
+    if en_passant_capturable(side):
+        h ^= EP_FILE_KEYS[EN_PASSANT_C]
+    return h
+
+
+def make_move(move):
+    """Apply *move* to BOARD, the rights globals, HASH, HISTORY and the
+    halfmove clock.
+
+    Everything needed to take it back is pushed onto UNDO_STACK; every
+    make_move must be paired with an unmake_move.
+    """
+    global W_K_CASTLE, W_Q_CASTLE, B_K_CASTLE, B_Q_CASTLE, EN_PASSANT_R, EN_PASSANT_C
+    global HASH, HALFMOVE_CLOCK
+    board = BOARD
+    src, dst = move.src, move.dst
+    src_piece = board[src]
+    dst_piece = board[dst]
+    UNDO_STACK.append((move, src_piece, dst_piece, W_K_CASTLE, W_Q_CASTLE, B_K_CASTLE,
+                       B_Q_CASTLE, EN_PASSANT_R, EN_PASSANT_C, HASH, HALFMOVE_CLOCK))
+
+    mover = 'white' if src_piece in WHITE_PIECES else 'black'
+    h = HASH ^ SIDE_KEY
+    if EN_PASSANT_R >= 0:
+        if en_passant_capturable(mover):
+            h ^= EP_FILE_KEYS[EN_PASSANT_C]
+        EN_PASSANT_R, EN_PASSANT_C = -1, -1
+
+    placed = move.promo_piece if move.promo_piece != NO_PROMOTION else src_piece
+    h ^= PIECE_KEYS[src_piece][src] ^ PIECE_KEYS[placed][dst]
+    if dst_piece != '.':
+        h ^= PIECE_KEYS[dst_piece][dst]
+    board[dst] = placed
+    board[src] = '.'
+    HALFMOVE_CLOCK = 0 if dst_piece != '.' else HALFMOVE_CLOCK + 1
+
+    if src_piece == 'P' or src_piece == 'p':
+        HALFMOVE_CLOCK = 0
+        if dst_piece == '.' and (src & 7) != (dst & 7):
+            captured = (src & ~7) | (dst & 7)
+            h ^= PIECE_KEYS[board[captured]][captured]
+            board[captured] = '.'
+        elif abs(dst - src) == 16:
+            EN_PASSANT_R, EN_PASSANT_C = (src + dst) >> 4, src & 7
+            if en_passant_capturable('black' if mover == 'white' else 'white'):
+                h ^= EP_FILE_KEYS[src & 7]
+    elif (src_piece == 'K' or src_piece == 'k') and abs(dst - src) == 2:
+        rook_from, rook_to = (src + 3, src + 1) if dst > src else (src - 4, src - 1)
+        rook = board[rook_from]
+        h ^= PIECE_KEYS[rook][rook_from] ^ PIECE_KEYS[rook][rook_to]
+        board[rook_to] = rook
+        board[rook_from] = '.'
+
+    if src_piece == 'K' or src_piece == 'k' or src in CASTLING_CORNERS or dst in CASTLING_CORNERS:
+        h ^= castling_hash()
+        if src_piece == 'K':
+            W_K_CASTLE = W_Q_CASTLE = False
+        elif src_piece == 'k':
+            B_K_CASTLE = B_Q_CASTLE = False
+        for sq in (src, dst):
+            if sq == 56: W_Q_CASTLE = False
+            elif sq == 63: W_K_CASTLE = False
+            elif sq == 0: B_Q_CASTLE = False
+            elif sq == 7: B_K_CASTLE = False
+        h ^= castling_hash()
+    HASH = h
+    HISTORY.append(h)
+
+
+def unmake_move():
+    """Take back the last move applied by make_move."""
+    global W_K_CASTLE, W_Q_CASTLE, B_K_CASTLE, B_Q_CASTLE, EN_PASSANT_R, EN_PASSANT_C
+    global HASH, HALFMOVE_CLOCK
+    (move, src_piece, dst_piece, W_K_CASTLE, W_Q_CASTLE, B_K_CASTLE, B_Q_CASTLE,
+     EN_PASSANT_R, EN_PASSANT_C, HASH, HALFMOVE_CLOCK) = UNDO_STACK.pop()
+    HISTORY.pop()
+    board = BOARD
+    src, dst = move.src, move.dst
+
+    board[src] = src_piece
+    board[dst] = dst_piece
+    if src_piece == 'P' or src_piece == 'p':
+        if dst_piece == '.' and (src & 7) != (dst & 7):
+            board[(src & ~7) | (dst & 7)] = 'p' if src_piece == 'P' else 'P'
+    elif (src_piece == 'K' or src_piece == 'k') and abs(dst - src) == 2:
+        rook_from, rook_to = (src + 3, src + 1) if dst > src else (src - 4, src - 1)
+        board[rook_from] = board[rook_to]
+        board[rook_to] = '.'
+
+
+INFINITY = 10 ** 9
+MATE_VALUE = 99999
+# Scores beyond this are forced mates rather than material
+MATE_BOUND = 90000
+
+# Transposition table: slot -> (key, depth, flag, value, best move as
+# src * 64 + dst).  At most TT_SIZE slots are used; a slot is only
+# overwritten by a search at least as deep as the one already stored.
+TT_SIZE = 1 << 18
+TT_EXACT, TT_LOWER, TT_UPPER = 0, 1, 2
+TT = {}
+
+
+def tt_store(depth, flag, value, move):
+    slot = HASH & (TT_SIZE - 1)
+    entry = TT.get(slot)
+    if entry is None or depth >= entry[1]:
+        # Mates are stored relative to this node so they can be reused at
+        # another remaining depth
+        if value > MATE_BOUND:
+            value -= depth
+        elif value < -MATE_BOUND:
+            value += depth
+        TT[slot] = (HASH, depth, flag, value, move.src * 64 + move.dst)
+
+
+# Quiescence limits, as in main.cpp: plies searched past the horizon, and
+# the margin by which winning a capture's victim outright must still miss
+# alpha before the capture is skipped (delta pruning)
+QUIESCE_MAX_PLY = 6
+QUIESCE_DELTA = 200
+
+
+def quiesce(side, alpha, beta, ply=0):
+    """Resolve captures at the horizon so the static evaluation is not
+    taken in the middle of an exchange.  The side to move may stand pat;
+    captures that lose material by SEE or cannot reach alpha even with
+    QUIESCE_DELTA to spare are not searched, and nothing is searched
+    past QUIESCE_MAX_PLY."""
+    sign = 1 if side == 'white' else -1
+    best_value = sign * evaluate()
+    if best_value >= beta:
+        return best_value
+    if best_value > alpha:
+        alpha = best_value
+    if ply >= QUIESCE_MAX_PLY:
+        return best_value
+
+    board = BOARD
+    captures = []
+    for move in generate_moves(side):
+        if board[move.dst] != '.':
+            swing = PIECE_VALUES[board[move.dst]] + QUIESCE_DELTA
+            if move.promo_piece != NO_PROMOTION:
+                swing += PIECE_VALUES['q'] - PIECE_VALUES['p']
+            if best_value + swing <= alpha:
+                continue
+            gain = capture_score(move)
+            if gain >= 0:
+                captures.append((gain, PIECE_VALUES[board[move.dst]], move))
+    captures.sort(key=lambda item: (item[0], item[1]), reverse=True)
+
+    opponent = 'black' if side == 'white' else 'white'
+    for _, _, move in captures:
+        if leaves_king_in_check(move, side):
+            continue
+        make_move(move)
+        value = -quiesce(opponent, -beta, -alpha, ply + 1)
+        unmake_move()
+        if value > best_value:
+            best_value = value
+            if value > alpha:
+                alpha = value
+                if alpha >= beta:
+                    break
+    return best_value
+
+
+def is_repetition():
+    """True if the current position already occurred, with the same side
+    to move, since the last capture or pawn move."""
+    last = len(HISTORY) - 1
+    for index in range(last - 4, max(last - HALFMOVE_CLOCK, 0) - 1, -2):
+        if HISTORY[index] == HASH:
+            return True
+    return False
+
+
+def negamax(side, depth, alpha, beta):
+    """Alpha-beta search returning the score from *side*'s point of view."""
+    # A repeated position is a draw, and so is the fifty-move rule unless
+    # the last move mated
+    if is_repetition() or (HALFMOVE_CLOCK >= 100
+                           and not (in_check(side) and not legal_moves_for(side))):
+        return 0
+
+    sign = 1 if side == 'white' else -1
+    known = probe_bitbase(side)
+    # Drawn endings need no search; won ones are searched on so mates are
+    # found, with the mop-up score standing in for evaluate() at the horizon.
+    if known == 0:
+        return 0
+
+    if depth == 0:
+        return sign * known if known is not None else quiesce(side, alpha, beta)
+
+    hash_move = -1
+    entry = TT.get(HASH & (TT_SIZE - 1))
+    if entry is not None and entry[0] == HASH:
+        hash_move = entry[4]
+        if entry[1] >= depth:
+            value = entry[3]
+            if value > MATE_BOUND:
+                value += depth
+            elif value < -MATE_BOUND:
+                value -= depth
+            flag = entry[2]
+            if (flag == TT_EXACT or (flag == TT_LOWER and value >= beta)
+                    or (flag == TT_UPPER and value <= alpha)):
+                return value
+
+    legal_moves = legal_moves_for(side)
 
     if not legal_moves:
-        opponent = 'black' if maximizing else 'white'
-        king_row, king_col = find_king(side)
-        if king_row >= 0 and is_square_attacked(king_row, king_col, opponent):
-            return -99999 + (100 - depth) if maximizing else 99999 - (100 - depth)
+        if in_check(side):
+            return -MATE_VALUE + (100 - depth)
         return 0
 
-    if maximizing:
-        best_value = -(10 ** 9)
-        for move in legal_moves:
-            src_piece = BOARD[move.fr][move.fc]
-            dst_piece = BOARD[move.tr][move.tc]
-            BOARD[move.tr][move.tc] = move.promo_piece if move.promo_piece != NO_PROMOTION else src_piece
-            BOARD[move.fr][move.fc] = '.'
-
-            ep_r, ep_c, ep_cap = -1, -1, '.'
-            if src_piece.lower() == 'p' and move.fc != move.tc and dst_piece == '.':
-                ep_r, ep_c = move.fr, move.tc
-                ep_cap = BOARD[ep_r][ep_c]
-                BOARD[ep_r][ep_c] = '.'
-
-            rook_fr, rook_fc, rook_tr, rook_tc = -1, -1, -1, -1
-            if src_piece.lower() == 'k' and abs(move.tc - move.fc) == 2:
-                if move.tc == 6:
-                    rook_fr, rook_fc, rook_tr, rook_tc = move.fr, 7, move.tr, 5
-                elif move.tc == 2:
-                    rook_fr, rook_fc, rook_tr, rook_tc = move.fr, 0, move.tr, 3
-                if rook_fr != -1:
-                    BOARD[rook_tr][rook_tc] = BOARD[rook_fr][rook_fc]
-                    BOARD[rook_fr][rook_fc] = '.'
-
-            old_wk, old_wq = W_K_CASTLE, W_Q_CASTLE
-            old_bk, old_bq = B_K_CASTLE, B_Q_CASTLE
-
-            if src_piece == 'K': W_K_CASTLE = W_Q_CASTLE = False
-            if src_piece == 'k': B_K_CASTLE = B_Q_CASTLE = False
-            if src_piece == 'R':
-                if move.fr == 7 and move.fc == 0: W_Q_CASTLE = False
-                if move.fr == 7 and move.fc == 7: W_K_CASTLE = False
-            if src_piece == 'r':
-                if move.fr == 0 and move.fc == 0: B_Q_CASTLE = False
-                if move.fr == 0 and move.fc == 7: B_K_CASTLE = False
-            if dst_piece == 'R':
-                if move.tr == 7 and move.tc == 0: W_Q_CASTLE = False
-                if move.tr == 7 and move.tc == 7: W_K_CASTLE = False
-            if dst_piece == 'r':
-                if move.tr == 0 and move.tc == 0: B_Q_CASTLE = False
-                if move.tr == 0 and move.tc == 7: B_K_CASTLE = False
-
-            value = minimax(depth - 1, alpha, beta, False)
-
-            W_K_CASTLE, W_Q_CASTLE = old_wk, old_wq
-            B_K_CASTLE, B_Q_CASTLE = old_bk, old_bq
-
-            if ep_r != -1:
-                BOARD[ep_r][ep_c] = ep_cap
-
-            BOARD[move.fr][move.fc] = src_piece
-            BOARD[move.tr][move.tc] = dst_piece
-            if rook_fr != -1:
-                BOARD[rook_fr][rook_fc] = BOARD[rook_tr][rook_tc]
-                BOARD[rook_tr][rook_tc] = '.'
-
-            best_value = max(best_value, value)
-            alpha = max(alpha, value)
-            if beta <= alpha:
+    if hash_move >= 0:
+        for index, move in enumerate(legal_moves):
+            if move.src * 64 + move.dst == hash_move:
+                legal_moves.insert(0, legal_moves.pop(index))
                 break
-        return best_value
 
-    best_value = 10 ** 9
+    opponent = 'black' if side == 'white' else 'white'
+    original_alpha = alpha
+    best_value = -INFINITY
+    best_move = legal_moves[0]
     for move in legal_moves:
-        src_piece = BOARD[move.fr][move.fc]
-        dst_piece = BOARD[move.tr][move.tc]
-        BOARD[move.tr][move.tc] = move.promo_piece if move.promo_piece != NO_PROMOTION else src_piece
-        BOARD[move.fr][move.fc] = '.'
-
-        ep_r, ep_c, ep_cap = -1, -1, '.'
-        if src_piece.lower() == 'p' and move.fc != move.tc and dst_piece == '.':
-            ep_r, ep_c = move.fr, move.tc
-            ep_cap = BOARD[ep_r][ep_c]
-            BOARD[ep_r][ep_c] = '.'
-
-        rook_fr, rook_fc, rook_tr, rook_tc = -1, -1, -1, -1
-        if src_piece.lower() == 'k' and abs(move.tc - move.fc) == 2:
-            if move.tc == 6:
-                rook_fr, rook_fc, rook_tr, rook_tc = move.fr, 7, move.tr, 5
-            elif move.tc == 2:
-                rook_fr, rook_fc, rook_tr, rook_tc = move.fr, 0, move.tr, 3
-            if rook_fr != -1:
-                BOARD[rook_tr][rook_tc] = BOARD[rook_fr][rook_fc]
-                BOARD[rook_fr][rook_fc] = '.'
-
-        old_wk, old_wq = W_K_CASTLE, W_Q_CASTLE
-        old_bk, old_bq = B_K_CASTLE, B_Q_CASTLE
-
-        if src_piece == 'K': W_K_CASTLE = W_Q_CASTLE = False
-        if src_piece == 'k': B_K_CASTLE = B_Q_CASTLE = False
-        if src_piece == 'R':
-            if move.fr == 7 and move.fc == 0: W_Q_CASTLE = False
-            if move.fr == 7 and move.fc == 7: W_K_CASTLE = False
-        if src_piece == 'r':
-            if move.fr == 0 and move.fc == 0: B_Q_CASTLE = False
-            if move.fr == 0 and move.fc == 7: B_K_CASTLE = False
-        if dst_piece == 'R':
-            if move.tr == 7 and move.tc == 0: W_Q_CASTLE = False
-            if move.tr == 7 and move.tc == 7: W_K_CASTLE = False
-        if dst_piece == 'r':
-            if move.tr == 0 and move.tc == 0: B_Q_CASTLE = False
-            if move.tr == 0 and move.tc == 7: B_K_CASTLE = False
-
-        value = minimax(depth - 1, alpha, beta, True)
-
-        W_K_CASTLE, W_Q_CASTLE = old_wk, old_wq
-        B_K_CASTLE, B_Q_CASTLE = old_bk, old_bq
-
-        if ep_r != -1:
-            BOARD[ep_r][ep_c] = ep_cap
-
-        BOARD[move.fr][move.fc] = src_piece
-        BOARD[move.tr][move.tc] = dst_piece
-        if rook_fr != -1:
-            BOARD[rook_fr][rook_fc] = BOARD[rook_tr][rook_tc]
-            BOARD[rook_tr][rook_tc] = '.'
-
-        best_value = min(best_value, value)
-        beta = min(beta, value)
-        if beta <= alpha:
-            break
+        make_move(move)
+        value = -negamax(opponent, depth - 1, -beta, -alpha)
+        unmake_move()
+        if value > best_value:
+            best_value = value
+            best_move = move
+            if value > alpha:
+                alpha = value
+                if alpha >= beta:
+                    break
+
+    if best_value <= original_alpha:
+        flag = TT_UPPER
+    elif best_value >= beta:
+        flag = TT_LOWER
+    else:
+        flag = TT_EXACT
+    tt_store(depth, flag, best_value, best_move)
     return best_value
 
 
+def legal_moves_for(side):
+    moves = generate_moves(side)
+    order_moves(moves)
+    return [move for move in moves if not leaves_king_in_check(move, side)]
+
+
+def in_check(side):
+    king = find_king(side)
+    return king >= 0 and is_square_attacked(king, 'black' if side == 'white' else 'white')
+
+
+# Budget for the mate search run before every BESTMOVE; 0 means unlimited.
+MATE_SHORTCUT_MOVES = 3
+MATE_SHORTCUT_NODES = 1000
+MATE_NODE_LIMIT = 0
+MATE_NODES = 0
+
+
+def mate_search(side, plies):
+    """Return the moves of a forced mate for *side* within *plies*, or None.
+
+    Only checking moves are tried for the attacker, so every defending
+    node is in check and has few replies.  The defender's longest
+    resistance is returned as the main line.  Gives up (None) once
+    MATE_NODE_LIMIT move generations have been spent.
+    """
+    global MATE_NODES
+    opponent = 'black' if side == 'white' else 'white'
+    MATE_NODES += 1
+    if MATE_NODE_LIMIT and MATE_NODES > MATE_NODE_LIMIT:
+        return None
+    for move in legal_moves_for(side):
+        make_move(move)
+        line = None
+        if in_check(opponent):
+            MATE_NODES += 1
+            replies = legal_moves_for(opponent)
+            if not replies:
+                line = [move]
+            elif plies >= 3:
+                longest = []
+                for reply in replies:
+                    make_move(reply)
+                    rest = mate_search(side, plies - 2)
+                    unmake_move()
+                    if rest is None:
+                        longest = None
+                        break
+                    if len(rest) + 1 > len(longest):
+                        longest = [reply] + rest
+                if longest:
+                    line = [move] + longest
+        unmake_move()
+        if line:
+            return line
+    return None
+
+
+def find_mate(side, max_moves, node_limit=0):
+    """Shortest checking mate in at most *max_moves* moves, or None."""
+    global MATE_NODES, MATE_NODE_LIMIT
+    MATE_NODES, MATE_NODE_LIMIT = 0, node_limit
+    for moves in range(1, max_moves + 1):
+        line = mate_search(side, 2 * moves - 1)
+        if line:
+            return line
+    return None
+
+
+def handle_mate(turn, max_moves):
+    line = find_mate(turn, max_moves)
+    if not line:
+        print('MATE NONE')
+        return
+    output = ['MATE', str((len(line) + 1) // 2)]
+    for move in line:
+        output.extend([str(move.fr), str(move.fc), str(move.tr), str(move.tc)])
+    print(' '.join(output))
+
+
+def handle_analyze(turn, depth):
+    """Score every legal move at *depth*, from the mover's point of view."""
+    global HASH
+    HASH = position_hash(turn)
+    load_history(0, [HASH])
+    opponent = 'black' if turn == 'white' else 'white'
+    scored = []
+    for move in legal_moves_for(turn):
+        make_move(move)
+        value = -negamax(opponent, depth - 1, -INFINITY, INFINITY)
+        unmake_move()
+        scored.append((value, move))
+    scored.sort(key=lambda item: -item[0])
+
+    output = ['ANALYZE']
+    for score, move in scored:
+        output.extend([str(move.fr), str(move.fc), str(move.tr), str(move.tc), str(score)])
+    print(' '.join(output))
+
+
 def is_insufficient_material():
     """Checks if the current board state is a draw due to insufficient material.
     Simple cases: K vs K, K+N vs K, K+B vs K.
     """
     total_minor = 0
-    for row in range(8):
-        for col in range(8):
-            p = BOARD[row][col]
-            if p == '.':
-                continue
-            type_ = p.lower()
-            if type_ == 'k':
-                continue
-            # If there's a pawn, rook, or queen, checkmate is possible
-            if type_ in ('p', 'r', 'q'):
-                return False
-            total_minor += 1
+    for p in BOARD:
+        if p == '.':
+            continue
+        type_ = p.lower()
+        if type_ == 'k':
+            continue
+        # If there's a pawn, rook, or queen, checkmate is possible
+        if type_ in ('p', 'r', 'q'):
+            return False
+        total_minor += 1
     # Draw if total non-king pieces is 0 or 1
     return total_minor <= 1
 
 
 def handle_status(turn):
-    opponent = 'black' if turn == 'white' else 'white'
-    king_row, king_col = find_king(turn)
-    in_check = king_row >= 0 and is_square_attacked(king_row, king_col, opponent)
+    checked = in_check(turn)
 
     has_legal_move = False
     for move in generate_moves(turn):
@@ -690,10 +1132,10 @@ def handle_status(turn):
             break
 
     if not has_legal_move:
-        print('STATUS CHECKMATE' if in_check else 'STATUS STALEMATE')
+        print('STATUS CHECKMATE' if checked else 'STATUS STALEMATE')
         return
 
-    if in_check:
+    if checked:
         print('STATUS CHECK')
     elif is_insufficient_material():
         print('STATUS DRAW')
@@ -702,77 +1144,33 @@ def handle_status(turn):
 
 
 def handle_bestmove(turn, depth):
-    global W_K_CASTLE, W_Q_CASTLE, B_K_CASTLE, B_Q_CASTLE
-    maximizing = turn == 'white'
-    moves = generate_moves(turn)
-    order_moves(moves)
-    legal_moves = [move for move in moves if not leaves_king_in_check(move, turn)]
+    global HASH
+    HASH = position_hash(turn)
+    if not HISTORY or HISTORY[-1] != HASH:
+        HISTORY.append(HASH)
+    legal_moves = legal_moves_for(turn)
 
     if not legal_moves:
         print('BESTMOVE NONE')
         return
 
+    # A short forced mate beats anything the full-width search can find
+    mate_line = find_mate(turn, MATE_SHORTCUT_MOVES, MATE_SHORTCUT_NODES)
+    if mate_line:
+        move = mate_line[0]
+        print(f'BESTMOVE {move.fr} {move.fc} {move.tr} {move.tc}')
+        return
+
+    opponent = 'black' if turn == 'white' else 'white'
     best_move = legal_moves[0]
-    best_value = -(10 ** 9) if maximizing else 10 ** 9
+    best_value = -INFINITY
 
     for move in legal_moves:
-        src_piece = BOARD[move.fr][move.fc]
-        dst_piece = BOARD[move.tr][move.tc]
-        BOARD[move.tr][move.tc] = move.promo_piece if move.promo_piece != NO_PROMOTION else src_piece
-        BOARD[move.fr][move.fc] = '.'
-
-        ep_r, ep_c, ep_cap = -1, -1, '.'
-        if src_piece.lower() == 'p' and move.fc != move.tc and dst_piece == '.':
-            ep_r, ep_c = move.fr, move.tc
-            ep_cap = BOARD[ep_r][ep_c]
-            BOARD[ep_r][ep_c] = '.'
-
-        rook_fr, rook_fc, rook_tr, rook_tc = -1, -1, -1, -1
-        if src_piece.lower() == 'k' and abs(move.tc - move.fc) == 2:
-            if move.tc == 6:
-                rook_fr, rook_fc, rook_tr, rook_tc = move.fr, 7, move.tr, 5
-            elif move.tc == 2:
-                rook_fr, rook_fc, rook_tr, rook_tc = move.fr, 0, move.tr, 3
-            if rook_fr != -1:
-                BOARD[rook_tr][rook_tc] = BOARD[rook_fr][rook_fc]
-                BOARD[rook_fr][rook_fc] = '.'
-
-        old_wk, old_wq = W_K_CASTLE, W_Q_CASTLE
-        old_bk, old_bq = B_K_CASTLE, B_Q_CASTLE
-
-        if src_piece == 'K': W_K_CASTLE = W_Q_CASTLE = False
-        if src_piece == 'k': B_K_CASTLE = B_Q_CASTLE = False
-        if src_piece == 'R':
-            if move.fr == 7 and move.fc == 0: W_Q_CASTLE = False
-            if move.fr == 7 and move.fc == 7: W_K_CASTLE = False
-        if src_piece == 'r':
-            if move.fr == 0 and move.fc == 0: B_Q_CASTLE = False
-            if move.fr == 0 and move.fc == 7: B_K_CASTLE = False
-        if dst_piece == 'R':
-            if move.tr == 7 and move.tc == 0: W_Q_CASTLE = False
-            if move.tr == 7 and move.tc == 7: W_K_CASTLE = False
-        if dst_piece == 'r':
-            if move.tr == 0 and move.tc == 0: B_Q_CASTLE = False
-            if move.tr == 0 and move.tc == 7: B_K_CASTLE = False
-
-        value = minimax(depth - 1, -(10 ** 9), 10 ** 9, not maximizing)
-
-        W_K_CASTLE, W_Q_CASTLE = old_wk, old_wq
-        B_K_CASTLE, B_Q_CASTLE = old_bk, old_bq
-
-        if ep_r != -1:
-            BOARD[ep_r][ep_c] = ep_cap
-
-        BOARD[move.fr][move.fc] = src_piece
-        BOARD[move.tr][move.tc] = dst_piece
-        if rook_fr != -1:
-            BOARD[rook_fr][rook_fc] = BOARD[rook_tr][rook_tc]
-            BOARD[rook_tr][rook_tc] = '.'
-
-        if maximizing and value > best_value:
-            best_value = value
-            best_move = move
-        if not maximizing and value < best_value:
+        make_move(move)
+        value = -negamax(opponent, depth - 1, -INFINITY, -best_value)
+        unmake_move()
+
+        if value > best_value:
             best_value = value
             best_move = move
 
@@ -808,6 +1206,16 @@ def run():
             load_castling_rights(rights)
             load_en_passant(ep_row, ep_col)
             handle_moves(turn, row, col)
+        elif command == 'LEGAL':
+            board64 = next(tokens)
+            rights = next(tokens)
+            turn = next(tokens)
+            ep_row = int(next(tokens))
+            ep_col = int(next(tokens))
+            load_board(board64)
+            load_castling_rights(rights)
+            load_en_passant(ep_row, ep_col)
+            handle_legal(turn)
         elif command == 'ATTACKED':
             board64 = next(tokens)
             rights = next(tokens)
@@ -816,7 +1224,7 @@ def run():
             col = int(next(tokens))
             load_board(board64)
             load_castling_rights(rights)
-            print('YES' if is_square_attacked(row, col, attacker_color) else 'NO')
+            print('YES' if is_square_attacked(row * 8 + col, attacker_color) else 'NO')
         elif command == 'PROMOTE':
             board64 = next(tokens)
             rights = next(tokens)
@@ -849,10 +1257,35 @@ def run():
             ep_row = int(next(tokens))
             ep_col = int(next(tokens))
             depth = int(next(tokens))
+            halfmove_clock = int(next(tokens))
+            hashes = [int(next(tokens), 16) for _ in range(int(next(tokens)))]
             load_board(board64)
             load_castling_rights(rights)
             load_en_passant(ep_row, ep_col)
+            load_history(halfmove_clock, hashes)
             handle_bestmove(turn, depth)
+        elif command == 'MATE':
+            board64 = next(tokens)
+            rights = next(tokens)
+            turn = next(tokens)
+            ep_row = int(next(tokens))
+            ep_col = int(next(tokens))
+            max_moves = int(next(tokens))
+            load_board(board64)
+            load_castling_rights(rights)
+            load_en_passant(ep_row, ep_col)
+            handle_mate(turn, max_moves)
+        elif command == 'ANALYZE':
+            board64 = next(tokens)
+            rights = next(tokens)
+            turn = next(tokens)
+            ep_row = int(next(tokens))
+            ep_col = int(next(tokens))
+            depth = int(next(tokens))
+            load_board(board64)
+            load_castling_rights(rights)
+            load_en_passant(ep_row, ep_col)
+            handle_analyze(turn, depth)
 
 
 if __name__ == '__main__':
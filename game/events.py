@@ -0,0 +1,149 @@
+"""Notification of game updates.
+
+``GameState.store`` calls ``publish`` once a write is committed, and
+each open event stream or socket holds a ``Subscription`` that wakes it,
+so a connection only reads its game row when the game changed instead
+of on every tick.
+
+``publish`` goes through the backend named by the
+``GAME_EVENTS_BACKEND`` setting.  ``LocalBackend`` only reaches the
+connections of this process; ``PostgresBackend`` shares updates between
+processes through PostgreSQL ``LISTEN``/``NOTIFY``.  Connections also
+re-read their row every so often, to catch writes no backend reported.
+"""
+import asyncio
+import logging
+import select
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+# game id -> open subscriptions for it
+_subscriptions = {}
+
+
+class Subscription:
+    """Interest of one async stream in the updates of one game.
+
+    Must be created inside the event loop that will ``wait`` on it;
+    ``publish`` may be called from any thread.
+    """
+
+    def __init__(self, game_id):
+        self.key = str(game_id)
+        self._loop = asyncio.get_running_loop()
+        self._event = asyncio.Event()
+        with _lock:
+            _subscriptions.setdefault(self.key, set()).add(self)
+
+    def _notify(self):
+        try:
+            self._loop.call_soon_threadsafe(self._event.set)
+        except RuntimeError:
+            pass  # Loop already closed: the stream is gone
+
+    async def wait(self, timeout):
+        """Wait up to *timeout* seconds for an update; True if one came."""
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        self._event.clear()
+        return True
+
+    def close(self):
+        with _lock:
+            subscriptions = _subscriptions.get(self.key)
+            if subscriptions is not None:
+                subscriptions.discard(self)
+                if not subscriptions:
+                    del _subscriptions[self.key]
+
+
+def deliver(game_id):
+    """Wake every subscription of this process to the game *game_id*."""
+    with _lock:
+        subscriptions = list(_subscriptions.get(str(game_id), ()))
+    for subscription in subscriptions:
+        subscription._notify()
+
+
+class LocalBackend:
+    """Deliver updates to the connections of this process only."""
+
+    def publish(self, game_id):
+        deliver(game_id)
+
+
+class PostgresBackend:
+    """Share updates between processes through PostgreSQL.
+
+    ``publish`` sends a ``NOTIFY`` on the default database; a daemon
+    thread per process listens on its own connection and delivers what
+    arrives, including this process's own notifications.  Written for
+    the psycopg2 driver the project installs.
+    """
+    CHANNEL = 'checkora_games'
+    # Seconds between liveness checks of the listening connection, and
+    # before it is reopened after an error
+    POLL_SECONDS = 5
+    RETRY_SECONDS = 5
+
+    def __init__(self):
+        thread = threading.Thread(
+            target=self._listen, name='game-events', daemon=True)
+        thread.start()
+
+    def publish(self, game_id):
+        with connections['default'].cursor() as cursor:
+            cursor.execute(
+                'SELECT pg_notify(%s, %s)', [self.CHANNEL, str(game_id)])
+
+    def _listen(self):
+        while True:
+            try:
+                self._listen_once()
+            except Exception:
+                logger.exception('Game event listener failed; reconnecting')
+            time.sleep(self.RETRY_SECONDS)
+
+    def _listen_once(self):
+        wrapper = connections.create_connection('default')
+        conn = wrapper.get_new_connection(wrapper.get_connection_params())
+        try:
+            conn.autocommit = True
+            with conn.cursor() as cursor:
+                cursor.execute(f'LISTEN {self.CHANNEL}')
+            while True:
+                select.select([conn], [], [], self.POLL_SECONDS)
+                conn.poll()
+                while conn.notifies:
+                    deliver(conn.notifies.pop(0).payload)
+        finally:
+            conn.close()
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """Return this process's backend, created on first use."""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            path = getattr(
+                settings, 'GAME_EVENTS_BACKEND', 'game.events.LocalBackend')
+            _backend = import_string(path)()
+    return _backend
+
+
+def publish(game_id):
+    """Wake every connection subscribed to the game *game_id*."""
+    get_backend().publish(game_id)
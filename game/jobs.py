@@ -0,0 +1,174 @@
+"""Background AI searches.
+
+``submit`` runs the engine search for a game on a bounded thread pool and
+returns a job id straight away, so the web worker that took the request
+is free again.  The job record lives in the Django cache, where any
+process sharing the cache can report on it, and the end of a job is
+published through ``events`` under ``event_key``; the move is only
+played when a client collects it, by a request that checks the game row
+has not changed since the search started.
+
+Once queued, the record is written only by the worker running the job.
+Cancelling it or playing its move sets a separate outcome key with
+``cache.add``, so the first of the two wins and neither can be lost to
+a read-modify-write racing another process.
+"""
+import logging
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import events
+from .admission import EngineBusy
+from .engine import ChessGame
+
+logger = logging.getLogger(__name__)
+
+PENDING = 'pending'
+DONE = 'done'
+APPLIED = 'applied'
+CANCELLED = 'cancelled'
+FAILED = 'failed'
+
+# Seconds a job record is kept: longer than any search
+JOB_TTL = 600
+
+_executor = None
+_executor_lock = threading.Lock()
+# Futures of this process's queued jobs, so they can be dropped unrun
+_futures = {}
+
+
+def _get_executor():
+    """Return the shared pool, created on first use."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'AI_JOB_WORKERS', 2),
+                thread_name_prefix='ai-job',
+            )
+    return _executor
+
+
+def _job_key(job_id):
+    return f'ai-job:{job_id}'
+
+
+def _outcome_key(job_id):
+    return f'ai-job-outcome:{job_id}'
+
+
+def _game_key(game_id):
+    return f'ai-job-game:{game_id}'
+
+
+def event_key(job_id):
+    """Key the end of the job *job_id* is published under (``events``)."""
+    return f'ai-job:{job_id}'
+
+
+def submit(state, depth):
+    """Queue a search for the game stored in *state* and return the job
+    id.  A job already running for the same game is cancelled."""
+    cancel_for_game(state.pk)
+
+    job_id = uuid.uuid4().hex
+    cache.set(_job_key(job_id), {
+        'status': PENDING,
+        'game_id': str(state.pk),
+        'version': state.version,
+        'move': None,
+    }, JOB_TTL)
+    cache.set(_game_key(state.pk), job_id, JOB_TTL)
+
+    future = _get_executor().submit(_run, job_id, state.data, depth)
+    _futures[job_id] = future
+    future.add_done_callback(lambda _: _futures.pop(job_id, None))
+    return job_id
+
+
+def _run(job_id, data, depth):
+    """Search the position in *data* and store the move on the job."""
+    if get(job_id, {}).get('status') != PENDING:
+        return  # Cancelled while queued
+    game = ChessGame.from_dict(data)
+    try:
+        best = game.get_ai_move(depth=depth)
+    except EngineBusy as exc:
+        _update(job_id, status=FAILED, retry_after=exc.retry_after)
+        return
+    except Exception:
+        logger.exception('AI job %s failed', job_id)
+        _update(job_id, status=FAILED)
+        return
+    _update(job_id, status=DONE, move=best, rung=game.ai_rung)
+
+
+def _update(job_id, **fields):
+    """Merge *fields* into a job that is still pending.  Only the job's
+    worker calls this, so the record has no other writer."""
+    record = get(job_id)
+    if record is None or record['status'] != PENDING:
+        return
+    record.update(fields)
+    cache.set(_job_key(job_id), record, JOB_TTL)
+    events.publish(event_key(job_id))
+
+
+def get(job_id, default=None):
+    """Return the job record (a dict with ``status``, ``game_id``,
+    ``version``, ``move`` and, once done, ``rung``; ``retry_after`` when
+    it failed because the engine did not answer), or *default* when it
+    is unknown."""
+    return _with_outcome(
+        cache.get_many([_job_key(job_id), _outcome_key(job_id)]),
+        job_id, default)
+
+
+async def aget(job_id, default=None):
+    """``get`` for async code."""
+    return _with_outcome(
+        await cache.aget_many([_job_key(job_id), _outcome_key(job_id)]),
+        job_id, default)
+
+
+def _with_outcome(values, job_id, default):
+    """The job record in *values*, with the status of its outcome key
+    (cancelled or applied) when one is set."""
+    record = values.get(_job_key(job_id))
+    if record is None:
+        return default
+    outcome = values.get(_outcome_key(job_id))
+    if outcome is not None:
+        record['status'] = outcome
+    return record
+
+
+def mark_applied(job_id):
+    """Record that the job's move was played, unless it was cancelled
+    first."""
+    cache.add(_outcome_key(job_id), APPLIED, JOB_TTL)
+
+
+def cancel(job_id):
+    """Cancel a job that has not finished.  A search already running is
+    left to end, but its move will not be played."""
+    record = get(job_id)
+    if (record is not None and record['status'] in (PENDING, DONE)
+            and cache.add(_outcome_key(job_id), CANCELLED, JOB_TTL)):
+        events.publish(event_key(job_id))
+    future = _futures.pop(job_id, None)
+    if future is not None:
+        future.cancel()
+
+
+def cancel_for_game(game_id):
+    """Cancel the job, if any, searching for the game *game_id*."""
+    job_id = cache.get(_game_key(game_id))
+    if job_id:
+        cancel(job_id)
+        cache.delete(_game_key(game_id))
@@ -0,0 +1,30 @@
+"""Versioned JSON state files written by the management commands.
+
+The position cache and the sidecars of the learned book and puzzle
+mining share one format: a JSON object with a ``version`` that, when it
+does not match, makes the reader start from its defaults.  No Django
+imports, so puzzle-mining workers can use it.
+"""
+import json
+import os
+
+
+def load_json_state(path, defaults):
+    """Read a versioned JSON state file, falling back to *defaults*."""
+    state = dict(defaults)
+    try:
+        with open(path, encoding='utf-8') as fh:
+            stored = json.load(fh)
+    except (OSError, json.JSONDecodeError):
+        return state
+    if isinstance(stored, dict) and stored.get('version') == defaults['version']:
+        state.update(stored)
+    return state
+
+
+def save_json_state(path, state):
+    """Atomically write a JSON state file."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as fh:
+        json.dump(state, fh, separators=(',', ':'), sort_keys=True)
+    os.replace(tmp_path, path)
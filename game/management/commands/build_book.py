@@ -0,0 +1,71 @@
+"""Compile the opening book into the binary, memory-mapped format."""
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from game.engine import ChessGame
+from game.opening_book import write_book
+from game.book_builder import (
+    book_entries_from_json,
+    book_entries_from_pgn,
+    merge_book_entries,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Builds game/engine/opening_book.bin from the curated JSON book '
+        'and any number of PGN files. Every move is checked against the '
+        'engine here, so the AI can play book moves without validating '
+        'them. Moves seen in several sources are weighted by how often '
+        'they occur.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--json', default=ChessGame.OPENING_BOOK_PATH,
+            help='Curated JSON book to include.')
+        parser.add_argument(
+            '--no-json', action='store_true',
+            help='Do not include the curated JSON book.')
+        parser.add_argument(
+            '--pgn', action='append', default=[],
+            help='PGN file to include (may be repeated).')
+        parser.add_argument(
+            '--max-plies', type=int, default=20,
+            help='Only book the first N plies of each PGN game.')
+        parser.add_argument(
+            '--output', default=ChessGame.OPENING_BOOK_BIN_PATH,
+            help='Binary book file to write.')
+
+    def handle(self, *args, **options):
+        entries = {}
+
+        if not options['no_json']:
+            try:
+                with open(options['json'], encoding='utf-8') as fh:
+                    curated = json.load(fh)
+            except (OSError, json.JSONDecodeError) as exc:
+                raise CommandError(f"Cannot read {options['json']}: {exc}")
+            rejected = []
+            merge_book_entries(
+                entries, book_entries_from_json(curated, rejected=rejected))
+            for fen_key, move in rejected:
+                self.stderr.write(
+                    f'Skipping illegal book move {move} in {fen_key}')
+
+        for path in options['pgn']:
+            try:
+                with open(path, encoding='utf-8', errors='replace') as fh:
+                    text = fh.read()
+            except OSError as exc:
+                raise CommandError(f"Cannot read {path}: {exc}")
+            merge_book_entries(
+                entries, book_entries_from_pgn(text, options['max_plies']))
+
+        count = write_book(options['output'], entries)
+        ChessGame._binary_book = None
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {count} moves for {len(entries)} positions '
+            f'to {options["output"]}.'
+        ))
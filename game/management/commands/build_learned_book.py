@@ -0,0 +1,108 @@
+"""Build a weighted opening book from the games played on this site."""
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from game.engine import ChessGame
+from game.models import GameResult
+from game.opening_book import write_book
+from game.book_builder import (
+    book_entries_from_json,
+    load_learned_book_state,
+    merge_book_entries,
+    mine_book_moves,
+    save_learned_book_state,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Learns opening moves from stored GameResult histories and writes '
+        'them, optionally merged with the curated JSON book, to the learned '
+        'opening book, which the AI probes after the one from build_book. '
+        'Move counts are kept in a sidecar file so later runs only replay '
+        'games added since the previous run.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-count', type=int, default=5,
+            help='Minimum number of times a move must have been played.')
+        parser.add_argument(
+            '--max-plies', type=int, default=20,
+            help='Only learn moves from the first N plies of each game.')
+        parser.add_argument(
+            '--include-draws', action='store_true',
+            help='Also learn moves from drawn games (both sides).')
+        parser.add_argument(
+            '--no-curated', action='store_true',
+            help='Do not merge the curated opening_book.json.')
+        parser.add_argument(
+            '--curated-weight', type=int, default=10,
+            help='Weight given to each curated book move.')
+        parser.add_argument(
+            '--state', default=os.path.join(
+                ChessGame.ENGINE_DIR, 'learned_book.json'),
+            help='Sidecar file holding move counts between runs.')
+        parser.add_argument(
+            '--output', default=ChessGame.LEARNED_BOOK_BIN_PATH,
+            help='Binary book file to write.')
+        parser.add_argument(
+            '--rebuild', action='store_true',
+            help='Discard stored counts and replay every game.')
+
+    def handle(self, *args, **options):
+        filters = {
+            'max_plies': options['max_plies'],
+            'include_draws': options['include_draws'],
+        }
+        state = load_learned_book_state(options['state'])
+        if options['rebuild'] or state['filters'] != filters:
+            if state['last_game_id']:
+                self.stdout.write(
+                    'Mining filters changed; replaying every game.')
+            state = load_learned_book_state(os.devnull)
+        state['filters'] = filters
+
+        results = (
+            GameResult.objects
+            .filter(pk__gt=state['last_game_id'])
+            .order_by('pk')
+            .only('pk', 'winner', 'moves')
+        )
+        new_counts, last_game_id = mine_book_moves(
+            results.iterator(), options['max_plies'],
+            options['include_draws'])
+        merge_book_entries(state['counts'], new_counts)
+        state['last_game_id'] = max(state['last_game_id'], last_game_id)
+        save_learned_book_state(options['state'], state)
+
+        entries = {}
+        for key, moves in state['counts'].items():
+            frequent = {
+                move: count for move, count in moves.items()
+                if count >= options['min_count']
+            }
+            if frequent:
+                entries[key] = frequent
+
+        if not options['no_curated']:
+            try:
+                with open(ChessGame.OPENING_BOOK_PATH, encoding='utf-8') as fh:
+                    curated = json.load(fh)
+            except (OSError, json.JSONDecodeError) as exc:
+                raise CommandError(
+                    f'Cannot read {ChessGame.OPENING_BOOK_PATH}: {exc}')
+            curated_entries = book_entries_from_json(curated)
+            for moves in curated_entries.values():
+                for move in moves:
+                    moves[move] = options['curated_weight']
+            merge_book_entries(entries, curated_entries)
+
+        count = write_book(options['output'], entries)
+        ChessGame._learned_book = None
+        self.stdout.write(self.style.SUCCESS(
+            f'Learned from {len(new_counts)} new positions; wrote {count} '
+            f'moves for {len(entries)} positions to {options["output"]}.'
+        ))
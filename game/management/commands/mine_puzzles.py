@@ -0,0 +1,106 @@
+"""Mine tactical puzzles from the games played on this site."""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from django.core.management.base import BaseCommand
+
+from game import puzzles
+from game.engine import ChessGame
+from game.models import GameResult
+from game.puzzles import (
+    load_puzzle_mining_state,
+    save_puzzle_mining_state,
+    store_puzzles,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Replays stored GameResult histories across a process pool and '
+        'stores every position with a single winning continuation as a '
+        'Puzzle, tagged with a theme and difficulty. Only games added '
+        'since the previous run are scanned.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--depth', type=int, default=ChessGame.AI_SEARCH_DEPTH_CPP,
+            help='Search depth used to score each candidate move.')
+        parser.add_argument(
+            '--win', type=int, default=puzzles.DEFAULT_WIN,
+            help='Centipawns the best move must reach to count as winning.')
+        parser.add_argument(
+            '--gap', type=int, default=puzzles.DEFAULT_GAP,
+            help='Minimum margin between the best and second-best move.')
+        parser.add_argument(
+            '--min-ply', type=int, default=puzzles.DEFAULT_MIN_PLY,
+            help='Skip the first N plies of every game.')
+        parser.add_argument(
+            '--max-per-game', type=int, default=puzzles.DEFAULT_MAX_PER_GAME,
+            help='Stop scanning a game after this many puzzles.')
+        parser.add_argument(
+            '--limit', type=int, default=200,
+            help='Maximum number of games to scan in this run.')
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count() or 1,
+            help='Number of worker processes; 1 scans in-process.')
+        parser.add_argument(
+            '--timeout', type=int, default=60,
+            help='Seconds allowed for each position analysis.')
+        parser.add_argument(
+            '--state', default=os.path.join(
+                ChessGame.ENGINE_DIR, 'puzzle_mining.json'),
+            help='Sidecar file remembering the last scanned game.')
+        parser.add_argument(
+            '--rebuild', action='store_true',
+            help='Forget the last scanned game and rescan every game.')
+
+    def handle(self, *args, **options):
+        filters = {
+            'depth': options['depth'],
+            'win': options['win'],
+            'gap': options['gap'],
+            'min_ply': options['min_ply'],
+        }
+        state = load_puzzle_mining_state(options['state'])
+        if options['rebuild'] or state['filters'] != filters:
+            if state['last_game_id']:
+                self.stdout.write(
+                    'Mining filters changed; rescanning every game.')
+            state = load_puzzle_mining_state(os.devnull)
+        state['filters'] = filters
+
+        results = list(
+            GameResult.objects
+            .filter(pk__gt=state['last_game_id'])
+            .order_by('pk')
+            .values_list('pk', 'moves')[:options['limit']]
+        )
+        mine = partial(
+            puzzles.mine_game_puzzles,
+            depth=options['depth'], win=options['win'], gap=options['gap'],
+            min_ply=options['min_ply'],
+            max_per_game=options['max_per_game'],
+            timeout=options['timeout'],
+        )
+        game_ids = [pk for pk, _ in results]
+        histories = [moves for _, moves in results]
+
+        if options['workers'] > 1 and len(results) > 1:
+            with ProcessPoolExecutor(
+                    max_workers=options['workers']) as pool:
+                per_game = list(pool.map(mine, game_ids, histories))
+        else:
+            per_game = list(map(mine, game_ids, histories))
+
+        found = [puzzle for game in per_game for puzzle in game]
+        stored = store_puzzles(found) if found else 0
+        if game_ids:
+            state['last_game_id'] = max(state['last_game_id'], game_ids[-1])
+        save_puzzle_mining_state(options['state'], state)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Scanned {len(game_ids)} games; found {len(found)} puzzles, '
+            f'{stored} new.'
+        ))
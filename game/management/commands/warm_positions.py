@@ -0,0 +1,104 @@
+"""Precompute deep AI replies for the positions our players reach most."""
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+
+from game.engine import ChessGame
+from game.models import GameResult
+from game.services import (
+    load_position_cache_state,
+    mine_position_counts,
+    save_position_cache_state,
+    warm_position,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Mines stored games for frequently reached positions and caches a '
+        'deep BESTMOVE/STATUS result for each one. Only games added since '
+        'the previous run are scanned, and only positions that are new or '
+        'were searched shallower than --depth are recomputed.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-count', type=int, default=3,
+            help='Minimum number of games that must reach a position.')
+        parser.add_argument(
+            '--max-plies', type=int, default=24,
+            help='Only consider positions within the first N plies.')
+        parser.add_argument(
+            '--depth', type=int, default=ChessGame.AI_SEARCH_DEPTH_CPP + 2,
+            help='Search depth used for each warmed position.')
+        parser.add_argument(
+            '--limit', type=int, default=500,
+            help='Maximum number of positions to search in this run.')
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count() or 1,
+            help='Number of engine processes to run in parallel.')
+        parser.add_argument(
+            '--timeout', type=int, default=120,
+            help='Seconds allowed for each deep search.')
+        parser.add_argument(
+            '--output', default=ChessGame.POSITION_CACHE_PATH,
+            help='Position cache file to update.')
+        parser.add_argument(
+            '--rebuild', action='store_true',
+            help='Ignore the existing cache and rescan every game.')
+
+    def handle(self, *args, **options):
+        path = options['output']
+        depth = options['depth']
+        state = load_position_cache_state(path)
+        if options['rebuild']:
+            state = load_position_cache_state(os.devnull)
+
+        results = (
+            GameResult.objects
+            .filter(pk__gt=state['last_game_id'])
+            .order_by('pk')
+            .only('pk', 'moves')
+        )
+        new_counts, last_game_id = mine_position_counts(
+            results.iterator(), options['max_plies'])
+
+        counts = state['counts']
+        for key, count in new_counts.items():
+            counts[key] = counts.get(key, 0) + count
+        state['last_game_id'] = max(state['last_game_id'], last_game_id)
+
+        positions = state['positions']
+        targets = sorted(
+            (
+                key for key, count in counts.items()
+                if count >= options['min_count']
+                and positions.get(key, {}).get('depth', 0) < depth
+            ),
+            key=lambda key: -counts[key],
+        )[:options['limit']]
+
+        warmed = 0
+        if targets:
+            with ThreadPoolExecutor(
+                    max_workers=max(1, options['workers'])) as pool:
+                futures = {
+                    pool.submit(
+                        warm_position, key, depth, options['timeout']): key
+                    for key in targets
+                }
+                for future in as_completed(futures):
+                    entry = future.result()
+                    if entry:
+                        positions[futures[future]] = entry
+                        warmed += 1
+
+        for key, entry in positions.items():
+            entry['count'] = counts.get(key, 0)
+
+        save_position_cache_state(path, state)
+        self.stdout.write(self.style.SUCCESS(
+            f'Scanned {len(new_counts)} new positions; warmed {warmed} of '
+            f'{len(targets)} candidates ({len(positions)} cached in total).'
+        ))
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:15
+
+import django.db.models.deletion
+import game.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0012_achievement_userachievement'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Puzzle',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fen', models.CharField(max_length=100)),
+                ('position_key', models.CharField(max_length=100, unique=True)),
+                ('solution', models.JSONField(default=list, help_text="Solution moves as from/to squares, e.g. ['e2e4']")),
+                ('theme', models.CharField(choices=[('mate', 'Checkmate'), ('promotion', 'Promotion'), ('capture', 'Winning Capture'), ('quiet', 'Quiet Move')], max_length=10)),
+                ('difficulty', models.PositiveSmallIntegerField()),
+                ('score', models.IntegerField(help_text='Engine evaluation of the solution for the side to move')),
+                ('random_key', models.FloatField(default=game.models.random_puzzle_key)),
+                ('ply', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('source_game', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='puzzles', to='game.gameresult')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['theme', 'difficulty', 'random_key'], name='puzzle_theme_difficulty_idx'), models.Index(fields=['random_key'], name='puzzle_random_idx')],
+            },
+        ),
+    ]
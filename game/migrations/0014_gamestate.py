@@ -0,0 +1,64 @@
+import uuid
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def move_session_games(apps, schema_editor):
+    """Move games stored inside sessions into GameState rows."""
+    from django.contrib.sessions.backends.db import SessionStore
+
+    Session = apps.get_model('sessions', 'Session')
+    GameState = apps.get_model('game', 'GameState')
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    store = SessionStore()
+
+    for session in Session.objects.iterator():
+        try:
+            session_data = store.decode(session.session_data)
+        except Exception:
+            continue
+        game = session_data.get('game')
+        if not isinstance(game, dict):
+            continue
+
+        user_id = session_data.get('_auth_user_id')
+        state = GameState.objects.create(
+            data=game,
+            status=game.get('game_status', 'active'),
+            last_ts=game.get('last_ts', 0),
+            user=User.objects.filter(pk=user_id).first() if user_id else None,
+        )
+        del session_data['game']
+        session_data['game_id'] = str(state.pk)
+        session.session_data = store.encode(session_data)
+        session.save(update_fields=['session_data'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0013_puzzle'),
+        ('sessions', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GameState',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('data', models.JSONField()),
+                ('status', models.CharField(default='active', max_length=20)),
+                ('last_ts', models.FloatField(default=0)),
+                ('version', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='game_states', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'last_ts'], name='gamestate_status_ts_idx')],
+            },
+        ),
+        migrations.RunPython(move_session_games, migrations.RunPython.noop),
+    ]
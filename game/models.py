@@ -1,6 +1,14 @@
-from django.db import models
+import random
+import uuid
+
+from django.db import models, transaction
 from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import signing
 from django.db.models import Q
+from django.utils import timezone
+
+from . import events
 
 
 class GameResult(models.Model):
@@ -136,4 +144,178 @@ class UserAchievement(models.Model):
 
     def __str__(self):
         return f"{self.user.username} - {self.achievement.title}"
-    
\ No newline at end of file
+    
+
+def random_puzzle_key():
+    return random.random()
+
+
+class Puzzle(models.Model):
+    """A tactical position mined from stored games by ``mine_puzzles``."""
+    THEME_CHOICES = [
+        ("mate", "Checkmate"),
+        ("promotion", "Promotion"),
+        ("capture", "Winning Capture"),
+        ("quiet", "Quiet Move"),
+    ]
+
+    fen = models.CharField(max_length=100)
+    position_key = models.CharField(max_length=100, unique=True)
+    solution = models.JSONField(
+        default=list,
+        help_text="Solution moves as from/to squares, e.g. ['e2e4']"
+    )
+    theme = models.CharField(max_length=10, choices=THEME_CHOICES)
+    difficulty = models.PositiveSmallIntegerField()
+    score = models.IntegerField(
+        help_text="Engine evaluation of the solution for the side to move"
+    )
+    # Serving picks the first puzzle at or after a random point
+    random_key = models.FloatField(default=random_puzzle_key)
+    source_game = models.ForeignKey(
+        GameResult,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="puzzles"
+    )
+    ply = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["theme", "difficulty", "random_key"],
+                name="puzzle_theme_difficulty_idx",
+            ),
+            models.Index(fields=["random_key"], name="puzzle_random_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.theme} ({self.difficulty}) {self.fen}"
+
+
+class GameState(models.Model):
+    """A game in progress, stored in its own row instead of the session.
+
+    The session only holds the row id under ``SESSION_KEY``.  ``data`` is
+    ``ChessGame.to_dict()``; ``status`` and ``last_ts`` mirror it so that
+    maintenance can find stale games with an indexed query.  ``version``
+    is bumped on every write and ``store`` refuses to overwrite a row that
+    changed after it was read.
+    """
+    SESSION_KEY = "game_id"
+    # Cache key of the spectator snapshot of one version of a game
+    SNAPSHOT_CACHE_KEY = "spectate:{}:{}"
+    # Salt of the signed tokens handed out by ``access_token``
+    ACCESS_TOKEN_SALT = "game.access"
+
+    class Conflict(Exception):
+        """The row was written by another request since it was read."""
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="game_states"
+    )
+    data = models.JSONField()
+    status = models.CharField(max_length=20, default="active")
+    last_ts = models.FloatField(default=0)
+    version = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["status", "last_ts"],
+                name="gamestate_status_ts_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.pk} | {self.status}"
+
+    @classmethod
+    def for_session(cls, session):
+        """Return the row the session points to, or None.
+
+        A game still stored inside the session by an older release is
+        moved into its own row on first access, owned by the session's
+        logged-in user as migration 0014 does it.
+        """
+        game_id = session.get(cls.SESSION_KEY)
+        if game_id:
+            return cls.objects.filter(pk=game_id).first()
+
+        legacy = session.get("game")
+        if not isinstance(legacy, dict):
+            return None
+        user_id = session.get("_auth_user_id")
+        state = cls.objects.create(
+            data=legacy,
+            status=legacy.get("game_status", "active"),
+            last_ts=legacy.get("last_ts", 0),
+            user=(get_user_model().objects.filter(pk=user_id).first()
+                  if user_id else None),
+        )
+        session[cls.SESSION_KEY] = str(state.pk)
+        del session["game"]
+        return state
+
+    @classmethod
+    def start(cls, session, data, user=None):
+        """Store a new game and point the session at it."""
+        state = cls.objects.create(
+            data=data,
+            user=user,
+            status=data["game_status"],
+            last_ts=data["last_ts"],
+        )
+        session[cls.SESSION_KEY] = str(state.pk)
+        return state
+
+    def access_token(self, role):
+        """Return a token granting *role* in this game to whoever
+        presents it: 'white' or 'black' to play that side, 'watch' to
+        spectate."""
+        return signing.dumps(
+            [str(self.pk), role], salt=self.ACCESS_TOKEN_SALT, compress=True)
+
+    @classmethod
+    def read_access_token(cls, token):
+        """Return ``(game_id, role)`` from a token made by
+        ``access_token``, or None when it is not genuine."""
+        try:
+            game_id, role = signing.loads(token, salt=cls.ACCESS_TOKEN_SALT)
+        except (signing.BadSignature, TypeError, ValueError):
+            return None
+        return game_id, role
+
+    def store(self, data, user=None):
+        """Write *data* back if nobody else has since; bump ``version``.
+
+        Raises ``GameState.Conflict`` when the row changed after it was
+        read.
+        """
+        fields = {
+            "data": data,
+            "status": data["game_status"],
+            "last_ts": data["last_ts"],
+            "version": self.version + 1,
+            "updated_at": timezone.now(),
+        }
+        if user is not None:
+            fields["user"] = user
+        updated = type(self).objects.filter(
+            pk=self.pk, version=self.version).update(**fields)
+        if not updated:
+            raise self.Conflict(f"Game {self.pk} was modified concurrently.")
+        for name, value in fields.items():
+            setattr(self, name, value)
+        transaction.on_commit(self._committed)
+
+    def _committed(self):
+        events.publish(self.pk)
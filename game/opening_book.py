@@ -0,0 +1,193 @@
+"""Binary, memory-mapped opening book.
+
+File layout (little endian)::
+
+    header   8s  magic  b'CKBOOK01'
+             I   number of entries
+             I   reserved (0)
+    entries  Q   Zobrist key of the position (see ``game.zobrist``)
+             H   move: from_sq | to_sq << 6 | promotion << 12
+             H   weight
+
+Entries are sorted by key and, within one key, by descending weight, so a
+lookup is a binary search over the mapped file.  Nothing is parsed up
+front: opening the book costs one ``mmap`` call and the pages are shared
+between every worker process on the host.
+
+Squares are numbered ``row * 8 + col`` like the engine's board string;
+promotion is 0 for none, then 1-4 for ``n``, ``b``, ``r``, ``q``.
+"""
+
+import mmap
+import os
+import re
+import struct
+
+MAGIC = b'CKBOOK01'
+HEADER = struct.Struct('<8sII')
+ENTRY = struct.Struct('<QHH')
+MAX_WEIGHT = 0xFFFF
+
+PROMOTIONS = ' nbrq'
+
+
+def encode_move(fr, fc, tr, tc, promotion=None):
+    """Pack board coordinates (and an optional promotion) into 16 bits."""
+    promo = PROMOTIONS.index(promotion.lower()) if promotion else 0
+    return (fr * 8 + fc) | (tr * 8 + tc) << 6 | promo << 12
+
+
+def decode_move(value):
+    """Unpack a 16-bit move into ``(fr, fc, tr, tc, promotion)``."""
+    from_sq = value & 0x3F
+    to_sq = (value >> 6) & 0x3F
+    promo = (value >> 12) & 0x7
+    return (
+        from_sq // 8, from_sq % 8, to_sq // 8, to_sq % 8,
+        PROMOTIONS[promo] if 0 < promo < len(PROMOTIONS) else None,
+    )
+
+
+class OpeningBook:
+    """Read-only view of a binary book file."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as fh:
+            self._mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, count, _ = HEADER.unpack_from(self._mm, 0)
+        except struct.error:
+            self.close()
+            raise ValueError(f"{path} is not a Checkora book.")
+        if (magic != MAGIC
+                or len(self._mm) < HEADER.size + count * ENTRY.size):
+            self.close()
+            raise ValueError(f"{path} is not a Checkora book.")
+        self._count = count
+
+    def __len__(self):
+        return self._count
+
+    def close(self):
+        self._mm.close()
+
+    def _entry(self, index):
+        return ENTRY.unpack_from(self._mm, HEADER.size + index * ENTRY.size)
+
+    def _lower_bound(self, key):
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._entry(mid)[0] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def probe(self, key):
+        """Return ``[(move, weight), ...]`` stored for *key*.
+
+        Moves are ``(fr, fc, tr, tc, promotion)`` tuples, heaviest first.
+        """
+        moves = []
+        index = self._lower_bound(key)
+        while index < self._count:
+            entry_key, move, weight = self._entry(index)
+            if entry_key != key:
+                break
+            moves.append((decode_move(move), weight))
+            index += 1
+        return moves
+
+    def __iter__(self):
+        """Yield ``(key, move, weight)`` for every entry in file order."""
+        for index in range(self._count):
+            key, move, weight = self._entry(index)
+            yield key, decode_move(move), weight
+
+
+def write_book(path, entries):
+    """Write *entries* (``{key: {move: weight}}``) as a binary book.
+
+    Moves are ``(fr, fc, tr, tc, promotion)`` tuples.  The file is written
+    next to *path* and moved into place so running readers are never
+    exposed to a half-written book.
+    """
+    rows = []
+    for key, moves in entries.items():
+        for move, weight in moves.items():
+            if weight > 0:
+                rows.append((key, -min(weight, MAX_WEIGHT), encode_move(*move)))
+    rows.sort()
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as fh:
+        fh.write(HEADER.pack(MAGIC, len(rows), 0))
+        for key, neg_weight, move in rows:
+            fh.write(ENTRY.pack(key, move, -neg_weight))
+    os.replace(tmp_path, path)
+    return len(rows)
+
+
+def read_book_entries(path):
+    """Load a binary book back into the ``{key: {move: weight}}`` form."""
+    entries = {}
+    book = OpeningBook(path)
+    try:
+        for key, move, weight in book:
+            entries.setdefault(key, {})[move] = weight
+    finally:
+        book.close()
+    return entries
+
+
+_PGN_TAG = re.compile(r'^\s*\[[^\]]*\]\s*$')
+_PGN_RESULT_TAG = re.compile(r'^\s*\[Result\s+"([^"]*)"\]')
+_PGN_COMMENT = re.compile(r'\{[^}]*\}|;[^\n]*')
+_PGN_MOVE_NUMBER = re.compile(r'^\d+\.+$|^\d+\.+(?=\S)')
+_PGN_RESULTS = {'1-0', '0-1', '1/2-1/2', '*'}
+
+
+def _strip_variations(text):
+    depth = 0
+    out = []
+    for ch in text:
+        if ch == '(':
+            depth += 1
+        elif ch == ')':
+            depth = max(0, depth - 1)
+        elif depth == 0:
+            out.append(ch)
+    return ''.join(out)
+
+
+def iter_pgn_games(text):
+    """Yield ``(san_moves, result)`` for every game in a PGN document.
+
+    Tags, comments, variations and NAGs are discarded; only the main line
+    is returned.  A game ends at its result token or at the next tag pair.
+    """
+    text = _strip_variations(_PGN_COMMENT.sub(' ', text))
+    moves, result = [], '*'
+    for line in text.splitlines():
+        if _PGN_TAG.match(line):
+            if moves:
+                yield moves, result
+                moves, result = [], '*'
+            tag = _PGN_RESULT_TAG.match(line)
+            if tag:
+                result = tag.group(1)
+            continue
+        for token in line.split():
+            token = _PGN_MOVE_NUMBER.sub('', token)
+            if not token or token.startswith('$'):
+                continue
+            if token in _PGN_RESULTS:
+                if moves:
+                    yield moves, token
+                moves, result = [], '*'
+                continue
+            moves.append(token)
+    if moves:
+        yield moves, result
@@ -0,0 +1,222 @@
+"""Tactical puzzle mining over stored games.
+
+A position from a finished game becomes a puzzle when the side to move
+has exactly one winning continuation: the engine's best move scores at
+least ``win`` centipawns, the runner-up is no longer winning, and the two
+are at least ``gap`` apart.  A forced mate qualifies whenever no other
+move mates; mates found by the engine's MATE search keep the whole
+mating line as the solution, other puzzles are the single key move.
+
+Solutions are ``from``/``to`` squares such as ``'e2e4'``, the same form
+the puzzle client compares played moves against (promotions are always
+to a queen, so no suffix is needed).
+
+This module deliberately avoids module-level Django model imports so
+that ``mine_game_puzzles`` can run in a ``ProcessPoolExecutor`` worker;
+``store_puzzles`` and ``pick_puzzle``, which run in the web and command
+processes, import the models when called.
+"""
+import random
+
+from .engine import ChessGame
+from .json_state import load_json_state, save_json_state
+
+THEMES = ('mate', 'promotion', 'capture', 'quiet')
+
+# Anything beyond this is a forced mate (the engines score mates ~99999)
+MATE_SCORE = 90000
+
+DEFAULT_WIN = 200
+DEFAULT_GAP = 200
+DEFAULT_MIN_PLY = 8
+DEFAULT_MAX_PER_GAME = 3
+
+
+def square_name(row, col):
+    return f"{ChessGame.FILES[col]}{8 - row}"
+
+
+def move_name(move):
+    return (square_name(move['from_row'], move['from_col'])
+            + square_name(move['to_row'], move['to_col']))
+
+
+def position_fen(game, ply):
+    """Full FEN for *game* after *ply* half-moves of a replayed game."""
+    ep = '-'
+    if game._has_legal_en_passant_capture():
+        ep = square_name(*game.en_passant_target)
+    return (f"{game.generate_fen_key()} {ep} "
+            f"{game.halfmove_clock} {ply // 2 + 1}")
+
+
+def classify(game, move, mate_in=None):
+    """Return ``(theme, difficulty)`` for the key *move* in *game*."""
+    if mate_in:
+        return 'mate', min(mate_in, 5)
+
+    piece = game.board[move['from_row']][move['from_col']]
+    target = game.board[move['to_row']][move['to_col']]
+    if ChessGame._is_promotion(piece, move['to_row']):
+        return 'promotion', 3
+    if target or (piece.lower() == 'p'
+                  and move['from_col'] != move['to_col']):
+        return 'capture', 2
+    return 'quiet', 4
+
+
+def find_puzzle(game, depth, win=DEFAULT_WIN, gap=DEFAULT_GAP):
+    """Return a puzzle dict for the current position, or None.
+
+    The dict holds ``solution``, ``theme``, ``difficulty`` and ``score``
+    (the winning move's evaluation from the solver's point of view).
+    """
+    scored = game.analyze_moves(depth)
+    if len(scored) < 2:
+        return None
+
+    best, second = scored[0], scored[1]
+    if best['score'] >= MATE_SCORE:
+        # Only one move mates: the rest may still be winning
+        if second['score'] >= MATE_SCORE:
+            return None
+    elif (best['score'] < win or second['score'] >= win
+            or best['score'] - second['score'] < gap):
+        return None
+
+    mate_in = None
+    solution = [move_name(best)]
+    if best['score'] >= MATE_SCORE:
+        mate = game.find_mate()
+        if mate:
+            mate_in = mate['mate_in']
+            solution = [move_name(move) for move in mate['moves']]
+
+    theme, difficulty = classify(game, best, mate_in)
+    if theme != 'mate' and best['score'] - second['score'] < 2 * gap:
+        # The alternative is not far off: harder to tell apart
+        difficulty += 1
+    return {
+        'solution': solution,
+        'theme': theme,
+        'difficulty': difficulty,
+        'score': best['score'],
+    }
+
+
+def mine_game_puzzles(game_id, moves, depth, win=DEFAULT_WIN,
+                      gap=DEFAULT_GAP, min_ply=DEFAULT_MIN_PLY,
+                      max_per_game=DEFAULT_MAX_PER_GAME, timeout=None):
+    """Replay one stored game and return the puzzles found in it.
+
+    Every position from *min_ply* onwards, including the final one, is
+    analysed at *depth* until *max_per_game* puzzles have been found.  Each puzzle is a dict ready
+    to become a ``Puzzle`` row (``source_game`` holds *game_id*).
+    """
+    game = ChessGame()
+    # Offline: the caller's worker count bounds the engine processes
+    game.ENGINE_ADMISSION = False
+    if timeout:
+        game.ENGINE_TIMEOUT = timeout
+    found = []
+    seen = set()
+
+    moves = moves or []
+    for ply in range(len(moves) + 1):
+        if ply >= min_ply:
+            key = game.generate_position_key()
+            puzzle = None if key in seen else find_puzzle(
+                game, depth, win, gap)
+            seen.add(key)
+            if puzzle:
+                puzzle.update({
+                    'fen': position_fen(game, ply),
+                    'position_key': key,
+                    'ply': ply,
+                    'source_game': game_id,
+                })
+                found.append(puzzle)
+                if len(found) >= max_per_game:
+                    break
+        if ply == len(moves):
+            break
+        try:
+            game.apply_recorded_move(moves[ply])
+        except (KeyError, TypeError, ValueError, IndexError):
+            # Corrupt or truncated history: keep what was found
+            break
+
+    return found
+
+
+PUZZLE_MINING_VERSION = 1
+
+
+def load_puzzle_mining_state(path):
+    """Read the puzzle-mining sidecar, or return an empty state."""
+    return load_json_state(path, {
+        'version': PUZZLE_MINING_VERSION,
+        'last_game_id': 0,
+        'filters': {},
+    })
+
+
+def save_puzzle_mining_state(path, state):
+    """Write the puzzle-mining sidecar."""
+    save_json_state(path, state)
+
+
+def store_puzzles(found):
+    """Save mined puzzle dicts, skipping positions that are already
+    stored, and return the number of new puzzles."""
+    from .models import GameResult, Puzzle
+
+    existing = set(
+        Puzzle.objects
+        .filter(position_key__in=[p['position_key'] for p in found])
+        .values_list('position_key', flat=True)
+    )
+    live_games = set(
+        GameResult.objects
+        .filter(pk__in={p['source_game'] for p in found})
+        .values_list('pk', flat=True)
+    )
+    new = {}
+    for puzzle in found:
+        key = puzzle['position_key']
+        if key in existing or key in new:
+            continue
+        new[key] = Puzzle(
+            fen=puzzle['fen'],
+            position_key=key,
+            solution=puzzle['solution'],
+            theme=puzzle['theme'],
+            difficulty=puzzle['difficulty'],
+            score=puzzle['score'],
+            ply=puzzle['ply'],
+            source_game_id=(puzzle['source_game']
+                            if puzzle['source_game'] in live_games else None),
+        )
+    Puzzle.objects.bulk_create(new.values(), ignore_conflicts=True)
+    return len(new)
+
+
+def pick_puzzle(theme=None, difficulty=None, seed=None):
+    """Return a random stored puzzle matching the filters, or None.
+
+    Uses the ``random_key`` index: the first puzzle at or after a random
+    point, wrapping around to the lowest key.  A *seed* makes the choice
+    repeatable (e.g. the same daily puzzle for everyone).
+    """
+    from .models import Puzzle
+
+    puzzles = Puzzle.objects.all()
+    if theme:
+        puzzles = puzzles.filter(theme=theme)
+    if difficulty:
+        puzzles = puzzles.filter(difficulty=difficulty)
+    point = random.Random(seed).random() if seed is not None else random.random()
+    return (
+        puzzles.filter(random_key__gte=point).order_by('random_key').first()
+        or puzzles.order_by('random_key').first()
+    )
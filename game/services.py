@@ -1,22 +1,26 @@
 import time
-from django.contrib.sessions.models import Session
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
 from django.db import transaction
-from django.contrib.auth import get_user_model
+from django.utils import timezone
 from game.models import (
     GameResult,
+    GameState,
     PuzzleStats,
     Achievement,
     UserAchievement,
 )
 from django.db.models import F
-
-User = get_user_model()
+from game.engine import ChessGame
+from game.json_state import load_json_state, save_json_state
 
 def cleanup_stale_games():
     """
     Automated cleanup task for abandoned games.
-    Iterates over all django_session records and applies rules to stale active games:
-    Rule A (Low Engagement): < 5 moves -> hard deletion (remove game from session).
+    Finds stale active games with an indexed query on GameState and applies:
+    Rule A (Low Engagement): < 5 moves -> hard deletion (remove the game row).
     Rule B (High Engagement): >= 5 moves -> auto-resign inactive player.
     """
     # 48 hours in seconds
@@ -25,29 +29,17 @@ def cleanup_stale_games():
     deleted_count = 0
     resigned_count = 0
     
-    # Iterate over all sessions
-    for session in Session.objects.iterator():
-        try:
-            session_data = session.get_decoded()
-        except Exception:
-            continue
-            
-        game_data = session_data.get('game')
-        if not game_data or game_data.get('game_status') != 'active':
-            continue
-            
-        last_ts = game_data.get('last_ts', 0)
-        if last_ts > stale_threshold:
-            continue
-            
-        moves_count = len(game_data.get('move_history', []))
+    stale_games = GameState.objects.filter(
+        status='active', last_ts__lte=stale_threshold)
+    for state in stale_games.iterator():
+        game_data = state.data
+        moves = ChessGame.moves_from_session(game_data)
+        moves_count = len(moves)
         
         with transaction.atomic():
             if moves_count < 5:
                 # Rule A: Hard deletion
-                del session_data['game']
-                session.session_data = Session.objects.encode(session_data)
-                session.save()
+                state.delete()
                 deleted_count += 1
             else:
                 # Rule B: Auto-resignation
@@ -63,21 +55,19 @@ def cleanup_stale_games():
                     winner = 'black' if current_turn == 'white' else 'white'
                 
                 game_data['game_status'] = 'resignation'
-                session_data['game'] = game_data
-                session.session_data = Session.objects.encode(session_data)
-                session.save()
-                
-                # Create a GameResult historically linking to the user if auth is known
-                user_id = session_data.get('_auth_user_id')
-                user = User.objects.filter(pk=user_id).first() if user_id else None
+                try:
+                    state.store(game_data)
+                except GameState.Conflict:
+                    # The player came back while we were looking
+                    continue
                 
                 result = GameResult(
-                    user=user,
+                    user=state.user,
                     mode=mode,
                     winner=winner,
                     end_reason='resign',
                     player_color=player_color,
-                    moves=game_data.get('move_history', [])
+                    moves=moves
                 )
                 result.full_clean()
                 result.save()
@@ -86,6 +76,112 @@ def cleanup_stale_games():
                 
     return deleted_count, resigned_count
 
+
+# Hours a finished game is kept, so its player still sees the final position
+FINISHED_GAME_GRACE_HOURS = 24
+
+
+def prune_game_states():
+    """
+    Delete GameState rows no session can still use:
+    finished games untouched for FINISHED_GAME_GRACE_HOURS, and any game
+    untouched for longer than a session cookie lives (SESSION_COOKIE_AGE).
+    Returns the number of rows deleted.
+    """
+    now = timezone.now()
+    finished = GameState.objects.exclude(status='active').filter(
+        updated_at__lte=now - timedelta(hours=FINISHED_GAME_GRACE_HOURS))
+    expired = GameState.objects.filter(
+        updated_at__lte=now - timedelta(seconds=settings.SESSION_COOKIE_AGE))
+    deleted, _ = (finished | expired).delete()
+    return deleted
+
+# ==========================
+# Position Cache Warming
+# ==========================
+
+POSITION_CACHE_VERSION = 1
+
+
+def mine_position_counts(results, max_plies=24):
+    """
+    Count how many stored games reached each position.
+    Replays ``GameResult.moves`` without engine calls and keys positions
+    with ``ChessGame.generate_position_key``. A position is counted at most
+    once per game. Returns ``(counts, last_game_id)``.
+    """
+    counts = Counter()
+    last_game_id = 0
+
+    for result in results:
+        last_game_id = max(last_game_id, result.pk)
+        game = ChessGame()
+        seen = set()
+        for move in (result.moves or [])[:max_plies]:
+            try:
+                game.apply_recorded_move(move)
+            except (KeyError, TypeError, ValueError, IndexError):
+                # Corrupt or truncated history: keep what was replayed
+                break
+            seen.add(game.generate_position_key())
+        counts.update(seen)
+
+    return counts, last_game_id
+
+
+def game_from_position_key(key):
+    """Rebuild a ChessGame from a ``generate_position_key`` string."""
+    fen, ep = key.rsplit(' ', 1)
+    game = ChessGame.from_fen(fen)
+    if ep != '-':
+        row, col = ep.split(',')
+        game.en_passant_target = (int(row), int(col))
+        game.position_hash = game.zobrist_key()
+        game._reset_repetition()
+    return game
+
+
+def warm_position(key, depth, timeout=None):
+    """
+    Compute the status and best move for one position at *depth*.
+    Safe to run from worker threads: every call spawns its own engine process.
+    """
+    game = game_from_position_key(key)
+    # The command's --workers already bounds the engine processes
+    game.ENGINE_ADMISSION = False
+    if timeout:
+        game.ENGINE_TIMEOUT = timeout
+
+    status = game.check_game_status()
+    move = None
+    if status not in ('checkmate', 'stalemate', 'draw'):
+        best = game.search_best_move(depth)
+        if not best:
+            # Engine failed or timed out: do not cache a partial result
+            return None
+        move = [best['from_row'], best['from_col'],
+                best['to_row'], best['to_col']]
+
+    return {'move': move, 'status': status, 'depth': depth}
+
+
+def load_position_cache_state(path):
+    """Read the position cache file, or return an empty state."""
+    return load_json_state(path, {
+        'version': POSITION_CACHE_VERSION,
+        'last_game_id': 0,
+        'counts': {},
+        'positions': {},
+    })
+
+
+def save_position_cache_state(path, state):
+    """Atomically write the position cache file."""
+    save_json_state(path, state)
+    # Reload here at once; other processes notice the new modification
+    # time on their next lookup
+    ChessGame._position_cache = None
+
 # ==========================
 # Achievement System
 # ==========================
@@ -106,6 +202,23 @@ def unlock_achievement(user, code):
         pass
 
 
+def save_game_result(user, mode, winner, reason, player_color, moves):
+    """Save a completed game result and award *user*'s achievements."""
+    result = GameResult.objects.create(
+        user=user,
+        mode=mode,
+        winner=winner,
+        end_reason=reason,
+        player_color=player_color,
+        moves=moves
+    )
+    result.full_clean()
+    result.save()
+
+    if user:
+        check_game_achievements(user)
+
+
 def check_game_achievements(user):
     if not user:
         return
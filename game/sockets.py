@@ -0,0 +1,195 @@
+"""WebSocket transport for remote PvP games.
+
+``core/asgi.py`` hands WebSocket connections to ``game_socket``.  A
+client connects to ``/ws/game/<game id>/`` and receives a ``state``
+message with the game, then another after every save of it, from any
+connection or request.  A client that presents a side's seat token
+(``?token=``, from the ``seats`` of ``/api/new-game/``) sends that
+side's moves over the same socket; they go through
+``ChessGame.make_move`` and the row's optimistic version check just as
+``/api/move/`` does.  Without a valid token the socket only watches.
+"""
+import asyncio
+import json
+import re
+from urllib.parse import parse_qs
+
+from asgiref.sync import ThreadSensitiveContext, sync_to_async
+from django.core.exceptions import ValidationError
+from django.db import close_old_connections, connections
+
+from . import events
+from .admission import EngineBusy
+from .engine import ChessGame
+from .models import GameState
+from .state import game_event, move_fields, record_move_result
+
+GAME_SOCKET_PATH = re.compile(r'^/ws/game/(?P<game_id>[0-9a-f-]{32,36})/$')
+
+# Seconds between re-reads of the row when no update was published
+# (writes from processes the events backend does not reach)
+GAME_SOCKET_RECHECK = 15
+
+# Close codes: no such game, and a path that is not a game socket
+CLOSE_NOT_FOUND = 4404
+CLOSE_BAD_PATH = 4400
+
+COLORS = ('white', 'black')
+
+
+def _db(func):
+    """Run *func* off the event loop, closing stale connections first as
+    Django does at the start of a request."""
+    def run(*args):
+        close_old_connections()
+        return func(*args)
+    return sync_to_async(run)
+
+
+@_db
+def _load(game_id):
+    return GameState.objects.filter(pk=game_id).first()
+
+
+@_db
+def _play(game_id, color, move):
+    """Play *move* for *color* in the game *game_id*; return an error
+    message, or None once the move is stored."""
+    state = GameState.objects.filter(pk=game_id).first()
+    if state is None:
+        return 'No active game.'
+    game = ChessGame.from_dict(state.data)
+    if game.mode != 'pvp':
+        return 'Only PvP games are played over the socket.'
+    if color is None:
+        return 'This socket only watches: connect with a seat token to move.'
+    if game.current_turn != color:
+        return "It is not your turn."
+
+    from_row, from_col, to_row, to_col, promotion_piece = move
+    try:
+        success, message, captured, game_status = game.make_move(
+            from_row, from_col, to_row, to_col, promotion_piece,
+        )
+    except EngineBusy as exc:
+        return str(exc)
+    if not success:
+        return message
+    try:
+        state.store(game.to_dict())
+    except GameState.Conflict:
+        return 'The game was changed by another request. Please reload.'
+
+    # Recorded for the row's owner, as /api/move/ records it for the
+    # session's user
+    record_move_result(game, game_status, state.user)
+    return None
+
+
+async def _send(send, message):
+    await send({'type': 'websocket.send', 'text': json.dumps(message)})
+
+
+async def game_socket(scope, receive, send):
+    """ASGI application for one game socket connection."""
+    # Sync work of this connection runs on its own thread, as Django
+    # does for each request, instead of queueing behind other sockets
+    async with ThreadSensitiveContext():
+        try:
+            await _serve(scope, receive, send)
+        finally:
+            await sync_to_async(connections.close_all)()
+
+
+async def _serve(scope, receive, send):
+    message = await receive()
+    if message['type'] != 'websocket.connect':
+        return
+
+    match = GAME_SOCKET_PATH.match(scope['path'])
+    if match is None:
+        await send({'type': 'websocket.close', 'code': CLOSE_BAD_PATH})
+        return
+    game_id = match['game_id']
+    query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+    try:
+        since = max(int(query.get('since', ['0'])[0]), 0)
+    except ValueError:
+        since = 0
+
+    # An invalid UUID is as unknown as a missing row
+    try:
+        state = await _load(game_id)
+    except ValidationError:
+        state = None
+    if state is None:
+        await send({'type': 'websocket.close', 'code': CLOSE_NOT_FOUND})
+        return
+
+    color = None
+    seat = GameState.read_access_token(query.get('token', [''])[0])
+    if seat is not None and seat[0] == str(state.pk) and seat[1] in COLORS:
+        color = seat[1]
+
+    subscription = events.Subscription(state.pk)
+    incoming = update = None
+    try:
+        await send({'type': 'websocket.accept'})
+        game = ChessGame.from_dict(state.data)
+        since = min(since, len(game.move_history))
+        await _send(send, {'type': 'state', **game_event(game, since)})
+        since = len(game.move_history)
+
+        incoming = asyncio.ensure_future(receive())
+        update = asyncio.ensure_future(subscription.wait(GAME_SOCKET_RECHECK))
+        while True:
+            done, _ = await asyncio.wait(
+                {incoming, update}, return_when=asyncio.FIRST_COMPLETED)
+
+            if incoming in done:
+                message = incoming.result()
+                if message['type'] == 'websocket.disconnect':
+                    return
+                error = await _handle(message, state.pk, color)
+                if error is not None:
+                    await _send(send, {'type': 'error', 'message': error})
+                incoming = asyncio.ensure_future(receive())
+            if update not in done:
+                continue
+
+            # Woken by an update, or time for a re-read
+            update = asyncio.ensure_future(
+                subscription.wait(GAME_SOCKET_RECHECK))
+            fresh = await _load(state.pk)
+            if fresh is None:
+                await _send(send, {'type': 'gone'})
+                await send({'type': 'websocket.close', 'code': 1000})
+                return
+            if fresh.version != state.version:
+                state, game = fresh, ChessGame.from_dict(fresh.data)
+                since = min(since, len(game.move_history))
+                await _send(send, {'type': 'state', **game_event(game, since)})
+                since = len(game.move_history)
+    finally:
+        for task in (incoming, update):
+            if task is not None:
+                task.cancel()
+        subscription.close()
+
+
+async def _handle(message, game_id, color):
+    """Act on one client message; return an error message or None.
+
+    The resulting ``state`` reaches this socket like every other one,
+    through the update published when the move is stored.
+    """
+    try:
+        data = json.loads(message.get('text') or '')
+    except ValueError:
+        return 'Messages must be JSON.'
+    if not isinstance(data, dict) or data.get('type') != 'move':
+        return 'Unknown message type.'
+    move = move_fields(data)
+    if move is None:
+        return 'Invalid board coordinates'
+    return await _play(game_id, color, move)
@@ -0,0 +1,67 @@
+"""Game state helpers shared by the HTTP views and the game socket.
+
+Both transports decode moves, describe the game to watchers and end
+games the same way; these helpers keep them from drifting apart.
+"""
+from .services import save_game_result
+
+
+def move_fields(data):
+    """Return ``(from_row, from_col, to_row, to_col, promotion_piece)``
+    from a decoded JSON object *data*, or None when a coordinate is
+    missing or off the board."""
+    try:
+        coords = ['from_row', 'from_col', 'to_row', 'to_col']
+        for coord in coords:
+            if coord not in data:
+                return None
+            val = data[coord]
+            if not isinstance(val, int) or isinstance(val, bool):
+                return None
+            if not (0 <= val <= 7):
+                return None
+        return (data['from_row'], data['from_col'],
+                data['to_row'], data['to_col'],
+                data.get('promotion_piece', None))
+    except (KeyError, TypeError, AttributeError):
+        return None
+
+
+def game_outcome(game, game_status):
+    """Return ``(winner, reason)`` when the move just played ended the
+    game, else None."""
+    if game_status == 'checkmate':
+        winner = 'black' if game.current_turn == 'white' else 'white'
+        return winner, 'checkmate'
+    if game_status in ('stalemate', 'draw'):
+        return 'draw', game.draw_reason or 'stalemate'
+    return None
+
+
+def record_move_result(game, game_status, user):
+    """Record the game result, for *user* (or None), when the move just
+    played ended the game."""
+    outcome = game_outcome(game, game_status)
+    if outcome is not None:
+        winner, reason = outcome
+        save_game_result(user, game.mode, winner, reason,
+                         game.player_color, game.move_history)
+
+
+def game_event(game, since):
+    """Data of a ``state`` event: the game after ply *since*."""
+    return {
+        'ply': len(game.move_history),
+        'since': since,
+        'new_moves': game.move_history[since:],
+        'board': game.board,
+        'current_turn': game.current_turn,
+        'white_time': game.white_time,
+        'black_time': game.black_time,
+        'paused': game.paused,
+        'captured_pieces': game.captured,
+        'game_status': game.game_status,
+        'draw_reason': game.draw_reason,
+        'threefold_warning': game.threefold_warning,
+        'fen': game.generate_fen_key(),
+    }
@@ -32,6 +32,9 @@
             let turn = 'white';
             let selected = null;
             let hints = [];
+            // "row,col" -> legal moves of the current position, sent along
+            // with the AI's reply by /api/move-and-reply/
+            let legalMoves = null;
              let lastMove = null;
              let premoveQueue = [];
              let lastPremoveQueueStr = '';
@@ -297,6 +300,20 @@
                 return PUZZLES[dayIndex];
             }
 
+            // Prefer a puzzle mined from stored games; fall back to the
+            // built-in weekly set when the server has none.
+            async function fetchDailyPuzzle() {
+                try {
+                    const data = await get('/api/puzzle/?daily=1');
+                    if (data?.fen && Array.isArray(data.solution) && data.solution.length) {
+                        return data;
+                    }
+                } catch (e) {
+                    // Network or parse error: use the built-in puzzle
+                }
+                return getCurrentWeeklyPuzzle();
+            }
+
             function initStockfish() {
                 if (!stockfishWorker) {
                     stockfishWorker = new Worker('/static/game/js/stockfish.js');
@@ -408,7 +425,7 @@
             }
     
             async function startDailyPuzzle() {
-                currentPuzzle = getCurrentWeeklyPuzzle();
+                currentPuzzle = await fetchDailyPuzzle();
 
                 dailyPuzzleMode = true;
                 document.getElementById("whiteClock").style.display = "none";
@@ -999,12 +1016,14 @@
                 // Reset AI request sequence and thinking state on load/reconnect to cancel stale requests
                 aiRequestSeq = 0;
                 aiThinking = false;
+                legalMoves = null;
                 premoveQueue = [];
                 refreshPremoveHighlight();
                 whiteAlertFired = false;
                 blackAlertFired = false;
 
-                const data = await get('/api/state/');
+                const data = await get('/api/state/?include_moves=1');
+                legalMoves = data.legal_moves || null;
 
                 if (data.time_limit !== undefined) {
                     selectedMins = data.time_limit / 60;
@@ -1391,9 +1410,12 @@
                 }
 
                 // NORMAL MOVE LOGIC
-                const data = await get(`/api/valid-moves/?row=${r}&col=${c}`);
-
-                hints = data.valid_moves || [];
+                if (legalMoves) {
+                    hints = legalMoves[`${r},${c}`] || [];
+                } else {
+                    const data = await get(`/api/valid-moves/?row=${r}&col=${c}`);
+                    hints = data.valid_moves || [];
+                }
 
                 refreshHighlights();
             }
@@ -1542,10 +1564,24 @@
                     const body = {
                         from_row: fr, from_col: fc,
                         to_row: tr, to_col: tc,
+                        include_moves: true,
                     };
                     if (promotionPiece) body.promotion_piece = promotionPiece;
 
-                    const data = await post('/api/move/', body);
+                    // Against the AI the reply comes back with the move;
+                    // it is played out by requestAIMove after its delay
+                    const withReply = gameMode === 'ai' && !dailyPuzzleMode;
+                    legalMoves = null;
+                    let data = await post(withReply ? '/api/move-and-reply/' : '/api/move/', body);
+                    if (!withReply) legalMoves = data.legal_moves || null;
+                    const reply = withReply && data.valid && data.ai_move ? data : null;
+                    if (withReply && data.valid) {
+                        data = {
+                            ...data,
+                            ...data.move,
+                            move_history: data.move_history.slice(0, data.move.ply),
+                        };
+                    }
                         if (data.valid) {
                             illegalMoveCount = 0;
                             playSound(data);
@@ -1711,7 +1747,7 @@
                         }
 
                         if (gameMode === 'ai' && turn !== playerColor && !gameOver) {
-                            requestAIMove();
+                            requestAIMove(reply);
                         }
                     } else {
                         showStatus(data.message, true);
@@ -1727,7 +1763,7 @@
                 }
             }
 
-            async function requestAIMove() {
+            async function requestAIMove(reply = null) {
                 if (gameOver || aiThinking) return;
                 // Increment and store current sequence value to identify this specific request
                 const seq = ++aiRequestSeq;
@@ -1768,7 +1804,7 @@
                         return;
                     }
 
-                    const data = await post('/api/ai-move/', {});
+                    const data = reply || await post('/api/ai-move/', { include_moves: true });
                     clearInterval(thinkingInterval); // fix: clear after API call completes, not before
 
                     // Abort if sequence is no longer current after API call completes
@@ -1777,6 +1813,7 @@
                     }
 
                         if (data.valid) {
+                            legalMoves = data.legal_moves || null;
                             playSound(data);
                             const mv = data.ai_move;
                             await animateMove(mv.from_row, mv.from_col, mv.to_row, mv.to_col);
@@ -3010,6 +3047,7 @@
                 // Reset AI request sequence and thinking state on new game
                 aiRequestSeq = 0;
                 aiThinking = false;
+                legalMoves = null;
                 premoveQueue = [];
                 refreshPremoveHighlight();
 
@@ -3065,7 +3103,8 @@
                     black_name: bName,
                     difficulty: difficulty,
                     time_limit: timeLimit,
-                    increment: increment
+                    increment: increment,
+                    include_moves: true
                 };
 
                 const fenValue = (fen && fen.trim()) ? fen.trim() : null;
@@ -3087,6 +3126,7 @@
                 }
 
                 board = d.board;
+                legalMoves = d.legal_moves || null;
                 turn = d.current_turn;
                 paused = false;
                 gameOver = false;
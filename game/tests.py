@@ -1,27 +1,47 @@
 """Tests for the Checkora chess engine and API endpoints."""
 
+import asyncio
+import contextlib
 import json
+import os
 import sys
+import tempfile
+import threading
 import time
+from datetime import timedelta
+from io import StringIO
 from smtplib import SMTPException
 from unittest import mock
+from urllib.parse import urlencode
 
+from asgiref.sync import sync_to_async
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.core import mail
 from django.core.cache import cache
+from django.core.management import call_command
 from django.urls import reverse
+from django.utils import timezone
 from django.test import (
     Client,
     RequestFactory,
     SimpleTestCase,
     TestCase,
+    TransactionTestCase,
     override_settings,
 )
 
+from . import (
+    admission,
+    events as events_module,
+    jobs,
+    views as views_module,
+)
 from .engine import ChessGame
 from .forms import CustomSetPasswordForm
+from .models import GameResult, GameState
 from .views import CustomPasswordResetView
+from .zobrist import format_hash
 
 class EnginePathResolutionTest(SimpleTestCase):
     """Engine path selection should work across local platforms."""
@@ -462,11 +482,10 @@ class MoveValidationTest(TestCase):
 
         # To test capture, we spoof 'p' in the
         # destination square before sending move
-        session = self.client.session
-        game_data = session['game']
-        game_data['board'][3][3] = 'p'
-        session['game'] = game_data
-        session.save()
+        state = GameState.for_session(self.client.session)
+        game = ChessGame.from_dict(state.data)
+        game.board[3][3] = 'p'
+        state.store(game.to_dict())
 
         r = self._move(4, 4, 3, 3, True)
         data = r.json()
@@ -623,15 +642,14 @@ class NewGameTest(TestCase):
 
     def setUp(self):
         self.client.get('/play/')
+        self.client.post('/api/new-game/', content_type='application/json')
 
     def test_reset(self):
         # Manually update board to simulate game progress
-        session = self.client.session
-        game_data = session['game']
-        game_data['current_turn'] = 'black'
-        game_data['move_history'] = ['e4']
-        session['game'] = game_data
-        session.save()
+        state = GameState.for_session(self.client.session)
+        game = ChessGame.from_dict(state.data)
+        self.assertTrue(game.make_move(6, 4, 4, 4)[0])
+        state.store(game.to_dict())
 
         r = self.client.post('/api/new-game/', content_type='application/json')
         data = r.json()
@@ -647,6 +665,7 @@ class CheckPromotionTest(TestCase):
 
     def setUp(self):
         self.client.get('/play/')
+        self.client.post('/api/new-game/', content_type='application/json')
         self.promo_patcher = mock.patch('game.engine.ChessGame.is_promotion_move')
         self.mock_promo = self.promo_patcher.start()
 
@@ -679,12 +698,10 @@ class GameStateTest(TestCase):
 
     def setUp(self):
         self.client.get('/play/')
+        self.client.post('/api/new-game/', content_type='application/json')
 
     def _set_game_session(self, game):
-        session = self.client.session
-        session['game'] = game.to_dict()
-        session.save()
-        self.client.cookies[settings.SESSION_COOKIE_NAME] = session.session_key
+        GameState.for_session(self.client.session).store(game.to_dict())
 
     def test_get_state(self):
         r = self.client.get('/api/state/')
@@ -730,18 +747,727 @@ class GameStateTest(TestCase):
         self.assertEqual(data['white_time'], 600)
         self.assertEqual(data['black_time'], 600)
 
-class PauseTest(TestCase):
-    """Test the /api/pause/ endpoint."""
+    def test_since_cursor_returns_only_new_moves(self):
+        first = self.client.post(
+            '/api/move/',
+            data=json.dumps({'from_row': 6, 'from_col': 4, 'to_row': 4,
+                             'to_col': 4, 'since': 0}),
+            content_type='application/json').json()
+        self.assertEqual(first['ply'], 1)
+        self.assertEqual([m['notation'] for m in first['new_moves']], ['e4'])
+        self.assertNotIn('move_history', first)
+        self.assertNotIn('pgn', first)
+
+        self.client.post(
+            '/api/move/',
+            data=json.dumps({'from_row': 1, 'from_col': 4, 'to_row': 3,
+                             'to_col': 4, 'since': 1}),
+            content_type='application/json')
+        data = self.client.get('/api/state/?since=1').json()
+
+        self.assertEqual(data['ply'], 2)
+        self.assertEqual(data['since'], 1)
+        self.assertEqual([m['notation'] for m in data['new_moves']], ['e5'])
+
+    def test_cursor_beyond_the_game_gets_full_history(self):
+        data = self.client.get('/api/state/?since=5').json()
+
+        self.assertEqual(data['move_history'], [])
+        self.assertNotIn('new_moves', data)
+
+    def test_unchanged_state_answers_not_modified(self):
+        game = ChessGame()
+        game.paused = True
+        self._set_game_session(game)
+
+        with mock.patch('game.engine.time.time', return_value=200.0):
+            first = self.client.get('/api/state/')
+            again = self.client.get(
+                '/api/state/', HTTP_IF_NONE_MATCH=first['ETag'])
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again['ETag'], first['ETag'])
+
+        game.paused = False
+        self._set_game_session(game)
+        changed = self.client.get(
+            '/api/state/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], first['ETag'])
+
+    def test_legal_moves_only_when_asked_for(self):
+        plain = self.client.get('/api/state/')
+        self.assertNotIn('legal_moves', plain.json())
+
+        with_moves = self.client.get('/api/state/?include_moves=1')
+        legal = with_moves.json()['legal_moves']
+        self.assertEqual(sum(map(len, legal.values())), 20)
+        self.assertEqual(len(legal['7,6']), 2)
+        self.assertNotEqual(with_moves['ETag'], plain['ETag'])
+
+    def test_move_response_carries_next_sides_legal_moves(self):
+        data = self.client.post(
+            '/api/move/',
+            data=json.dumps({'from_row': 6, 'from_col': 4, 'to_row': 4,
+                             'to_col': 4, 'include_moves': True}),
+            content_type='application/json').json()
+
+        self.assertTrue(data['valid'])
+        self.assertEqual(set(data['legal_moves']),
+                         {f"1,{c}" for c in range(8)} | {'0,1', '0,6'})
+        self.assertIn({'row': 3, 'col': 4, 'is_capture': False,
+                       'is_promotion': False}, data['legal_moves']['1,4'])
+
+    def test_busy_engine_leaves_out_legal_moves_not_the_move(self):
+        busy = admission.EngineBusy('The engine is busy.', 429, 1)
+        with mock.patch.object(
+                ChessGame, 'get_all_valid_moves', side_effect=busy):
+            response = self.client.post(
+                '/api/move/',
+                data=json.dumps({'from_row': 6, 'from_col': 4, 'to_row': 4,
+                                 'to_col': 4, 'include_moves': True}),
+                content_type='application/json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['valid'])
+        self.assertNotIn('legal_moves', response.json())
+        state = GameState.for_session(self.client.session)
+        self.assertEqual(state.data['current_turn'], 'black')
+
+class GameEventsTest(TestCase):
+    """Tests for the /api/events/ Server-Sent Events stream."""
+
+    @staticmethod
+    def _parse(chunk):
+        if isinstance(chunk, bytes):
+            chunk = chunk.decode()
+        name, data = chunk.split('\n')[:2]
+        return name[len('event: '):], json.loads(data[len('data: '):])
+
+    async def _open(self, url='/api/events/'):
+        response = await self.async_client.get(url)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = response.streaming_content.__aiter__()
+        self.assertTrue((await anext(events)).startswith(b'retry: '))
+        return events
+
+    async def test_requires_a_game(self):
+        response = await self.async_client.get('/api/events/')
+        self.assertEqual(response.status_code, 404)
+
+    @mock.patch('game.views.GAME_EVENT_TICK', 0.01)
+    async def test_streams_state_moves_and_clock(self):
+        await self.async_client.post(
+            '/api/new-game/', content_type='application/json')
+        events = await self._open()
+        try:
+            name, data = self._parse(await anext(events))
+            self.assertEqual(name, 'state')
+            self.assertEqual(data['ply'], 0)
+            self.assertEqual(data['current_turn'], 'white')
+
+            name, data = self._parse(await anext(events))
+            self.assertEqual(name, 'clock')
+            self.assertEqual(set(data), {'white_time', 'black_time'})
+
+            await self.async_client.post(
+                '/api/move/',
+                data=json.dumps({'from_row': 6, 'from_col': 4,
+                                 'to_row': 4, 'to_col': 4}),
+                content_type='application/json')
+            # The test transaction never commits: publish as on_commit would
+            game_id = await self.async_client.session.aget(
+                GameState.SESSION_KEY)
+            events_module.publish(game_id)
+            name, data = self._parse(await anext(events))
+            while name == 'clock':
+                name, data = self._parse(await anext(events))
+        finally:
+            await events.aclose()
+        self.assertEqual(name, 'state')
+        self.assertEqual(data['since'], 0)
+        self.assertEqual([m['notation'] for m in data['new_moves']], ['e4'])
+        self.assertEqual(data['current_turn'], 'black')
+
+    def test_store_publishes_the_update_on_commit(self):
+        self.client.post('/api/new-game/', content_type='application/json')
+        state = GameState.for_session(self.client.session)
+        with (
+            mock.patch('game.models.events.publish') as publish,
+            self.captureOnCommitCallbacks(execute=True),
+        ):
+            state.store(ChessGame().to_dict())
+        publish.assert_called_once_with(state.pk)
+
+    async def test_cursor_limits_the_first_state_event(self):
+        await self.async_client.post(
+            '/api/new-game/', content_type='application/json')
+        for move in ((6, 4, 4, 4), (1, 4, 3, 4)):
+            await self.async_client.post(
+                '/api/move/',
+                data=json.dumps(dict(zip(
+                    ('from_row', 'from_col', 'to_row', 'to_col'), move))),
+                content_type='application/json')
+        events = await self._open('/api/events/?since=1')
+        try:
+            name, data = self._parse(await anext(events))
+        finally:
+            await events.aclose()
+        self.assertEqual((data['ply'], data['since']), (2, 1))
+        self.assertEqual([m['notation'] for m in data['new_moves']], ['e5'])
+
+
+class EngineAdmissionTest(SimpleTestCase):
+    """Tests for the engine slot limiter in game/admission.py."""
+
+    def _limiter(self, slots=2, search_slots=1, queue=1, timeout=0.05):
+        return admission.Limiter(
+            slots, search_slots,
+            {admission.INTERACTIVE: queue, admission.SEARCH: queue},
+            timeout)
+
+    def test_commands_are_classified_by_name(self):
+        self.assertEqual(admission.priority_for('BESTMOVE x w 4'),
+                         admission.SEARCH)
+        self.assertEqual(admission.priority_for('MOVES x w 6 4'),
+                         admission.INTERACTIVE)
+
+    def test_searches_leave_a_slot_for_interactive_commands(self):
+        limiter = self._limiter(queue=0)
+        limiter.acquire(admission.SEARCH)
+        with self.assertRaises(admission.EngineBusy) as caught:
+            limiter.acquire(admission.SEARCH)
+        self.assertEqual(caught.exception.status, 429)
+        limiter.acquire(admission.INTERACTIVE)
+        self.assertEqual(limiter.load()['running'], [1, 1])
+
+    def test_queued_command_times_out_with_503(self):
+        limiter = self._limiter(slots=1)
+        limiter.acquire(admission.SEARCH)
+        with self.assertRaises(admission.EngineBusy) as caught:
+            limiter.acquire(admission.SEARCH)
+        self.assertEqual(caught.exception.status, 503)
+        self.assertEqual(limiter.load()['queued'], [0, 0])
+
+    def test_interactive_commands_are_admitted_before_queued_searches(self):
+        limiter = self._limiter(slots=1, queue=2, timeout=5)
+        limiter.acquire(admission.INTERACTIVE)
+        order = []
+
+        def run(priority):
+            limiter.acquire(priority)
+            order.append(priority)
+            limiter.release(priority)
+
+        search = threading.Thread(target=run, args=(admission.SEARCH,))
+        search.start()
+        while limiter.load()['queued'] != [0, 1]:
+            time.sleep(0.001)
+        interactive = threading.Thread(
+            target=run, args=(admission.INTERACTIVE,))
+        interactive.start()
+        while limiter.load()['queued'] != [1, 1]:
+            time.sleep(0.001)
+        limiter.release(admission.INTERACTIVE)
+        search.join(5)
+        interactive.join(5)
+        self.assertEqual(order, [admission.INTERACTIVE, admission.SEARCH])
+
+
+class EngineBusyViewTest(TestCase):
+    """Saturated engine slots are answered with 429/503."""
+
+    def test_busy_engine_answers_with_retry_after(self):
+        self.client.post('/api/new-game/',
+                         data=json.dumps({'mode': 'ai'}),
+                         content_type='application/json')
+        busy = admission.EngineBusy('The engine is busy.', 429, 5)
+        with mock.patch.object(ChessGame, 'get_ai_move', side_effect=busy):
+            response = self.client.post(
+                '/api/ai-move/', content_type='application/json')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '5')
+        self.assertEqual(response.json()['retry_after'], 5)
+
+
+class AIDegradationTest(TestCase):
+    """Tests for the get_ai_move degradation ladder."""
 
     def setUp(self):
+        self.limiter = admission.Limiter(
+            2, 1, {admission.INTERACTIVE: 4, admission.SEARCH: 4}, 5)
+        patches = [
+            mock.patch('game.admission._limiter', self.limiter),
+            mock.patch.object(
+                ChessGame, 'get_opening_book_move', return_value=None),
+            mock.patch.object(ChessGame, 'get_cached_move', return_value=None),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.depths = []
+
+    def _engine(self, answers):
+        """Fake engine answering BESTMOVE from *answers* by depth."""
+        def engine(cmd, **limits):
+            if cmd.startswith('BESTMOVE'):
+                depth = int(cmd.split()[6])
+                self.depths.append(depth)
+                return answers.get(depth, '')
+            return 'LEGAL 6 4 4 4 0 0'
+        return mock.patch.object(ChessGame, '_call_engine', side_effect=engine)
+
+    def test_idle_engine_runs_the_full_search(self):
+        with self._engine({4: 'BESTMOVE 6 3 4 3'}):
+            move = ChessGame().get_ai_move(depth=4)
+        self.assertEqual((move['from_col'], self.depths), (3, [4]))
+
+    def test_budget_only_caps_the_search_under_load(self):
+        with self._engine({4: 'BESTMOVE 6 3 4 3'}) as engine:
+            ChessGame().get_ai_move(depth=4, budget=4)
+        self.assertIsNone(engine.call_args.kwargs['deadline'])
+
+        with (
+            mock.patch.object(self.limiter, 'expected_wait', return_value=0.1),
+            self._engine({4: 'BESTMOVE 6 3 4 3'}) as engine,
+        ):
+            ChessGame().get_ai_move(depth=4, budget=4)
+        self.assertLessEqual(
+            engine.call_args.kwargs['deadline'], time.monotonic() + 3)
+
+    def test_queue_wait_comes_out_of_the_run_time(self):
+        @contextlib.contextmanager
+        def slow_slot(command, timeout=None):
+            time.sleep(0.2)
+            yield
+
+        with (
+            mock.patch.object(ChessGame, 'ENGINE_ADMISSION', True),
+            mock.patch.object(ChessGame, '_resolve_engine_path',
+                              return_value='engine'),
+            mock.patch('game.admission.slot', slow_slot),
+            mock.patch.object(ChessGame, '_run_engine',
+                              return_value='BESTMOVE 6 3 4 3') as run,
+        ):
+            answered, _ = ChessGame()._search_within(
+                4, time.monotonic() + 1)
+        self.assertTrue(answered)
+        self.assertLessEqual(run.call_args.args[2], 0.8)
+
+    def test_no_legal_move_ends_the_ladder(self):
+        game = ChessGame()
+        with self._engine({4: 'BESTMOVE NONE'}) as engine:
+            self.assertIsNone(game.get_ai_move(depth=4))
+        self.assertEqual((self.depths, engine.call_count), ([4], 1))
+        self.assertEqual(game.ai_rung, 'search')
+
+    def test_failed_search_falls_back_to_a_shallower_one(self):
+        game = ChessGame()
+        with self._engine({2: 'BESTMOVE 6 3 4 3'}):
+            move = game.get_ai_move(depth=4)
+        self.assertEqual(self.depths, [4, 2])
+        self.assertEqual((move['from_col'], game.ai_rung), (3, 'shallow'))
+
+    def test_long_queue_skips_searching(self):
+        game = ChessGame()
+        with (
+            mock.patch.object(self.limiter, 'expected_wait', return_value=60),
+            self._engine({4: 'BESTMOVE 6 3 4 3'}),
+        ):
+            move = game.get_ai_move(depth=4)
+        self.assertEqual(self.depths, [])
+        self.assertEqual(game.ai_rung, 'heuristic')
+        self.assertEqual(move, {'from_row': 6, 'from_col': 4,
+                                'to_row': 4, 'to_col': 4})
+
+    def test_heuristic_move_takes_the_most_valuable_piece(self):
+        game = ChessGame.from_fen('4k3/8/8/3q1r2/4P3/8/8/4K3 w - -')
+        self.assertEqual(game.heuristic_move(), {
+            'from_row': 4, 'from_col': 4, 'to_row': 3, 'to_col': 3})
+
+    def test_ai_move_reports_the_rung(self):
+        self.client.post('/api/new-game/',
+                         data=json.dumps({'mode': 'ai'}),
+                         content_type='application/json')
+        with self._engine({2: 'BESTMOVE 6 3 4 3'}):
+            response = self.client.post(
+                '/api/ai-move/', content_type='application/json')
+        self.assertEqual(response.json()['ai_rung'], 'search')
+
+    def test_silent_engine_is_retryable_not_a_stalemate(self):
+        self.client.post('/api/new-game/',
+                         data=json.dumps({'mode': 'ai'}),
+                         content_type='application/json')
+        with mock.patch.object(ChessGame, '_call_engine', return_value=None):
+            response = self.client.post(
+                '/api/ai-move/', content_type='application/json')
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response)
+        self.assertEqual(GameState.objects.get().status, 'active')
+        self.assertFalse(GameResult.objects.exists())
+
+
+class SpectateTest(TestCase):
+    """Tests for the cached /api/spectate/<token>/ snapshot."""
+
+    def setUp(self):
+        cache.clear()
+        response = self.client.post(
+            '/api/new-game/', content_type='application/json').json()
+        self.game_id = response['game_id']
+        self.url = f"/api/spectate/{response['spectate_token']}/"
+
+    def test_snapshot_is_built_once_per_move(self):
+        viewers = [Client(), Client()]
+        with mock.patch('game.views._spectate_snapshot',
+                        wraps=views_module._spectate_snapshot) as build:
+            first = viewers[0].get(self.url)
+            # Only the row's version is read
+            with self.assertNumQueries(1):
+                second = viewers[1].get(self.url)
+            self.assertEqual(build.call_count, 1)
+            self.assertEqual(first.content, second.content)
+            data = first.json()
+            self.assertEqual(data['ply'], 0)
+            self.assertNotIn(self.game_id, first.content.decode())
+            self.assertEqual(data['current_turn'], 'white')
+
+            # No cache invalidation is needed: the write bumps the version
+            self.client.post(
+                '/api/move/',
+                data=json.dumps({'from_row': 6, 'from_col': 4,
+                                 'to_row': 4, 'to_col': 4}),
+                content_type='application/json')
+            data = viewers[0].get(self.url).json()
+            self.assertEqual(build.call_count, 2)
+        self.assertEqual(data['ply'], 1)
+        self.assertEqual(data['recent_moves'][0]['notation'], 'e4')
+        self.assertEqual(data['current_turn'], 'black')
+
+    def test_unchanged_snapshot_answers_304(self):
+        etag = Client().get(self.url)['ETag']
+        response = Client().get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_viewer_session_is_not_touched(self):
+        viewer = Client()
+        viewer.get(self.url)
+        self.assertNotIn('sessionid', viewer.cookies)
+
+    def test_only_a_watch_token_opens_the_snapshot(self):
+        state = GameState.objects.get(pk=self.game_id)
+        for token in (self.game_id, 'forged', state.access_token('white')):
+            response = Client().get(f'/api/spectate/{token}/')
+            self.assertEqual(response.status_code, 404)
+
+
+class SocketClient:
+    """Drive one WebSocket connection to the ASGI application."""
+
+    def __init__(self, path, query=''):
+        from core.asgi import application
+        self.inbox = asyncio.Queue()
+        self.outbox = asyncio.Queue()
+        scope = {'type': 'websocket', 'path': path,
+                 'query_string': query.encode()}
+        self.task = asyncio.ensure_future(
+            application(scope, self.inbox.get, self.outbox.put))
+        self.inbox.put_nowait({'type': 'websocket.connect'})
+
+    async def receive(self):
+        return await asyncio.wait_for(self.outbox.get(), 5)
+
+    async def receive_json(self):
+        message = await self.receive()
+        if message['type'] != 'websocket.send':
+            raise AssertionError(f'Expected a message, got {message}')
+        return json.loads(message['text'])
+
+    async def send_json(self, data):
+        await self.inbox.put({'type': 'websocket.receive',
+                              'text': json.dumps(data)})
+
+    async def close(self):
+        await self.inbox.put({'type': 'websocket.disconnect', 'code': 1000})
+        await asyncio.wait_for(self.task, 5)
+
+
+class GameSocketTest(TransactionTestCase):
+    """Tests for the /ws/game/<id>/ WebSocket transport."""
+
+    E4 = {'type': 'move', 'from_row': 6, 'from_col': 4,
+          'to_row': 4, 'to_col': 4}
+
+    async def _game(self, mode='pvp'):
+        game = ChessGame()
+        game.mode = mode
+        data = game.to_dict()
+        self.state = await GameState.objects.acreate(
+            data=data, status=data['game_status'], last_ts=data['last_ts'])
+        return f'/ws/game/{self.state.pk}/'
+
+    def _seat(self, color, state=None):
+        token = (state or self.state).access_token(color)
+        return urlencode({'token': token})
+
+    async def test_moves_fan_out_to_both_players(self):
+        path = await self._game()
+        white = SocketClient(path, self._seat('white'))
+        black = SocketClient(path, self._seat('black'))
+        try:
+            for socket in (white, black):
+                self.assertEqual(
+                    await socket.receive(), {'type': 'websocket.accept'})
+                state = await socket.receive_json()
+                self.assertEqual((state['type'], state['ply']), ('state', 0))
+
+            await white.send_json(self.E4)
+            for socket in (white, black):
+                state = await socket.receive_json()
+                self.assertEqual(state['type'], 'state')
+                self.assertEqual((state['ply'], state['since']), (1, 0))
+                self.assertEqual(state['new_moves'][0]['notation'], 'e4')
+                self.assertEqual(state['current_turn'], 'black')
+
+            await white.send_json(self.E4)
+            error = await white.receive_json()
+            self.assertEqual(error['type'], 'error')
+            self.assertIn('not your turn', error['message'])
+        finally:
+            await white.close()
+            await black.close()
+
+    async def test_rejects_moves_it_cannot_play(self):
+        path = await self._game()
+        watcher = SocketClient(path, 'since=5')
+        try:
+            await watcher.receive()
+            self.assertEqual((await watcher.receive_json())['since'], 0)
+            for message in ('not json', json.dumps({'type': 'chat'}),
+                            json.dumps({**self.E4, 'to_row': 9}),
+                            json.dumps(self.E4)):
+                await watcher.inbox.put(
+                    {'type': 'websocket.receive', 'text': message})
+                self.assertEqual(
+                    (await watcher.receive_json())['type'], 'error')
+        finally:
+            await watcher.close()
+
+        player = SocketClient(
+            await self._game(mode='ai'), self._seat('white'))
+        try:
+            await player.receive()
+            await player.receive_json()
+            await player.send_json(self.E4)
+            error = await player.receive_json()
+            self.assertIn('PvP', error['message'])
+        finally:
+            await player.close()
+
+    async def test_side_comes_only_from_a_genuine_seat_token(self):
+        other = await self._game()
+        other_state = self.state
+        path = await self._game()
+        for query in ('color=white', 'token=forged',
+                      self._seat('white', other_state),
+                      self._seat('watch')):
+            socket = SocketClient(path, query)
+            try:
+                await socket.receive()
+                await socket.receive_json()
+                await socket.send_json(self.E4)
+                error = await socket.receive_json()
+                self.assertIn('only watches', error['message'])
+            finally:
+                await socket.close()
+        self.assertNotEqual(other, path)
+
+    def test_new_game_hands_out_the_seats(self):
+        response = self.client.post(
+            '/api/new-game/', content_type='application/json').json()
+        game_id = response['game_id']
+        self.assertEqual(game_id, self.client.session[GameState.SESSION_KEY])
+        for color in ('white', 'black'):
+            self.assertEqual(
+                GameState.read_access_token(response['seats'][color]),
+                (game_id, color))
+        self.assertEqual(
+            self.client.get('/api/state/').json()['seats'], response['seats'])
+
+    async def test_mate_is_recorded_for_the_games_owner(self):
+        user = await User.objects.acreate_user('owner', password='pw')
+        game = ChessGame.from_fen(
+            'rnbqkbnr/pppp1ppp/8/4p3/6P1/5P2/PPPPP2P/RNBQKBNR b KQkq - 0 2')
+        game.mode = 'pvp'
+        data = game.to_dict()
+        self.state = await GameState.objects.acreate(
+            data=data, status=data['game_status'], last_ts=data['last_ts'],
+            user=user)
+        black = SocketClient(
+            f'/ws/game/{self.state.pk}/', self._seat('black'))
+        try:
+            await black.receive()
+            await black.receive_json()
+            with mock.patch('game.services.check_game_achievements') as check:
+                await black.send_json({'type': 'move', 'from_row': 0,
+                                       'from_col': 3, 'to_row': 4,
+                                       'to_col': 7})
+                state = await black.receive_json()
+            self.assertEqual(state['game_status'], 'checkmate')
+        finally:
+            await black.close()
+
+        result = await GameResult.objects.aget()
+        self.assertEqual(
+            (result.user_id, result.winner, result.end_reason),
+            (user.pk, 'black', 'checkmate'))
+        check.assert_called_once_with(user)
+
+    async def test_closes_unknown_games_and_paths(self):
+        for path, code in (('/ws/game/%s/' % ('0' * 32), 4404),
+                           ('/ws/game/%s/' % ('a' * 35), 4404),
+                           ('/ws/elsewhere/', 4400)):
+            socket = SocketClient(path)
+            self.assertEqual(await socket.receive(),
+                             {'type': 'websocket.close', 'code': code})
+            await asyncio.wait_for(socket.task, 5)
+
+    async def test_deleted_game_ends_the_socket(self):
+        path = await self._game()
+        socket = SocketClient(path)
+        try:
+            await socket.receive()
+            await socket.receive_json()
+            game_id = path.split('/')[3]
+            await GameState.objects.filter(pk=game_id).adelete()
+            events_module.publish(game_id)
+            self.assertEqual(await socket.receive_json(), {'type': 'gone'})
+            self.assertEqual((await socket.receive())['code'], 1000)
+        finally:
+            await socket.close()
+
+
+class GameStateStorageTest(TestCase):
+    """Games live in GameState rows; the session only points at them."""
+
+    def _move(self, fr, fc, tr, tc):
+        return self.client.post(
+            '/api/move/',
+            data=json.dumps({'from_row': fr, 'from_col': fc,
+                             'to_row': tr, 'to_col': tc}),
+            content_type='application/json')
+
+    def test_session_holds_only_the_game_id(self):
+        self.assertTrue(self._move(6, 4, 4, 4).json()['valid'])
+        session = self.client.session
+
+        self.assertNotIn('game', session)
+        state = GameState.objects.get(pk=session[GameState.SESSION_KEY])
+        self.assertEqual(state.status, 'active')
+        self.assertEqual(state.data['moves'], '6444P..e4')
+
+    def test_page_view_creates_no_game(self):
+        from django.contrib.sessions.models import Session
+
         self.client.get('/play/')
+        r = self.client.get('/api/valid-moves/?row=6&col=4')
 
-    def _set_game_session(self, game):
+        self.assertEqual(len(r.json()['valid_moves']), 2)
+        self.assertFalse(GameState.objects.exists())
+        self.assertFalse(Session.objects.exists())
+
+    def test_state_poll_does_not_write(self):
+        self.client.post('/api/new-game/', content_type='application/json')
+        state = GameState.for_session(self.client.session)
+
+        for _ in range(3):
+            self.client.get('/api/state/')
+
+        written = GameState.objects.get(pk=state.pk)
+        self.assertEqual(written.version, 0)
+        self.assertEqual(written.updated_at, state.updated_at)
+
+    def test_game_is_dirty_only_after_a_change(self):
+        game = ChessGame.from_dict(ChessGame().to_dict())
+        self.assertFalse(game.is_dirty())
+
+        self.assertTrue(game.make_move(6, 4, 4, 4)[0])
+        self.assertTrue(game.is_dirty())
+        game.mark_saved(game.to_dict())
+        self.assertFalse(game.is_dirty())
+
+    def test_stale_write_is_rejected(self):
+        state = GameState.objects.create(data=ChessGame().to_dict())
+        stale = GameState.objects.get(pk=state.pk)
+        state.store(ChessGame().to_dict())
+
+        with self.assertRaises(GameState.Conflict):
+            stale.store(ChessGame().to_dict())
+        state.refresh_from_db()
+        self.assertEqual(state.version, 1)
+
+    def test_concurrent_update_answers_conflict(self):
+        self.client.post('/api/new-game/', content_type='application/json')
+        state = GameState.for_session(self.client.session)
+
+        original_from_dict = ChessGame.from_dict
+
+        def from_dict_then_race(data):
+            # Another request writes the row between our read and write
+            GameState.objects.filter(pk=state.pk).update(version=5)
+            return original_from_dict(data)
+
+        with mock.patch.object(ChessGame, 'from_dict',
+                               side_effect=from_dict_then_race):
+            r = self.client.post(
+                '/api/pause/', data=json.dumps({'pause': True}),
+                content_type='application/json')
+
+        self.assertEqual(r.status_code, 409)
+        self.assertFalse(r.json()['valid'])
+
+    def test_game_stored_in_session_is_moved_to_a_row(self):
         session = self.client.session
+        game = ChessGame()
+        self.assertTrue(game.make_move(6, 4, 4, 4)[0])
         session['game'] = game.to_dict()
         session.save()
         self.client.cookies[settings.SESSION_COOKIE_NAME] = session.session_key
 
+        r = self.client.get('/api/state/')
+
+        self.assertEqual(r.json()['move_history'][0]['notation'], 'e4')
+        session = self.client.session
+        self.assertNotIn('game', session)
+        self.assertTrue(GameState.objects.filter(
+            pk=session[GameState.SESSION_KEY]).exists())
+
+    def test_migrated_session_game_keeps_its_user(self):
+        user = User.objects.create_user('legacy', password='pw')
+        self.client.force_login(user)
+        session = self.client.session
+        session['game'] = ChessGame().to_dict()
+        session.save()
+
+        self.client.get('/api/state/')
+
+        state = GameState.objects.get(
+            pk=self.client.session[GameState.SESSION_KEY])
+        self.assertEqual(state.user, user)
+
+
+class PauseTest(TestCase):
+    """Test the /api/pause/ endpoint."""
+
+    def setUp(self):
+        self.client.get('/play/')
+        self.client.post('/api/new-game/', content_type='application/json')
+
+    def _set_game_session(self, game):
+        GameState.for_session(self.client.session).store(game.to_dict())
+
     def test_pause_toggle(self):
         r1 = self.client.post(
             '/api/pause/', data=json.dumps({'pause': True}),
@@ -787,6 +1513,7 @@ class DrawOfferTest(TestCase):
 
     def setUp(self):
         self.client.get('/play/')
+        self.client.post('/api/new-game/', content_type='application/json')
 
     def test_accept_draw_marks_game_as_draw_agreement(self):
         response = self.client.post(
@@ -872,15 +1599,100 @@ class DrawRuleTest(SimpleTestCase):
     def test_session_round_trip_preserves_draw_state(self):
         game = ChessGame()
         game.halfmove_clock = 42
-        game.repetition_history.append('test-position')
-        game._rebuild_repetition_counts()
+        game.position_hash = 0x1234
+        game._update_repetition()
 
-        restored = ChessGame.from_dict(game.to_dict())
+        data = game.to_dict()
+        restored = ChessGame.from_dict(data)
 
+        self.assertTrue(data['repetition_history'].endswith('0000000000001234'))
         self.assertEqual(restored.halfmove_clock, 42)
         self.assertEqual(restored.repetition_history, game.repetition_history)
         self.assertEqual(restored.repetition_counts, game.repetition_counts)
 
+    def test_session_encoding_is_compact_and_round_trips(self):
+        game = ChessGame()
+        for move in [(6, 4, 4, 4), (1, 3, 3, 3), (4, 4, 3, 3), (0, 3, 3, 3)]:
+            self.assertTrue(game.make_move(*move)[0])
+
+        data = game.to_dict()
+        restored = ChessGame.from_dict(json.loads(json.dumps(data)))
+
+        self.assertEqual(data['v'], ChessGame.SESSION_VERSION)
+        self.assertEqual(data['board'], game.serialize_board())
+        self.assertEqual(data['moves'].split()[:2], ['6444P..e4', '1333p..d5'])
+        self.assertEqual(restored.board, game.board)
+        self.assertEqual(restored.move_history, game.move_history)
+        self.assertEqual(restored.captured, game.captured)
+        self.assertEqual(restored.castling_rights, game.castling_rights)
+        self.assertEqual(restored.repetition_history, game.repetition_history)
+
+    def test_nested_session_layout_still_loads(self):
+        game = ChessGame()
+        self.assertTrue(game.make_move(6, 4, 4, 4)[0])
+        data = {
+            'board': [row[:] for row in game.board],
+            'current_turn': 'black',
+            'move_history': game.move_history,
+            'captured': {'white': [], 'black': []},
+            'white_time': 600, 'black_time': 600, 'last_ts': time.time(),
+            'castling_rights': dict(game.castling_rights),
+            'en_passant_target': [5, 4],
+            'repetition_history': [game.generate_position_key()],
+        }
+
+        restored = ChessGame.from_dict(data)
+
+        self.assertEqual(restored.serialize_board(), game.serialize_board())
+        self.assertEqual(restored.move_history, game.move_history)
+        self.assertEqual(restored.repetition_history, [game.position_hash])
+        self.assertEqual(ChessGame.moves_from_session(data), game.move_history)
+
+    def test_pgn_movetext_is_kept_with_the_session(self):
+        game = ChessGame()
+        for move in [(6, 4, 4, 4), (1, 4, 3, 4), (7, 6, 5, 5)]:
+            self.assertTrue(game.make_move(*move)[0])
+        self.assertEqual(game.pgn_movetext(), '1. e4 e5 2. Nf3')
+
+        data = json.loads(json.dumps(game.to_dict()))
+        self.assertEqual(data['pgn'], '1. e4 e5 2. Nf3')
+        restored = ChessGame.from_dict(data)
+        self.assertTrue(restored.make_move(0, 1, 2, 2)[0])
+        self.assertEqual(restored.pgn_movetext(), '1. e4 e5 2. Nf3 Nc6')
+        self.assertTrue(restored.generate_pgn().endswith(
+            '\n\n1. e4 e5 2. Nf3 Nc6'))
+
+        # Sessions saved before the movetext was stored rebuild it
+        del data['pgn']
+        self.assertEqual(
+            ChessGame.from_dict(data).pgn_movetext(), '1. e4 e5 2. Nf3')
+
+    def test_session_with_fen_repetition_keys_is_converted(self):
+        game = ChessGame()
+        data = game.to_dict()
+        key = game.generate_position_key()
+        data['repetition_history'] = [key, 'not a key', key]
+
+        restored = ChessGame.from_dict(data)
+
+        self.assertEqual(restored.repetition_history,
+                         [game.position_hash, game.position_hash])
+        self.assertEqual(restored.repetition_counts, {game.position_hash: 2})
+
+    def test_position_hash_is_updated_incrementally(self):
+        lines = [
+            ('r3k2r/8/8/8/8/8/8/R3K2R w KQkq - 0 1',
+             [(7, 4, 7, 6), (0, 4, 0, 2), (7, 5, 0, 5)]),
+            ('4k3/8/8/8/3p4/8/4P3/4K3 w - - 0 1',
+             [(6, 4, 4, 4), (4, 3, 5, 4)]),
+            ('4k3/1P6/8/8/8/8/8/4K3 w - - 0 1', [(1, 1, 0, 1, 'n')]),
+        ]
+        for fen, moves in lines:
+            game = ChessGame.from_fen(fen)
+            for move in moves:
+                self.assertTrue(game.make_move(*move)[0])
+                self.assertEqual(game.position_hash, game.zobrist_key())
+
     def test_session_round_trip_preserves_draw_metadata(self):
         game = ChessGame()
         game.game_status = 'draw'
@@ -956,6 +1768,230 @@ class AIMoveTest(TestCase):
         self.assertIn('to_col', data['ai_move'])
 
 
+class MoveAndReplyTest(TestCase):
+    """Tests for /api/move-and-reply/ (player move plus AI reply)."""
+
+    def _new_game(self, mode='ai'):
+        self.client.post(
+            '/api/new-game/',
+            data=json.dumps({'mode': mode, 'difficulty': 'easy'}),
+            content_type='application/json',
+        )
+
+    def _play(self, fr, fc, tr, tc):
+        return self.client.post(
+            '/api/move-and-reply/',
+            data=json.dumps({'from_row': fr, 'from_col': fc,
+                             'to_row': tr, 'to_col': tc,
+                             'include_moves': True}),
+            content_type='application/json',
+        )
+
+    def test_move_and_reply_are_stored_in_one_write(self):
+        self._new_game()
+        version = GameState.for_session(self.client.session).version
+
+        data = self._play(6, 4, 4, 4).json()
+
+        self.assertTrue(data['valid'])
+        self.assertEqual(data['move']['message'], 'e4')
+        self.assertEqual(data['move']['current_turn'], 'black')
+        self.assertEqual(data['move']['ply'], 1)
+        self.assertEqual(data['move']['board'][4][4], 'P')
+        self.assertIsNotNone(data['ai_move'])
+        self.assertEqual(data['current_turn'], 'white')
+        self.assertEqual(data['ply'], 2)
+        self.assertEqual(
+            [m['notation'] for m in data['move_history']][0], 'e4')
+        self.assertEqual(data['message'], data['move_history'][1]['notation'])
+        self.assertIn({'row': 4, 'col': 3, 'is_capture': False,
+                       'is_promotion': False}, data['legal_moves']['6,3'])
+
+        state = GameState.for_session(self.client.session)
+        self.assertEqual(state.version, version + 1)
+        self.assertEqual(len(ChessGame.moves_from_session(state.data)), 2)
+
+    def test_failed_reply_stores_the_players_move_alone(self):
+        self._new_game()
+        make_move = ChessGame.make_move
+        calls = []
+
+        def player_only(game, *args, **kwargs):
+            calls.append(args)
+            if len(calls) > 1:
+                # Half-played reply: nothing of it may be stored
+                game.current_turn = 'white'
+                raise admission.EngineBusy('The engine is busy.', 429, 1)
+            return make_move(game, *args, **kwargs)
+
+        with mock.patch.object(ChessGame, 'get_ai_move', return_value={
+                'from_row': 1, 'from_col': 4, 'to_row': 3, 'to_col': 4}), \
+                mock.patch.object(ChessGame, 'make_move', player_only):
+            r = self._play(6, 4, 4, 4)
+
+        data = r.json()
+        self.assertEqual(r.status_code, 200)
+        self.assertTrue(data['valid'])
+        self.assertIsNone(data['ai_move'])
+        self.assertEqual(data['current_turn'], 'black')
+        self.assertIn('1,4', data['legal_moves'])
+        state = GameState.for_session(self.client.session)
+        self.assertEqual(state.data['current_turn'], 'black')
+        self.assertEqual(len(ChessGame.moves_from_session(state.data)), 1)
+
+    def test_illegal_move_gets_no_reply(self):
+        self._new_game()
+        data = self._play(6, 4, 3, 4).json()
+        self.assertFalse(data['valid'])
+        self.assertNotIn('ai_move', data)
+        state = GameState.for_session(self.client.session)
+        self.assertEqual(ChessGame.moves_from_session(state.data), [])
+
+    def test_requires_ai_mode(self):
+        self._new_game(mode='pvp')
+        r = self._play(6, 4, 4, 4)
+        self.assertEqual(r.status_code, 400)
+        self.assertFalse(r.json()['valid'])
+
+    def test_invalid_coordinates(self):
+        self._new_game()
+        r = self._play(6, 4, 4, 9)
+        self.assertEqual(r.status_code, 400)
+
+
+class InlineExecutor:
+    """Executor stand-in that runs jobs on submit (or never, when
+    *run* is False)."""
+
+    def __init__(self, run=True):
+        self.run = run
+
+    def submit(self, fn, *args):
+        from concurrent.futures import Future
+        future = Future()
+        if self.run:
+            future.set_result(fn(*args))
+        return future
+
+
+class AIJobTest(TestCase):
+    """Tests for AI moves run as background jobs."""
+
+    E4 = {'from_row': 6, 'from_col': 4, 'to_row': 4, 'to_col': 4}
+
+    def setUp(self):
+        cache.clear()
+        self.client.post(
+            '/api/new-game/', data=json.dumps({'mode': 'ai'}),
+            content_type='application/json',
+        )
+        patcher = mock.patch.object(
+            ChessGame, 'get_ai_move', return_value=dict(self.E4))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _submit(self, run=True):
+        with mock.patch('game.jobs._get_executor',
+                        return_value=InlineExecutor(run)):
+            r = self.client.post(
+                '/api/ai-move/', data=json.dumps({'async': True}),
+                content_type='application/json',
+            )
+        self.assertEqual(r.status_code, 202)
+        return r.json()['job']
+
+    def test_job_move_is_played_when_collected(self):
+        job_id = self._submit()
+
+        r = self.client.get(f'/api/ai-move/{job_id}/')
+        data = r.json()
+        self.assertEqual(r.status_code, 200)
+        self.assertTrue(data['valid'])
+        self.assertEqual(data['ai_move'], self.E4)
+        self.assertEqual(data['current_turn'], 'black')
+        self.assertEqual(jobs.get(job_id)['status'], jobs.APPLIED)
+
+        again = self.client.get(f'/api/ai-move/{job_id}/')
+        self.assertEqual(again.status_code, 409)
+        state = GameState.for_session(self.client.session)
+        self.assertEqual(len(ChessGame.moves_from_session(state.data)), 1)
+
+    def test_running_job_answers_accepted(self):
+        job_id = self._submit(run=False)
+        r = self.client.get(f'/api/ai-move/{job_id}/')
+        self.assertEqual(r.status_code, 202)
+        self.assertEqual(r.json()['status'], jobs.PENDING)
+
+    def test_new_game_and_resignation_cancel_the_job(self):
+        job_id = self._submit(run=False)
+        self.client.post('/api/new-game/', data=json.dumps({'mode': 'ai'}),
+                         content_type='application/json')
+        self.assertEqual(jobs.get(job_id)['status'], jobs.CANCELLED)
+        self.assertEqual(
+            self.client.get(f'/api/ai-move/{job_id}/').status_code, 404)
+
+        job_id = self._submit(run=False)
+        self.client.post('/api/resign/', content_type='application/json')
+        self.assertEqual(jobs.get(job_id)['status'], jobs.CANCELLED)
+
+    def test_result_is_dropped_when_the_game_changed(self):
+        job_id = self._submit()
+        self.client.post(
+            '/api/move/', data=json.dumps(self.E4),
+            content_type='application/json',
+        )
+
+        r = self.client.get(f'/api/ai-move/{job_id}/')
+        self.assertEqual(r.status_code, 409)
+        self.assertEqual(r.json()['status'], jobs.CANCELLED)
+
+    async def _stream(self, job_id):
+        self.async_client.cookies = self.client.cookies
+        r = await self.async_client.get(f'/api/ai-move/{job_id}/events/')
+        self.assertEqual(r['Content-Type'], 'text/event-stream')
+        return r.streaming_content.__aiter__()
+
+    async def test_result_is_streamed_as_server_sent_event(self):
+        job_id = await sync_to_async(self._submit)()
+
+        body = b''.join([chunk async for chunk in await self._stream(job_id)])
+        body = body.decode()
+        self.assertTrue(body.startswith('event: result\ndata: {'))
+        self.assertEqual(
+            json.loads(body.split('data: ', 1)[1])['ai_move'], self.E4)
+
+    @mock.patch('game.views.AI_JOB_STREAM_RECHECK', 60)
+    async def test_stream_wakes_when_the_job_ends(self):
+        job_id = await sync_to_async(self._submit)(run=False)
+        chunks = await self._stream(job_id)
+        try:
+            self.assertEqual(await anext(chunks), b': pending\n\n')
+            await sync_to_async(jobs._update)(
+                job_id, status=jobs.DONE, move=dict(self.E4), rung='search')
+            chunk = await asyncio.wait_for(anext(chunks), 5)
+        finally:
+            await chunks.aclose()
+        self.assertTrue(chunk.startswith(b'event: result\n'))
+
+    def test_first_of_cancel_and_apply_wins(self):
+        job_id = self._submit(run=False)
+        jobs.cancel(job_id)
+        # The worker finishing late does not undo the cancellation
+        jobs._update(job_id, status=jobs.DONE, move=dict(self.E4))
+        jobs.mark_applied(job_id)
+        self.assertEqual(jobs.get(job_id)['status'], jobs.CANCELLED)
+
+        job_id = self._submit()
+        self.assertEqual(
+            self.client.get(f'/api/ai-move/{job_id}/').status_code, 200)
+        jobs.cancel(job_id)
+        self.assertEqual(jobs.get(job_id)['status'], jobs.APPLIED)
+
+    def test_unknown_job(self):
+        self.assertEqual(
+            self.client.get('/api/ai-move/nope/').status_code, 404)
+
+
 class OpeningBookTest(SimpleTestCase):
     """Unit tests for the opening-book integration in ChessGame."""
 
@@ -996,6 +2032,16 @@ class OpeningBookTest(SimpleTestCase):
         # Ranks 3-6 (0-indexed 2-5) are empty at start → four '8' segments
         self.assertIn('/8/', key)
 
+    def test_fen_key_follows_moves_once_cached(self):
+        """The cached key must be refreshed by every move."""
+        game = ChessGame()
+        game.generate_fen_key()
+        self.assertTrue(game.make_move(6, 4, 4, 4)[0])
+        self.assertEqual(
+            game.generate_fen_key(),
+            'rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq',
+        )
+
     # ------------------------------------------------------------------
     # Book loading
     # ------------------------------------------------------------------
@@ -1060,22 +2106,52 @@ class OpeningBookTest(SimpleTestCase):
         # Restore
         ChessGame._opening_book = None
 
-    def test_illegal_book_moves_are_skipped(self):
-        """If validate_move rejects all candidates the result is None."""
+    def test_book_lookup_makes_no_engine_calls(self):
+        """Books are validated at build time, so lookups never hit the engine."""
         game = ChessGame()
         ChessGame._opening_book = {
             game.generate_fen_key(): [[6, 4, 4, 4]],
         }
 
-        with mock.patch.object(
-            ChessGame, 'validate_move',
-            return_value=(False, 'illegal'),
+        with (
+            mock.patch.object(ChessGame, 'validate_move') as mock_validate,
+            mock.patch.object(ChessGame, '_call_engine') as mock_engine,
         ):
             move = game.get_opening_book_move()
 
-        self.assertIsNone(move)
+        mock_validate.assert_not_called()
+        mock_engine.assert_not_called()
+        self.assertEqual(
+            move, {'from_row': 6, 'from_col': 4, 'to_row': 4, 'to_col': 4})
         ChessGame._opening_book = None
 
+    def test_loader_drops_comments_and_malformed_moves(self):
+        """The JSON file is normalised once when it is loaded."""
+        handle, path = tempfile.mkstemp(suffix='.json')
+        with os.fdopen(handle, 'w') as fh:
+            json.dump({
+                '_comment': 'ignored',
+                'some fen': [[6, 4, 4, 4], [9, 9, 9, 9], 'junk'],
+            }, fh)
+        self.addCleanup(os.remove, path)
+
+        ChessGame._opening_book = None
+        with mock.patch.object(ChessGame, 'OPENING_BOOK_PATH', path):
+            book = ChessGame._load_opening_book()
+        ChessGame._opening_book = None
+
+        self.assertEqual(book, {'some fen': [(6, 4, 4, 4)]})
+
+    def test_curated_book_moves_are_legal(self):
+        """Every move in opening_book.json must be legal for the real engine."""
+        from .book_builder import book_entries_from_json
+        with open(ChessGame.OPENING_BOOK_PATH, encoding='utf-8') as fh:
+            curated = json.load(fh)
+
+        rejected = []
+        book_entries_from_json(curated, rejected=rejected)
+        self.assertEqual(rejected, [])
+
     def test_out_of_range_coords_skipped_without_calling_validate(self):
         """Out-of-range entries must be rejected by the bounds check alone.
 
@@ -1182,6 +2258,744 @@ class OpeningBookTest(SimpleTestCase):
         self.assertEqual(move['to_row'], 4)
         ChessGame._opening_book = None
 
+class BinaryOpeningBookTest(SimpleTestCase):
+    """Zobrist-keyed, memory-mapped opening book."""
+
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp(suffix='.bin')
+        os.close(handle)
+        self.addCleanup(os.remove, self.path)
+        self.addCleanup(setattr, ChessGame, '_binary_book', None)
+
+    def test_zobrist_key_matches_for_transpositions(self):
+        a, b = ChessGame(), ChessGame()
+        for move in ([7, 6, 5, 5], [0, 6, 2, 5], [7, 1, 5, 2]):
+            a.apply_recorded_move({'from': move[:2], 'to': move[2:]})
+        for move in ([7, 1, 5, 2], [0, 6, 2, 5], [7, 6, 5, 5]):
+            b.apply_recorded_move({'from': move[:2], 'to': move[2:]})
+        self.assertEqual(a.zobrist_key(), b.zobrist_key())
+        b.current_turn = 'white'
+        self.assertNotEqual(a.zobrist_key(), b.zobrist_key())
+
+    def test_zobrist_ignores_uncapturable_en_passant(self):
+        game = ChessGame()
+        before = ChessGame()
+        before.board[6][4], before.board[4][4] = None, 'P'
+        before.current_turn = 'black'
+        game.apply_recorded_move({'from': [6, 4], 'to': [4, 4]})
+        self.assertEqual(game.en_passant_target, (5, 4))
+        self.assertEqual(game.zobrist_key(), before.zobrist_key())
+
+    def test_write_and_probe_round_trip(self):
+        from .opening_book import OpeningBook, write_book
+        write_book(self.path, {
+            5: {(6, 4, 4, 4, None): 3, (6, 3, 4, 3, None): 10},
+            2**64 - 1: {(1, 0, 0, 0, 'q'): 1},
+            1: {(7, 6, 5, 5, None): 1},
+        })
+        book = OpeningBook(self.path)
+        self.addCleanup(book.close)
+
+        self.assertEqual(len(book), 4)
+        self.assertEqual(book.probe(5), [
+            ((6, 3, 4, 3, None), 10), ((6, 4, 4, 4, None), 3)])
+        self.assertEqual(book.probe(2**64 - 1), [((1, 0, 0, 0, 'q'), 1)])
+        self.assertEqual(book.probe(3), [])
+
+    def test_rejects_foreign_files(self):
+        from .opening_book import OpeningBook
+        with open(self.path, 'wb') as fh:
+            fh.write(b'not a book at all')
+        with self.assertRaises(ValueError):
+            OpeningBook(self.path)
+
+    def test_ai_prefers_binary_book(self):
+        from .opening_book import OpeningBook, write_book
+        game = ChessGame()
+        write_book(self.path, {game.zobrist_key(): {(6, 2, 4, 2, None): 1}})
+        ChessGame._binary_book = OpeningBook(self.path)
+        self.addCleanup(ChessGame._binary_book.close)
+
+        with mock.patch.object(
+            ChessGame, 'validate_move', return_value=(True, 'ok'),
+        ):
+            move = game.get_opening_book_move()
+
+        self.assertEqual(
+            move, {'from_row': 6, 'from_col': 2, 'to_row': 4, 'to_col': 2})
+
+    def test_binary_book_miss_falls_back_to_json_book(self):
+        from .opening_book import OpeningBook, write_book
+        game = ChessGame()
+        write_book(self.path, {1: {(7, 6, 5, 5, None): 1}})
+        ChessGame._binary_book = OpeningBook(self.path)
+        self.addCleanup(ChessGame._binary_book.close)
+
+        with mock.patch.object(ChessGame, '_load_learned_book',
+                               return_value=None), \
+                mock.patch.object(ChessGame, '_load_opening_book', return_value={
+                    game.generate_fen_key(): [[6, 3, 4, 3]]}):
+            move = game.get_opening_book_move()
+
+        self.assertEqual(
+            move, {'from_row': 6, 'from_col': 3, 'to_row': 4, 'to_col': 3})
+
+    def test_pgn_parsing_keeps_main_line_only(self):
+        from .opening_book import iter_pgn_games
+        pgn = (
+            '[Event "A"]\n[Result "1-0"]\n\n'
+            '1. e4 {best by test} e5 (1... c5 2. Nf3) 2. Nf3 $1 Nc6 1-0\n\n'
+            '[Event "B"]\n\n1.d4 d5 *\n'
+        )
+        self.assertEqual(list(iter_pgn_games(pgn)), [
+            (['e4', 'e5', 'Nf3', 'Nc6'], '1-0'),
+            (['d4', 'd5'], '*'),
+        ])
+
+    def test_build_book_from_json_and_pgn(self):
+        from .opening_book import read_book_entries
+        handle, pgn_path = tempfile.mkstemp(suffix='.pgn')
+        with os.fdopen(handle, 'w') as fh:
+            fh.write('1. e4 e5 2. Nf3 Nc6 *\n\n1. e4 c5 *\n')
+        self.addCleanup(os.remove, pgn_path)
+
+        with mock.patch.object(
+            ChessGame, 'validate_move', return_value=(True, 'ok'),
+        ):
+            call_command(
+                'build_book', pgn=[pgn_path], output=self.path,
+                stdout=StringIO())
+
+        entries = read_book_entries(self.path)
+        start = entries[ChessGame().zobrist_key()]
+        # 1.e4 appears in the curated book and in both PGN games
+        self.assertEqual(start[(6, 4, 4, 4, None)], 3)
+        self.assertEqual(start[(6, 3, 4, 3, None)], 1)
+
+
+class LearnedOpeningBookTest(TestCase):
+    """Opening book learned from stored games by ``build_learned_book``."""
+
+    E4_E5 = [
+        {'from': [6, 4], 'to': [4, 4], 'piece': 'P', 'color': 'white'},
+        {'from': [1, 4], 'to': [3, 4], 'piece': 'p', 'color': 'black'},
+    ]
+    D4_D5 = [
+        {'from': [6, 3], 'to': [4, 3], 'piece': 'P', 'color': 'white'},
+        {'from': [1, 3], 'to': [3, 3], 'piece': 'p', 'color': 'black'},
+    ]
+
+    def setUp(self):
+        tmp = tempfile.mkdtemp()
+        self.state = os.path.join(tmp, 'learned.json')
+        self.output = os.path.join(tmp, 'book.bin')
+        self.addCleanup(self._cleanup, tmp)
+
+    @staticmethod
+    def _cleanup(tmp):
+        for name in os.listdir(tmp):
+            os.remove(os.path.join(tmp, name))
+        os.rmdir(tmp)
+        ChessGame._learned_book = None
+
+    def _store(self, moves, winner, count=1):
+        from .models import GameResult
+        for _ in range(count):
+            GameResult.objects.create(
+                mode='pvp', winner=winner, end_reason='resign',
+                player_color='white', moves=moves)
+
+    def _build(self, **options):
+        from .opening_book import read_book_entries
+        call_command(
+            'build_learned_book', state=self.state, output=self.output,
+            no_curated=True, stdout=StringIO(), **options)
+        return read_book_entries(self.output)
+
+    def test_only_winning_moves_are_learned(self):
+        from .models import GameResult
+        from .book_builder import mine_book_moves
+        self._store(self.E4_E5, 'black')
+        self._store(self.D4_D5, 'draw')
+
+        counts, _ = mine_book_moves(GameResult.objects.order_by('pk'))
+        after_e4 = ChessGame()
+        after_e4.apply_recorded_move(self.E4_E5[0])
+        self.assertEqual(counts, {
+            after_e4.zobrist_key(): {(1, 4, 3, 4, None): 1},
+        })
+
+        counts, _ = mine_book_moves(
+            GameResult.objects.order_by('pk'), include_draws=True)
+        self.assertEqual(
+            counts[ChessGame().zobrist_key()], {(6, 3, 4, 3, None): 1})
+
+    def test_min_count_and_incremental_rebuild(self):
+        start = ChessGame().zobrist_key()
+        self._store(self.E4_E5, 'white', count=2)
+        self._store(self.D4_D5, 'white', count=1)
+
+        entries = self._build(min_count=2)
+        self.assertEqual(entries[start], {(6, 4, 4, 4, None): 2})
+
+        self._store(self.D4_D5, 'white', count=1)
+        entries = self._build(min_count=2)
+        # Earlier games are not replayed again, so 1.e4 is still counted twice
+        self.assertEqual(entries[start], {
+            (6, 4, 4, 4, None): 2, (6, 3, 4, 3, None): 2})
+
+    def test_curated_book_is_merged(self):
+        self._store(self.E4_E5, 'white', count=3)
+        from .opening_book import read_book_entries
+        with mock.patch.object(
+            ChessGame, 'validate_move', return_value=(True, 'ok'),
+        ):
+            call_command(
+                'build_learned_book', state=self.state, output=self.output,
+                curated_weight=7, min_count=1, stdout=StringIO())
+        start = read_book_entries(self.output)[ChessGame().zobrist_key()]
+        self.assertEqual(start[(6, 4, 4, 4, None)], 10)
+        self.assertEqual(start[(7, 6, 5, 5, None)], 7)
+
+    def test_learned_book_is_probed_after_the_compiled_one(self):
+        from .opening_book import OpeningBook, read_book_entries, write_book
+        game = ChessGame()
+        compiled = os.path.join(os.path.dirname(self.output), 'compiled.bin')
+        write_book(compiled, {1: {(6, 2, 4, 2, None): 1}})
+        self._store(self.E4_E5, 'white')
+        with mock.patch.object(
+                ChessGame, 'LEARNED_BOOK_BIN_PATH', self.output):
+            call_command(
+                'build_learned_book', state=self.state, min_count=1,
+                no_curated=True, stdout=StringIO())
+            ChessGame._binary_book = OpeningBook(compiled)
+            self.addCleanup(setattr, ChessGame, '_binary_book', None)
+            self.addCleanup(ChessGame._binary_book.close)
+            move = game.get_opening_book_move()
+            self.addCleanup(ChessGame._learned_book.close)
+
+        self.assertEqual(read_book_entries(compiled),
+                         {1: {(6, 2, 4, 2, None): 1}})
+        self.assertEqual(
+            move, {'from_row': 6, 'from_col': 4, 'to_row': 4, 'to_col': 4})
+
+
+class PositionCacheTest(TestCase):
+    """Offline warming of deep AI replies via ``warm_positions``."""
+
+    OPENING = [
+        {'from': [6, 4], 'to': [4, 4], 'piece': 'P', 'color': 'white'},
+        {'from': [1, 4], 'to': [3, 4], 'piece': 'p', 'color': 'black'},
+        {'from': [7, 6], 'to': [5, 5], 'piece': 'N', 'color': 'white'},
+    ]
+
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp(suffix='.json')
+        os.close(handle)
+        os.remove(self.path)
+        self.addCleanup(self._cleanup)
+        ChessGame._position_cache = None
+        ChessGame._opening_book = {}
+
+    def _cleanup(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        ChessGame._position_cache = None
+        ChessGame._position_cache_mtime = None
+        ChessGame._opening_book = None
+
+    @staticmethod
+    def _fake_engine(cmd, **limits):
+        if cmd.startswith('STATUS'):
+            return 'STATUS ok'
+        return 'BESTMOVE 0 1 2 2'
+
+    def _store_games(self, count, moves=None):
+        from .models import GameResult
+        for _ in range(count):
+            GameResult.objects.create(
+                mode='ai', winner='white', end_reason='checkmate',
+                player_color='white', moves=moves or self.OPENING)
+
+    def _warm(self, **options):
+        call_command(
+            'warm_positions', output=self.path, workers=2,
+            stdout=StringIO(), **options)
+        with open(self.path, encoding='utf-8') as fh:
+            return json.load(fh)
+
+    def test_replay_tracks_castling_and_en_passant(self):
+        game = ChessGame()
+        for move in [
+            {'from': [6, 4], 'to': [4, 4]},
+            {'from': [1, 0], 'to': [2, 0]},
+            {'from': [4, 4], 'to': [3, 4]},
+            {'from': [1, 3], 'to': [3, 3]},
+        ]:
+            game.apply_recorded_move(move)
+        self.assertEqual(game.en_passant_target, (2, 3))
+        game.apply_recorded_move({'from': [3, 4], 'to': [2, 3]})
+        self.assertIsNone(game.board[3][3])
+        self.assertEqual(game.board[2][3], 'P')
+        self.assertEqual(game.current_turn, 'black')
+
+    def test_replay_rejects_moves_for_wrong_side(self):
+        with self.assertRaises(ValueError):
+            ChessGame().apply_recorded_move({'from': [1, 4], 'to': [3, 4]})
+
+    def test_command_warms_frequent_positions(self):
+        self._store_games(3)
+        self._store_games(1, moves=self.OPENING[:1] + [
+            {'from': [1, 2], 'to': [3, 2], 'piece': 'p', 'color': 'black'},
+        ])
+
+        with mock.patch.object(
+            ChessGame, '_call_engine', side_effect=self._fake_engine,
+        ):
+            state = self._warm(min_count=3)
+
+        # e4 (4 games), e4 e5 and e4 e5 Nf3 (3 games each); 1...c5 is rare
+        self.assertEqual(len(state['positions']), 3)
+        entry = next(iter(state['positions'].values()))
+        self.assertEqual(entry['move'], [0, 1, 2, 2])
+        self.assertEqual(entry['status'], 'ok')
+        from .models import GameResult
+        self.assertEqual(
+            state['last_game_id'], GameResult.objects.latest('pk').pk)
+
+    def test_command_is_incremental(self):
+        self._store_games(3)
+        with mock.patch.object(
+            ChessGame, '_call_engine', side_effect=self._fake_engine,
+        ):
+            self._warm(min_count=3)
+
+        with mock.patch.object(ChessGame, '_call_engine') as mock_engine:
+            state = self._warm(min_count=3)
+        mock_engine.assert_not_called()
+        self.assertEqual(len(state['positions']), 3)
+
+        self._store_games(3, moves=self.OPENING[:1] + [
+            {'from': [1, 2], 'to': [3, 2], 'piece': 'p', 'color': 'black'},
+        ])
+        with mock.patch.object(
+            ChessGame, '_call_engine', side_effect=self._fake_engine,
+        ) as mock_engine:
+            state = self._warm(min_count=3)
+        # Only the newly popular 1.e4 c5 position is searched
+        self.assertEqual(mock_engine.call_count, 2)
+        self.assertEqual(len(state['positions']), 4)
+
+    def test_get_ai_move_uses_cache_without_engine(self):
+        game = ChessGame()
+        game.apply_recorded_move(self.OPENING[0])
+        ChessGame._position_cache = {
+            game.generate_position_key(): {
+                'move': [1, 4, 3, 4], 'status': 'ok', 'depth': 6},
+        }
+
+        with mock.patch.object(ChessGame, '_call_engine') as mock_engine:
+            move = game.get_ai_move()
+            status = game.check_game_status()
+
+        mock_engine.assert_not_called()
+        self.assertEqual(
+            move,
+            {'from_row': 1, 'from_col': 4, 'to_row': 3, 'to_col': 4})
+        self.assertEqual(status, 'ok')
+
+    def test_cache_is_skipped_below_full_strength(self):
+        game = ChessGame()
+        game.apply_recorded_move(self.OPENING[0])
+        ChessGame._position_cache = {
+            game.generate_position_key(): {
+                'move': [1, 4, 3, 4], 'status': 'ok', 'depth': 6},
+        }
+
+        with mock.patch.object(
+            ChessGame, '_bestmove', return_value=(True, 'search'),
+        ) as bestmove:
+            self.assertEqual(game.get_ai_move(depth=1), 'search')
+            self.assertEqual(game.ai_rung, 'search')
+            bestmove.assert_called_once()
+        # Nor is an entry searched shallower than asked served
+        self.assertIsNone(game.get_cached_move(depth=7))
+        self.assertIsNotNone(game.get_cached_move(depth=6))
+
+    def test_running_process_reloads_a_rewritten_cache(self):
+        game = ChessGame()
+        key = game.generate_position_key()
+
+        def write(move, mtime):
+            # As another process's warm_positions run would
+            with open(self.path, 'w', encoding='utf-8') as fh:
+                json.dump({'positions': {
+                    key: {'move': move, 'status': 'ok', 'depth': 6}}}, fh)
+            os.utime(self.path, ns=(mtime, mtime))
+
+        with mock.patch.object(ChessGame, 'POSITION_CACHE_PATH', self.path):
+            write([6, 4, 4, 4], 1_000_000_000)
+            self.assertEqual(game.get_cached_move()['to_row'], 4)
+            write([6, 3, 5, 3], 2_000_000_000)
+            self.assertEqual(game.get_cached_move()['to_row'], 5)
+
+
+class EndgameBitbaseTest(SimpleTestCase):
+    """KQK/KRK/KPK bitbases built by ``build_bitbases``."""
+
+    def _probe(self, fen):
+        return ChessGame.from_fen(fen).probe_endgame()
+
+    def test_known_results(self):
+        # King in front of the pawn with the opposition wins
+        self.assertEqual(self._probe('4k3/8/4K3/4P3/8/8/8/8 b - - 0 1'), 'white')
+        # Rook pawn with the defender in the corner is a draw
+        self.assertEqual(self._probe('k7/8/K7/P7/8/8/8/8 w - - 0 1'), 'draw')
+        # Undefended rook next to the lone king falls
+        self.assertEqual(self._probe('8/8/8/8/8/K7/8/1Rk5 b - - 0 1'), 'draw')
+        # Stalemate
+        self.assertEqual(self._probe('k7/2Q5/1K6/8/8/8/8/8 b - - 0 1'), 'draw')
+        # Colours are mirrored for a black strong side
+        self.assertEqual(self._probe('8/8/8/3q4/8/4k3/8/4K3 w - - 0 1'), 'black')
+
+    def test_uncovered_positions(self):
+        self.assertIsNone(self._probe('4k3/8/8/8/8/8/8/R3K2R w KQ - 0 1'))
+        self.assertIsNone(self._probe('4k3/8/8/8/8/8/8/R3K3 w Q - 0 1'))
+        self.assertIsNone(self._probe('4k3/8/8/8/8/8/8/1N2K3 w - - 0 1'))
+
+    def test_engine_keeps_won_pawn_ending(self):
+        # Without the bitbase the search plays Kc3, after which ...Kg7
+        # reaches the pawn's square and draws.
+        game = ChessGame.from_fen('8/7k/8/8/8/8/3K2P1/8 w - - 0 1')
+        move = game.search_best_move(depth=3)
+        self.assertIsNotNone(move)
+        game.make_move(move['from_row'], move['from_col'],
+                       move['to_row'], move['to_col'])
+        self.assertEqual(game.probe_endgame(), 'white')
+
+    def test_no_extra_depth_for_bitbase_endings(self):
+        game = ChessGame.from_fen('8/8/8/3k4/8/8/8/R3K3 w - - 0 1')
+        with mock.patch.object(ChessGame, '_resolve_engine_path',
+                               return_value='/engine/main'):
+            self.assertEqual(
+                game._get_ai_search_depth(), ChessGame.AI_SEARCH_DEPTH_CPP)
+            game.board[0][0] = 'r'
+            self.assertEqual(
+                game._get_ai_search_depth(), ChessGame.AI_SEARCH_DEPTH_CPP + 2)
+
+
+class MateSearchTest(SimpleTestCase):
+    """The engine's MATE command and the BESTMOVE mate shortcut."""
+
+    # 1. Rd8+ Rxd8 2. Rxd8#
+    DOUBLED_ROOKS = '2r3k1/5ppp/8/8/8/8/3R1PPP/3R2K1 w - - 0 1'
+
+    def test_finds_mating_line(self):
+        game = ChessGame.from_fen(self.DOUBLED_ROOKS)
+        mate = game.find_mate()
+
+        self.assertEqual(mate['mate_in'], 2)
+        self.assertEqual(len(mate['moves']), 3)
+        self.assertEqual(
+            mate['moves'][0],
+            {'from_row': 6, 'from_col': 3, 'to_row': 0, 'to_col': 3})
+        for move in mate['moves']:
+            game.make_move(move['from_row'], move['from_col'],
+                           move['to_row'], move['to_col'])
+        self.assertEqual(game.check_game_status(), 'checkmate')
+
+    def test_none_within_limit(self):
+        self.assertIsNone(ChessGame.from_fen(self.DOUBLED_ROOKS).find_mate(1))
+        self.assertIsNone(ChessGame().find_mate(2))
+
+    def test_bestmove_plays_forced_mate_beyond_depth(self):
+        move = ChessGame.from_fen(self.DOUBLED_ROOKS).search_best_move(depth=1)
+        self.assertEqual(
+            move, {'from_row': 6, 'from_col': 3, 'to_row': 0, 'to_col': 3})
+
+    def test_parses_engine_reply(self):
+        game = ChessGame()
+        with mock.patch.object(ChessGame, '_call_engine',
+                               return_value='MATE 1 7 3 0 3') as engine:
+            self.assertEqual(game.find_mate(4), {
+                'mate_in': 1,
+                'moves': [{'from_row': 7, 'from_col': 3,
+                           'to_row': 0, 'to_col': 3}],
+            })
+        self.assertTrue(engine.call_args[0][0].startswith('MATE '))
+        self.assertTrue(engine.call_args[0][0].endswith(' 4'))
+        with mock.patch.object(ChessGame, '_call_engine',
+                               return_value='MATE NONE'):
+            self.assertIsNone(game.find_mate())
+
+
+class QuiescenceSearchTest(SimpleTestCase):
+    """Captures are resolved past the horizon and judged by SEE."""
+
+    def test_defended_pawn_is_not_taken(self):
+        # Qxd5 exd5 loses the queen for a pawn
+        game = ChessGame.from_fen('k7/8/4p3/3p4/8/8/8/K2Q4 w - - 0 1')
+        scored = game.analyze_moves(depth=1)
+        grab = next(move for move in scored
+                    if (move['from_row'], move['from_col'],
+                        move['to_row'], move['to_col']) == (7, 3, 3, 3))
+
+        self.assertLess(grab['score'], 0)
+        self.assertGreater(scored[0]['score'], 0)
+        self.assertNotEqual(game.search_best_move(depth=1),
+                            {'from_row': 7, 'from_col': 3,
+                             'to_row': 3, 'to_col': 3})
+
+    def test_winning_exchange_is_played(self):
+        # Rxd5 Rxd5 Rxd5 wins the knight: the d1 rook x-rays through d2
+        game = ChessGame.from_fen('k2r4/8/8/3n4/8/8/3R4/K2R4 w - - 0 1')
+        self.assertEqual(game.search_best_move(depth=1),
+                         {'from_row': 6, 'from_col': 3,
+                          'to_row': 3, 'to_col': 3})
+
+
+class SearchDrawAwarenessTest(SimpleTestCase):
+    """The search scores repetitions and fifty-move draws as 0."""
+
+    def _play(self, game, moves):
+        for move in moves:
+            self.assertTrue(game.make_move(*move)[0])
+
+    def test_losing_side_repeats_the_position(self):
+        # Kb1 Kb8 Ka1 Ka8: a second Kb1 draws a lost queen ending
+        game = ChessGame.from_fen('k7/8/8/3q4/8/8/8/K7 w - - 0 1')
+        self._play(game, [(7, 0, 7, 1), (0, 0, 0, 1), (7, 1, 7, 0), (0, 1, 0, 0)])
+        self.assertEqual(game.search_best_move(depth=3),
+                         {'from_row': 7, 'from_col': 0,
+                          'to_row': 7, 'to_col': 1})
+
+    def test_winning_side_avoids_the_repetition(self):
+        game = ChessGame.from_fen('7k/8/8/3Q4/8/8/8/K7 w - - 0 1')
+        queen_to_g5 = {'from_row': 3, 'from_col': 3, 'to_row': 3, 'to_col': 6}
+        self.assertEqual(game.search_best_move(depth=3), queen_to_g5)
+
+        self._play(game, [(3, 3, 3, 6), (0, 7, 1, 7), (3, 6, 3, 3), (1, 7, 0, 7)])
+        self.assertNotEqual(game.search_best_move(depth=3), queen_to_g5)
+
+    def test_fifty_move_rule_forces_a_pawn_move(self):
+        # Every quiet move at clock 99 draws, so only h3 keeps the win
+        game = ChessGame.from_fen('8/8/8/3k4/8/8/7P/R3K3 w - - 0 1')
+        pawn_push = {'from_row': 6, 'from_col': 7, 'to_row': 5, 'to_col': 7}
+        self.assertNotEqual(game.search_best_move(depth=3), pawn_push)
+
+        game.halfmove_clock = 99
+        self.assertEqual(game.search_best_move(depth=3), pawn_push)
+
+    def test_history_is_sent_as_zobrist_hashes(self):
+        game = ChessGame()
+        self._play(game, [(7, 6, 5, 5), (0, 6, 2, 5)])
+        fields = game._serialize_history().split()
+
+        self.assertEqual(fields[:2], ['2', '3'])
+        self.assertEqual(len(fields), 5)
+        self.assertEqual(fields[-1], format_hash(game.zobrist_key()))
+
+
+class PythonEngineMoveGenerationTest(SimpleTestCase):
+    """Table-driven move generation in the Python fallback engine."""
+
+    def _engine_moves(self, fen, ep='-1 -1'):
+        game = ChessGame.from_fen(fen)
+        python_engine_path = os.path.join(ChessGame.ENGINE_DIR, 'main.py')
+        prefix = (f"{game.serialize_board()} {game.serialize_castling_rights()}"
+                  f" {game.current_turn} {ep}")
+        command = ''.join(
+            f"MOVES {prefix} {row} {col}\n"
+            for row in range(8) for col in range(8))
+        with mock.patch.object(game, '_resolve_engine_path',
+                               return_value=python_engine_path):
+            lines = game._call_engine(command).splitlines()
+        return {
+            (index // 8, index % 8): [
+                tuple(int(v) for v in values[i:i + 4])
+                for i in range(0, len(values), 4)
+            ]
+            for index, values in (
+                (index, line.split()[1:]) for index, line in enumerate(lines))
+            if values
+        }
+
+    def test_legal_move_counts(self):
+        # Castling both ways, pins, and checks through sliding rays
+        kiwipete = self._engine_moves(
+            'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1')
+        self.assertEqual(sum(map(len, kiwipete.values())), 48)
+        self.assertIn((7, 6, 0, 0), kiwipete[(7, 4)])
+        self.assertIn((7, 2, 0, 0), kiwipete[(7, 4)])
+
+        rook_ending = self._engine_moves('8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1')
+        self.assertEqual(sum(map(len, rook_ending.values())), 14)
+
+    def test_en_passant_and_promotion_flags(self):
+        moves = self._engine_moves('8/1P5k/8/3pP3/8/8/8/K7 w - d6 0 1', ep='2 3')
+        self.assertEqual(moves[(3, 4)], [(2, 3, 1, 0), (2, 4, 0, 0)])
+        self.assertEqual(moves[(1, 1)], [(0, 1, 0, 1)])
+
+    def test_legal_matches_moves_for_every_piece(self):
+        fen = 'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1'
+        game = ChessGame.from_fen(fen)
+        python_engine_path = os.path.join(ChessGame.ENGINE_DIR, 'main.py')
+        with mock.patch.object(game, '_resolve_engine_path',
+                               return_value=python_engine_path):
+            legal = game.get_all_valid_moves()
+
+        expected = self._engine_moves(fen)
+        self.assertEqual(
+            {key: [(m['row'], m['col'], int(m['is_capture']),
+                    int(m['is_promotion'])) for m in moves]
+             for key, moves in legal.items()},
+            {f"{r},{c}": moves for (r, c), moves in expected.items()})
+        # The DP cache is filled, so no further engine calls are needed
+        with mock.patch.object(game, '_call_engine') as engine:
+            self.assertEqual(len(game.get_valid_moves(7, 4)), 4)
+            self.assertEqual(game.get_valid_moves(7, 0),
+                             [{'row': 7, 'col': c, 'is_capture': False,
+                               'is_promotion': False} for c in (1, 2, 3)])
+            engine.assert_not_called()
+
+    def test_search_reuses_transposition_table(self):
+        # Nxd5 wins a queen; asking twice in one process answers the second
+        # query from the transposition table filled by the first
+        game = ChessGame.from_fen('4k3/8/8/3q4/8/4N3/8/4K3 w - - 0 1')
+        python_engine_path = os.path.join(ChessGame.ENGINE_DIR, 'main.py')
+        prefix = (f"{game.serialize_board()} {game.serialize_castling_rights()}"
+                  f" {game.current_turn} -1 -1")
+        command = (f"ANALYZE {prefix} 3\nBESTMOVE {prefix} 3 0 0\n"
+                   f"ANALYZE {prefix} 3\nBESTMOVE {prefix} 3 0 0\n")
+        with mock.patch.object(game, '_resolve_engine_path',
+                               return_value=python_engine_path):
+            first, best, second, again = game._call_engine(command).splitlines()
+        self.assertEqual(first, second)
+        self.assertEqual(best, again)
+        self.assertEqual(best, 'BESTMOVE 5 4 3 3')
+        self.assertEqual(first.split()[1:5], ['5', '4', '3', '3'])
+
+
+class PuzzleMiningTest(TestCase):
+    """Puzzles mined from stored games by ``mine_puzzles`` and served."""
+
+    # 1. e4 e5 2. Bc4 Nc6 3. Qh5 Nf6, and 4. Qxf7# is the only mate
+    SCHOLARS = [
+        {'from': [6, 4], 'to': [4, 4]},
+        {'from': [1, 4], 'to': [3, 4]},
+        {'from': [7, 5], 'to': [4, 2]},
+        {'from': [0, 1], 'to': [2, 2]},
+        {'from': [7, 3], 'to': [3, 7]},
+        {'from': [0, 6], 'to': [2, 5]},
+    ]
+
+    def setUp(self):
+        handle, self.state = tempfile.mkstemp(suffix='.json')
+        os.close(handle)
+        os.remove(self.state)
+        self.addCleanup(
+            lambda: os.path.exists(self.state) and os.remove(self.state))
+
+    def _store(self, moves):
+        from .models import GameResult
+        return GameResult.objects.create(
+            mode='pvp', winner='white', end_reason='checkmate',
+            player_color='white', moves=moves)
+
+    def test_analyze_scores_every_move_best_first(self):
+        game = ChessGame.from_fen('4k3/8/8/3q4/8/8/3R4/3K4 w - - 0 1')
+        scored = game.analyze_moves(depth=1)
+
+        self.assertEqual(
+            scored[0],
+            {'from_row': 6, 'from_col': 3, 'to_row': 3, 'to_col': 3,
+             'score': scored[0]['score']})
+        self.assertGreater(scored[0]['score'], 900)
+        scores = [move['score'] for move in scored]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+
+    def test_mines_unique_mate_from_game(self):
+        from .puzzles import mine_game_puzzles
+        found = mine_game_puzzles(7, self.SCHOLARS, depth=2, min_ply=6)
+
+        self.assertEqual(len(found), 1)
+        puzzle = found[0]
+        self.assertEqual(puzzle['solution'], ['h5f7'])
+        self.assertEqual(puzzle['theme'], 'mate')
+        self.assertEqual(puzzle['difficulty'], 1)
+        self.assertEqual(puzzle['source_game'], 7)
+        self.assertEqual(
+            puzzle['fen'],
+            'r1bqkb1r/pppp1ppp/2n2n2/4p2Q/2B1P3/8/PPPP1PPP/RNB1K1NR'
+            ' w KQkq - 4 4')
+
+    def test_only_single_winning_moves_qualify(self):
+        from .puzzles import find_puzzle
+        game = ChessGame()
+
+        def scored(*scores):
+            return [{'from_row': 6, 'from_col': col, 'to_row': 4,
+                     'to_col': col, 'score': score}
+                    for col, score in enumerate(scores)]
+
+        cases = [
+            ((500, 100), 'quiet'),
+            ((500, 250), None),  # Second move wins too
+            ((150, -200), None),  # Best move does not win
+            ((500, 200, 100), None),  # Second move wins by the threshold
+        ]
+        for scores, theme in cases:
+            with mock.patch.object(ChessGame, 'analyze_moves',
+                                   return_value=scored(*scores)):
+                puzzle = find_puzzle(game, depth=2)
+            self.assertEqual(puzzle and puzzle['theme'], theme, scores)
+        with mock.patch.object(ChessGame, 'analyze_moves',
+                               return_value=scored(450, 100)):
+            self.assertEqual(find_puzzle(game, depth=2)['difficulty'], 5)
+        with mock.patch.object(ChessGame, 'analyze_moves',
+                               return_value=scored(900, 100)):
+            self.assertEqual(find_puzzle(game, depth=2)['difficulty'], 4)
+
+    def test_command_stores_puzzles_once_and_serves_them(self):
+        from .models import Puzzle
+        source = self._store(self.SCHOLARS)
+        found = [{
+            'fen': 'r1bqkb1r/pppp1ppp/2n2n2/4p2Q/2B1P3/8/PPPP1PPP/RNB1K1NR'
+                   ' w KQkq - 4 4',
+            'position_key': 'scholars',
+            'solution': ['h5f7'],
+            'theme': 'mate',
+            'difficulty': 1,
+            'score': 99901,
+            'ply': 6,
+            'source_game': source.pk,
+        }]
+        with mock.patch('game.puzzles.mine_game_puzzles',
+                        return_value=found) as mine:
+            call_command('mine_puzzles', state=self.state, workers=1,
+                         stdout=StringIO())
+            self._store(self.SCHOLARS)
+            call_command('mine_puzzles', state=self.state, workers=1,
+                         stdout=StringIO())
+        # The second run only scans the new game; the position is known
+        self.assertEqual(mine.call_count, 2)
+        self.assertEqual(Puzzle.objects.count(), 1)
+        self.assertEqual(Puzzle.objects.get().source_game, source)
+
+        response = self.client.get(reverse('puzzle'), {'daily': '1'})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['solution'], ['h5f7'])
+        self.assertEqual(data['theme'], 'mate')
+        self.assertEqual(
+            self.client.get(reverse('puzzle'), {'daily': '1'}).json(), data)
+
+        response = self.client.get(reverse('puzzle'), {'theme': 'quiet'})
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(reverse('puzzle'), {'theme': 'bogus'})
+        self.assertEqual(response.status_code, 400)
+
+
 class MoveHistoryColorTest(TestCase):
     """Test that move_history records the correct player color."""
 
@@ -1295,53 +3109,39 @@ class StaleGameCleanupTest(TestCase):
         self.url = '/api/cron/cleanup-stale-games/'
         self.secret = 'test_secret_123'
         
+    def _stale_game(self, **data):
+        data.setdefault('last_ts', time.time() - (50 * 3600))
+        data.setdefault('game_status', 'active')
+        return GameState.objects.create(
+            data=data, status=data['game_status'], last_ts=data['last_ts'])
+
     @override_settings(CRON_SECRET='test_secret_123')
     def test_stale_game_deletion(self):
-        from django.contrib.sessions.backends.db import SessionStore
-        import time
-        
-        s = SessionStore()
-        s.create()
         # low engagement: < 5 moves
-        s['game'] = {
-            'game_status': 'active',
-            'move_history': [1, 2, 3],
-            'last_ts': time.time() - (50 * 3600)
-        }
-        s.save()
+        state = self._stale_game(move_history=[1, 2, 3])
         
         response = self.client.post(self.url, HTTP_AUTHORIZATION=f'Bearer {self.secret}')
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.json()['deleted_games'], 1)
         
-        s = SessionStore(session_key=s.session_key)
-        self.assertNotIn('game', s)
+        self.assertFalse(GameState.objects.filter(pk=state.pk).exists())
 
     @override_settings(CRON_SECRET='test_secret_123')
     def test_stale_game_auto_resignation(self):
-        from django.contrib.sessions.backends.db import SessionStore
-        import time
         from game.models import GameResult
         
-        s = SessionStore()
-        s.create()
         # high engagement: >= 5 moves
-        s['game'] = {
-            'game_status': 'active',
-            'move_history': [1, 2, 3, 4, 5, 6],
-            'current_turn': 'white',
-            'player_color': 'white',
-            'mode': 'pvp',
-            'last_ts': time.time() - (50 * 3600)
-        }
-        s.save()
+        state = self._stale_game(
+            move_history=[1, 2, 3, 4, 5, 6], current_turn='white',
+            player_color='white', mode='pvp')
         
         response = self.client.post(self.url, HTTP_AUTHORIZATION=f'Bearer {self.secret}')
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.json()['resigned_games'], 1)
         
-        s = SessionStore(session_key=s.session_key)
-        self.assertEqual(s['game']['game_status'], 'resignation')
+        state.refresh_from_db()
+        self.assertEqual(state.status, 'resignation')
+        self.assertEqual(state.data['game_status'], 'resignation')
         
         self.assertEqual(GameResult.objects.count(), 1)
         res = GameResult.objects.first()
@@ -1350,33 +3150,48 @@ class StaleGameCleanupTest(TestCase):
 
     @override_settings(CRON_SECRET='test_secret_123')
     def test_edge_cases(self):
-        from django.contrib.sessions.backends.db import SessionStore
-        import time
-        
         # 1. Game less than 48 hours old
-        s1 = SessionStore()
-        s1.create()
-        s1['game'] = {'game_status': 'active', 'move_history': [1], 'last_ts': time.time() - (10 * 3600)}
-        s1.save()
+        recent = self._stale_game(
+            move_history=[1], last_ts=time.time() - (10 * 3600))
         
         # 2. Game already completed
-        s2 = SessionStore()
-        s2.create()
-        s2['game'] = {'game_status': 'checkmate', 'move_history': [1, 2, 3, 4, 5], 'last_ts': time.time() - (50 * 3600)}
-        s2.save()
-        
-        # 3. Session without game data
-        s3 = SessionStore()
-        s3.create()
-        s3.save()
+        self._stale_game(
+            game_status='checkmate', move_history=[1, 2, 3, 4, 5])
         
         response = self.client.post(self.url, HTTP_AUTHORIZATION=f'Bearer {self.secret}')
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.json()['deleted_games'], 0)
         self.assertEqual(response.json()['resigned_games'], 0)
         
-        s1 = SessionStore(session_key=s1.session_key)
-        self.assertEqual(s1['game']['game_status'], 'active')
+        recent.refresh_from_db()
+        self.assertEqual(recent.status, 'active')
+
+    def _age(self, state, **delta):
+        GameState.objects.filter(pk=state.pk).update(
+            updated_at=timezone.now() - timedelta(**delta))
+
+    @override_settings(CRON_SECRET='test_secret_123')
+    def test_finished_and_expired_games_are_pruned(self):
+        old_finished = self._stale_game(game_status='resignation')
+        self._age(old_finished, hours=25)
+        new_finished = self._stale_game(game_status='checkmate')
+        expired = self._stale_game(
+            game_status='active', last_ts=time.time())
+        self._age(expired, seconds=settings.SESSION_COOKIE_AGE + 60)
+        live = self._stale_game(game_status='active', last_ts=time.time())
+
+        response = self.client.post(
+            self.url, HTTP_AUTHORIZATION=f'Bearer {self.secret}')
+        self.assertEqual(response.json()['pruned_games'], 2)
+        self.assertEqual(
+            set(GameState.objects.values_list('pk', flat=True)),
+            {new_finished.pk, live.pk})
+
+    def test_board_page_drops_a_resigned_game(self):
+        self.client.post('/api/new-game/', content_type='application/json')
+        self.client.post('/api/resign/', content_type='application/json')
+        self.client.get('/play/')
+        self.assertFalse(GameState.objects.exists())
 
     @override_settings(CRON_SECRET='test_secret_123')
     def test_protected_endpoint(self):
@@ -1914,9 +3729,7 @@ class TimeControlIncrementTest(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertTrue(response.json()['valid'])
         
-        session = self.client.session
-        game_dict = session.get('game')
-        self.assertIsNotNone(game_dict)
+        game_dict = GameState.for_session(self.client.session).data
         self.assertEqual(game_dict['increment'], 3)
         self.assertEqual(game_dict['white_time'], 300)
 
@@ -1960,12 +3773,8 @@ class GameResultMoveHistoryTest(TestCase):
         self.assertEqual(res.moves, moves)
 
     def test_stale_game_cleanup_saves_move_history(self):
-        from django.contrib.sessions.backends.db import SessionStore
-        import time
         from game.services import cleanup_stale_games
 
-        s = SessionStore()
-        s.create()
         moves = [
             {'notation': 'e4', 'piece': 'P', 'from': [6, 4], 'to': [4, 4], 'color': 'white'},
             {'notation': 'e5', 'piece': 'p', 'from': [1, 4], 'to': [3, 4], 'color': 'black'},
@@ -1973,7 +3782,7 @@ class GameResultMoveHistoryTest(TestCase):
             {'notation': 'Nc6', 'piece': 'n', 'from': [0, 1], 'to': [2, 2], 'color': 'black'},
             {'notation': 'Bb5', 'piece': 'B', 'from': [7, 5], 'to': [4, 1], 'color': 'white'},
         ]
-        s['game'] = {
+        game_data = {
             'game_status': 'active',
             'move_history': moves,
             'current_turn': 'black',
@@ -1981,7 +3790,8 @@ class GameResultMoveHistoryTest(TestCase):
             'mode': 'pvp',
             'last_ts': time.time() - (50 * 3600)
         }
-        s.save()
+        GameState.objects.create(
+            data=game_data, user=self.user, last_ts=game_data['last_ts'])
 
         deleted, resigned = cleanup_stale_games()
         self.assertEqual(resigned, 1)
@@ -1990,6 +3800,7 @@ class GameResultMoveHistoryTest(TestCase):
         self.assertEqual(self.GameResult.objects.count(), 1)
         res = self.GameResult.objects.first()
         self.assertEqual(res.moves, moves)
+        self.assertEqual(res.user, self.user)
 
     def test_backward_compatibility_empty_moves(self):
         # Existing game results created without moves should default to empty list
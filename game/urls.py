@@ -13,9 +13,22 @@ urlpatterns = [
         'api/check-promotion/', views.check_promotion, name='check_promotion'
     ),
     path('api/state/', views.get_state, name='get_state'),
+    path('api/events/', views.game_events, name='game_events'),
+    path(
+        'api/spectate/<str:token>/', views.spectate_game,
+        name='spectate_game'
+    ),
     path('api/pause/', views.set_pause),
     path('api/resign/', views.resign_game, name='resign_game'),
     path('api/ai-move/', views.ai_move, name='ai_move'),
+    path('api/ai-move/<str:job_id>/', views.ai_move_job, name='ai_move_job'),
+    path(
+        'api/ai-move/<str:job_id>/events/', views.ai_move_job_events,
+        name='ai_move_job_events'
+    ),
+    path(
+        'api/move-and-reply/', views.move_and_reply, name='move_and_reply'
+    ),
     path('api/draw/', views.offer_draw, name='offer_draw'),
     path('stats/', views.stats_view, name='stats'),
     path('api/analyze-game/', views.analyze_game_view, name='analyze_game'),
@@ -44,6 +57,7 @@ urlpatterns = [
     path('lessons/<str:lesson_name>/', views.lesson_detail_view, name='lesson_detail'),
     path('lessons/<str:lesson_name>/complete/', views.complete_lesson, name='complete_lesson'),
     path("api/puzzle-stats/", views.puzzle_stats_view, name="puzzle_stats"),
+    path("api/puzzle/", views.puzzle_view, name="puzzle"),
     
     path("achievements/", views.achievements_view, name="achievements"),
 ]   
@@ -1,19 +1,30 @@
 """Game views for the Checkora chess platform."""
+import asyncio
+import functools
 import logging
 import json
 import time
 import hashlib
 import secrets
 import secrets as secrets_module
+from asgiref.sync import sync_to_async
 from django.views.decorators.clickjacking import xframe_options_sameorigin
 from django.conf import settings
-from django.http import Http404, JsonResponse
+from django.http import (
+    Http404,
+    HttpResponse,
+    HttpResponseNotModified,
+    JsonResponse,
+    StreamingHttpResponse,
+)
 from django.shortcuts import render, redirect
 from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.models import User
 from django.urls import reverse
 from django.utils import timezone
 from django.utils.http import (
+    parse_etags,
+    quote_etag,
     urlsafe_base64_encode,
     urlsafe_base64_decode
 )
@@ -43,9 +54,13 @@ from django.views.decorators.csrf import ensure_csrf_cookie, csrf_exempt
 from django.views.decorators.http import require_GET, require_POST
 from django.contrib.auth.decorators import login_required
 
+from . import events, jobs
+from .admission import EngineBusy
 from .engine import ChessGame
 from .models import (
     GameResult,
+    GameState,
+    Puzzle,
     PuzzleStats,
     LessonProgress,
     Achievement,
@@ -54,9 +69,12 @@ from .models import (
 logger = logging.getLogger(__name__)
 from game.services import (
     cleanup_stale_games,
-    check_game_achievements,
+    prune_game_states,
     check_puzzle_achievements,
+    save_game_result,
 )
+from .puzzles import pick_puzzle
+from .state import game_event, move_fields, record_move_result
 
 from .analysis import build_summary
 
@@ -67,17 +85,161 @@ def landing(request):
 def preloader(request):
     return render(request, 'game/preloading.html')
 
+def _load_game(request):
+    """Return ``(state, game)`` for the session's game, or ``(None, None)``."""
+    state = GameState.for_session(request.session)
+    if state is None:
+        return None, None
+    return state, ChessGame.from_dict(state.data)
+
+
+def _save_game(request, state, game):
+    """Write *game* back to its row if it changed, or start a row when
+    *state* is None."""
+    if state is not None and not game.is_dirty():
+        return state
+    user = request.user if request.user.is_authenticated else None
+    data = game.to_dict()
+    if state is None:
+        state = GameState.start(request.session, data, user)
+    else:
+        state.store(data, user)
+    game.mark_saved(data)
+    return state
+
+
+def _request_param(request, name):
+    """Return *name* from the query string of a GET or the JSON body of
+    a POST, or None."""
+    if request.method == 'GET':
+        return request.GET.get(name)
+    try:
+        return json.loads(request.body or '{}').get(name)
+    except (json.JSONDecodeError, AttributeError):
+        return None
+
+
+def _move_cursor(request, game):
+    """Return the ply count the client already has (``since``), or None
+    when it sent none or one that does not fit this game."""
+    value = _request_param(request, 'since')
+    try:
+        since = int(value)
+    except (TypeError, ValueError):
+        return None
+    return since if 0 <= since <= len(game.move_history) else None
+
+
+def _access_fields(state):
+    """``game_id`` and the ``seats`` tokens that let the two players of
+    the game in *state* move over its WebSocket, and the watch-only
+    ``spectate_token`` for ``/api/spectate/``."""
+    if state is None:
+        return {'game_id': None, 'seats': None, 'spectate_token': None}
+    return {
+        'game_id': str(state.pk),
+        'seats': {color: state.access_token(color)
+                  for color in ('white', 'black')},
+        'spectate_token': state.access_token('watch'),
+    }
+
+
+def _history_fields(request, game, since):
+    """Moves for a game response: the full history and PGN, or only the
+    moves after *since* when the client sent a cursor."""
+    if since is None:
+        return {
+            'ply': len(game.move_history),
+            'move_history': game.move_history,
+            'pgn': game.generate_pgn(request.session.get('white_name', 'White'), request.session.get('black_name', 'Black')),
+        }
+    return {
+        'ply': len(game.move_history),
+        'since': since,
+        'new_moves': game.move_history[since:],
+    }
+
+
+def _legal_moves(game):
+    """The side to move's legal moves keyed ``"row,col"``; empty once the
+    game is over."""
+    if game.game_status != 'active':
+        return {}
+    return game.get_all_valid_moves()
+
+
+def _request_flag(request, name):
+    """True when the request sets the option *name* (``?name=1`` or
+    ``"name": true``)."""
+    return _request_param(request, name) not in (
+        None, False, 0, '', '0', 'false')
+
+
+def _legal_moves_fields(request, game):
+    """``legal_moves`` for a game response when the client asked for it,
+    so it can highlight moves and detect promotions without calling
+    ``/api/valid-moves/``.
+
+    Left out when no engine slot is free: a move already played must
+    not be answered as failed for want of the next side's moves.
+    """
+    if not _request_flag(request, 'include_moves'):
+        return {}
+    try:
+        return {'legal_moves': _legal_moves(game)}
+    except EngineBusy:
+        return {}
+
+
+def _conflict_response():
+    """The 409 sent when the game row changed under a request."""
+    return JsonResponse(
+        {'valid': False,
+         'message': 'The game was updated by another request.'},
+        status=409,
+    )
+
+
+def _game_conflict_response(view):
+    """Answer 409 when another request wrote the game in the meantime."""
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        try:
+            return view(request, *args, **kwargs)
+        except GameState.Conflict:
+            return _conflict_response()
+    return wrapper
+
+
+def _engine_busy_response(exc):
+    """The 429/503 sent when no engine slot was free (``EngineBusy``)."""
+    response = JsonResponse(
+        {'valid': False, 'message': str(exc),
+         'retry_after': exc.retry_after},
+        status=exc.status,
+    )
+    response['Retry-After'] = str(exc.retry_after)
+    return response
+
+
+def _engine_admission(view):
+    """Answer 429/503 with ``Retry-After`` when the engine is saturated."""
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        try:
+            return view(request, *args, **kwargs)
+        except EngineBusy as exc:
+            return _engine_busy_response(exc)
+    return wrapper
+
+
 @ensure_csrf_cookie
 def index(request):
-    """Render the board and initialise a new game in the session."""
-    if 'game' in request.session:
-        game_data = request.session['game']
-        status = game_data.get('game_status', 'active')
-        if status in ['checkmate', 'draw', 'resign', 'stalemate', 'timeout']:
-            del request.session['game']
-    if 'game' not in request.session:
-        game = ChessGame()
-        request.session['game'] = game.to_dict()
+    """Render the board; the game row is created by the first action."""
+    state = GameState.for_session(request.session)
+    if state and state.status in ['checkmate', 'draw', 'resignation', 'stalemate', 'timeout']:
+        state.delete()
+        del request.session[GameState.SESSION_KEY]
     return render(request, 'game/board.html')
 
 
@@ -85,75 +247,61 @@ def record_game_result(request, mode, winner, reason, player_color='white', move
     """Save a completed game result to the database."""
     user = request.user if request.user.is_authenticated else None
     if moves is None:
-        game_data = request.session.get('game')
-        if game_data and isinstance(game_data, dict):
-            moves = game_data.get('move_history', [])
-        else:
-            moves = []
-    result = GameResult.objects.create(
-        user=user,
-        mode=mode,
-        winner=winner,
-        end_reason=reason,
-        player_color=player_color,
-        moves=moves
-    )
-    result.full_clean()
-    result.save()
+        state = GameState.for_session(request.session)
+        moves = ChessGame.moves_from_session(state.data) if state else []
+    save_game_result(user, mode, winner, reason, player_color, moves)
+
+
+def _parse_move(request):
+    """Return ``(from_row, from_col, to_row, to_col, promotion_piece)``
+    from a JSON move body, or None when a coordinate is missing or off
+    the board."""
+    try:
+        return move_fields(json.loads(request.body))
+    except (json.JSONDecodeError, ValueError):
+        return None
 
-    if user:
-        check_game_achievements(user)
+
+def _record_move_result(request, game, game_status):
+    """Record the game result when the move just played ended it."""
+    user = request.user if request.user.is_authenticated else None
+    record_move_result(game, game_status, user)
+
+
+def _ai_depth(request):
+    """Search depth for the session's difficulty — lower is faster."""
+    difficulty = request.session.get('difficulty', 'medium')
+    depth_map = {'easy': 1, 'medium': 2, 'hard': 3}
+    return depth_map.get(difficulty, 2)
 
 
 @require_POST
+@_game_conflict_response
+@_engine_admission
 def make_move(request):
     """Validate and execute a chess move via the C++ engine."""
-    try:
-        data = json.loads(request.body)
-        coords = ['from_row', 'from_col', 'to_row', 'to_col']
-        for coord in coords:
-            if coord not in data:
-                return JsonResponse(
-                    {"error": "Invalid board coordinates"},
-                    status=400,
-                )
-            val = data[coord]
-            if not isinstance(val, int) or isinstance(val, bool):
-                return JsonResponse(
-                    {"error": "Invalid board coordinates"},
-                    status=400,
-                )
-            if not (0 <= val <= 7):
-                return JsonResponse(
-                    {"error": "Invalid board coordinates"},
-                    status=400,
-                )
-        from_row = data['from_row']
-        from_col = data['from_col']
-        to_row = data['to_row']
-        to_col = data['to_col']
-        promotion_piece = data.get('promotion_piece', None)
-    except (json.JSONDecodeError, KeyError, ValueError, TypeError):
+    move = _parse_move(request)
+    if move is None:
         return JsonResponse(
             {"error": "Invalid board coordinates"},
             status=400,
         )
+    from_row, from_col, to_row, to_col, promotion_piece = move
 
-    game_data = request.session.get('game')
-    game = ChessGame.from_dict(game_data) if game_data else ChessGame()
+    state, game = _load_game(request)
+    if game is None:
+        game = ChessGame()
+    since = _move_cursor(request, game)
 
     success, message, captured, game_status = game.make_move(
         from_row, from_col, to_row, to_col, promotion_piece,
     )
+    # Before saving: nothing after the save may fail the request
+    legal_moves = _legal_moves_fields(request, game)
 
     if success:
-        request.session['game'] = game.to_dict()
-        request.session.modified = True
-        if game_status == 'checkmate':
-            winner = 'black' if game.current_turn == 'white' else 'white'
-            record_game_result(request, game.mode, winner, 'checkmate', game.player_color, moves=game.move_history)
-        elif game_status in ('stalemate', 'draw'):
-            record_game_result(request, game.mode, 'draw', game.draw_reason or 'stalemate', game.player_color, moves=game.move_history)
+        _save_game(request, state, game)
+        _record_move_result(request, game, game_status)
 
     return JsonResponse({
         'valid': success,
@@ -165,19 +313,20 @@ def make_move(request):
         'black_time': game.black_time,
         'time_limit': getattr(game, 'time_limit', 600),
         'increment': getattr(game, 'increment', 0),
-        'move_history': game.move_history,
+        **_history_fields(request, game, since),
         'captured_pieces': game.captured,
         'game_status': game_status,
         'draw_reason': game.draw_reason,
         'threefold_warning': game.threefold_warning,
+        **legal_moves,
         'fen': game.generate_fen_key(),
-        'pgn': game.generate_pgn(request.session.get('white_name', 'White'), request.session.get('black_name', 'Black')),
         'white_name': request.session.get('white_name', 'White'),
         'black_name': request.session.get('black_name', 'Black'),
     })
 
 
 @require_GET
+@_engine_admission
 def valid_moves(request):
     """Return every legal destination for a piece."""
     try:
@@ -189,16 +338,17 @@ def valid_moves(request):
     if not (0 <= row < 8 and 0 <= col < 8):
         return JsonResponse({'valid_moves': []}, status=400)
 
-    game_data = request.session.get('game')
-    if not game_data:
-        return JsonResponse({'valid_moves': []})
+    _, game = _load_game(request)
+    if game is None:
+        # No move played yet: the game row does not exist until then
+        game = ChessGame()
 
-    game = ChessGame.from_dict(game_data)
     moves = game.get_valid_moves(row, col)
     return JsonResponse({'valid_moves': moves})
 
 
 @require_POST
+@_engine_admission
 def new_game(request):
     """Reset the game to the initial position with selected mode."""
     try:
@@ -271,12 +421,16 @@ def new_game(request):
     game.player_color = player_color
     game.paused = False
 
-    request.session['game'] = game.to_dict()
-    request.session.modified = True
+    previous = GameState.for_session(request.session)
+    if previous:
+        jobs.cancel_for_game(previous.pk)
+        previous.delete()
+    state = _save_game(request, None, game)
     request.session.save()
 
     return JsonResponse({
         'valid': True,
+        **_access_fields(state),
         'board': game.board,
         'current_turn': game.current_turn,
         'move_history': [],
@@ -292,25 +446,26 @@ def new_game(request):
         'pgn': game.generate_pgn(request.session.get('white_name', 'White'), request.session.get('black_name', 'Black')),
         'game_status': game.game_status,
         'draw_reason': game.draw_reason,
+        **_legal_moves_fields(request, game),
     })
 
 
 @require_POST
+@_game_conflict_response
+@_engine_admission
 def resume_game(request):
     """Resume the existing session game without resetting it."""
-    game_data = request.session.get('game')
-    if not game_data:
+    state, game = _load_game(request)
+    if game is None:
         return JsonResponse({'valid': False, 'message': 'No saved game found.'}, status=404)
-
-    game = ChessGame.from_dict(game_data)
+    since = _move_cursor(request, game)
 
     if game.game_status != 'active':
         return JsonResponse({'valid': False, 'message': 'No active game to resume.'}, status=404)
 
     game.paused = False
     game.last_ts = time.time()
-    request.session['game'] = game.to_dict()
-    request.session.modified = True
+    _save_game(request, state, game)
 
     return JsonResponse({
         'valid': True,
@@ -320,7 +475,7 @@ def resume_game(request):
         'black_time': game.black_time,
         'time_limit': getattr(game, 'time_limit', 600),
         'increment': getattr(game, 'increment', 0),
-        'move_history': game.move_history,
+        **_history_fields(request, game, since),
         'captured_pieces': game.captured,
         'mode': game.mode,
         'player_color': game.player_color,
@@ -330,7 +485,6 @@ def resume_game(request):
         'draw_reason': game.draw_reason,
         'threefold_warning': game.threefold_warning,
         'fen': game.generate_fen_key(),
-        'pgn': game.generate_pgn(request.session.get('white_name', 'White'), request.session.get('black_name', 'Black')),
         'difficulty': request.session.get('difficulty', 'medium'),
     })
 
@@ -348,36 +502,53 @@ def check_promotion(request):
     if not (0 <= from_row < 8 and 0 <= from_col < 8 and 0 <= to_row < 8):
         return JsonResponse({'is_promotion': False})
 
-    game_data = request.session.get('game')
-    if not game_data:
+    state = GameState.for_session(request.session)
+    if state is None:
         return JsonResponse({'is_promotion': False})
 
     is_promo = ChessGame.is_promotion_move(
-        game_data['board'], from_row, from_col, to_row,
+        ChessGame.board_from_session(state.data), from_row, from_col, to_row,
     )
     return JsonResponse({'is_promotion': is_promo})
 
 
 @require_GET
+@_game_conflict_response
+@_engine_admission
 def get_state(request):
-    """Return the full current game state without mutating pause state."""
-    game_data = request.session.get('game')
-    if not game_data:
+    """Return the current game state without mutating pause state.
+
+    With ``?since=<ply>`` only the moves after that ply are sent.  Answers
+    304 when the ``If-None-Match`` ETag still matches: the same row
+    version, clocks and cursor.
+    """
+    state, game = _load_game(request)
+    if game is None:
         game = ChessGame()
     else:
-        game = ChessGame.from_dict(game_data)
-
         # Skip clock deduction if tab was closed for too long
         elapsed = time.time() - game.last_ts
         if elapsed > 10 and not game.paused:
             game.paused = True  # pause without deducting lost time
+            _save_game(request, state, game)
         else:
+            # For display only: the stored time and last_ts imply it
             game.update_clock()
 
-    request.session['game'] = game.to_dict()
-    request.session.modified = True
-
-    return JsonResponse({
+    since = _move_cursor(request, game)
+    etag = None
+    if state is not None:
+        etag = quote_etag(
+            f"{state.pk}-{state.version}-{game.white_time}"
+            f"-{game.black_time}-{int(game.paused)}-{since}"
+            f"-{int(_request_flag(request, 'include_moves'))}")
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = HttpResponseNotModified()
+            response['ETag'] = etag
+            return response
+
+    response = JsonResponse({
+        **_access_fields(state),
         'board': game.board,
         'current_turn': game.current_turn,
         'white_time': game.white_time,
@@ -385,7 +556,7 @@ def get_state(request):
         'time_limit': getattr(game, 'time_limit', 600),
         'increment': getattr(game, 'increment', 0),
         'paused': game.paused,
-        'move_history': game.move_history,
+        **_history_fields(request, game, since),
         'captured_pieces': game.captured,
         'mode': game.mode,
         'player_color': game.player_color,
@@ -393,18 +564,173 @@ def get_state(request):
         'white_name': request.session.get('white_name', 'White'),
         'black_name': request.session.get('black_name', 'Black'),
         'fen': game.generate_fen_key(),
-        'pgn': game.generate_pgn(request.session.get('white_name', 'White'), request.session.get('black_name', 'Black')),
         'game_status': game.game_status,
         'draw_reason': game.draw_reason,
         'threefold_warning': game.threefold_warning,
+        **_legal_moves_fields(request, game),
     })
+    if etag:
+        response['ETag'] = etag
+    return response
+
+
+# Moves sent to spectators, and seconds a snapshot is kept.  Each
+# version of a game has its own key, so the TTL only bounds memory: a
+# write never leaves a stale snapshot behind, in any process
+SPECTATE_RECENT_MOVES = 20
+SPECTATE_SNAPSHOT_TTL = 300
+
+
+def _spectate_snapshot(state):
+    """Build the spectator view of the game in *state* as JSON."""
+    game = ChessGame.from_dict(state.data)
+    return json.dumps({
+        'version': state.version,
+        'ply': len(game.move_history),
+        'recent_moves': game.move_history[-SPECTATE_RECENT_MOVES:],
+        'board': game.board,
+        'current_turn': game.current_turn,
+        'white_time': game.white_time,
+        'black_time': game.black_time,
+        'clock_ts': game.last_ts,
+        'paused': game.paused,
+        'captured_pieces': game.captured,
+        'mode': game.mode,
+        'game_status': game.game_status,
+        'draw_reason': game.draw_reason,
+        'fen': game.generate_fen_key(),
+    })
+
+
+@require_GET
+def spectate_game(request, token):
+    """Read-only snapshot of a game for spectators holding its
+    ``spectate_token``.
+
+    The token only grants watching: the snapshot never names the game id
+    that players use.  Each request reads the row's ``version`` by primary
+    key; the snapshot of that version is built once and shared by every
+    viewer from the cache under a key that names the version, so no
+    invalidation has to reach other processes.  The viewer's session is
+    never read.  Clocks are as of ``clock_ts``: the side to move's clock
+    runs from then while the game is active and not paused.
+    """
+    access = GameState.read_access_token(token)
+    version = None
+    if access is not None and access[1] == 'watch':
+        version = GameState.objects.filter(pk=access[0]).values_list(
+            'version', flat=True).first()
+    if version is None:
+        err_msg = 'No such game.'
+        return JsonResponse(
+            {'valid': False, 'message': err_msg}, status=404
+        )
+
+    etag = quote_etag(str(version))
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        response = HttpResponseNotModified()
+    else:
+        body = cache.get(GameState.SNAPSHOT_CACHE_KEY.format(access[0], version))
+        if body is None:
+            state = GameState.objects.filter(pk=access[0]).first()
+            if state is None:
+                err_msg = 'No such game.'
+                return JsonResponse(
+                    {'valid': False, 'message': err_msg}, status=404
+                )
+            # The row may have been written since its version was read
+            etag = quote_etag(str(state.version))
+            body = _spectate_snapshot(state)
+            cache.set(GameState.SNAPSHOT_CACHE_KEY.format(
+                state.pk, state.version), body, SPECTATE_SNAPSHOT_TTL)
+        response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = etag
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+
+def _sse_event(name, data):
+    """Format one Server-Sent Event carrying *data* as JSON."""
+    return f"event: {name}\ndata: {json.dumps(data)}\n\n"
+
+
+# Game event streams: seconds between clock events, between re-reads of
+# the row when no update was published (writes from other processes),
+# and before a stream ends and the client reconnects
+GAME_EVENT_TICK = 1
+GAME_EVENT_RECHECK = 15
+GAME_EVENT_MAX_SECONDS = 300
+
+
+@require_GET
+async def game_events(request):
+    """Stream the session's game as Server-Sent Events.
+
+    A ``state`` event is sent on connect (moves after ``?since=``) and
+    whenever the game is saved, a ``clock`` event every second while a
+    clock runs, and ``gone`` when the game is deleted.  Serve under ASGI:
+    waiting costs no thread there and ticks are computed from memory, so
+    an idle tab costs no requests and no database reads.
+    """
+    game_id = await request.session.aget(GameState.SESSION_KEY)
+    state = game_id and await GameState.objects.filter(pk=game_id).afirst()
+    if not state:
+        err_msg = 'No active game.'
+        return JsonResponse(
+            {'valid': False, 'message': err_msg}, status=404
+        )
+    game = ChessGame.from_dict(state.data)
+    since = _move_cursor(request, game) or 0
+
+    async def stream(state, game, since):
+        subscription = events.Subscription(state.pk)
+        loop = asyncio.get_running_loop()
+        try:
+            yield f"retry: {GAME_EVENT_TICK * 2000}\n\n"
+            yield _sse_event('state', game_event(game, since))
+            since = len(game.move_history)
+            deadline = loop.time() + GAME_EVENT_MAX_SECONDS
+            checked = loop.time()
+            while loop.time() < deadline:
+                updated = await subscription.wait(GAME_EVENT_TICK)
+                recheck = loop.time() - checked >= GAME_EVENT_RECHECK
+                if updated or recheck:
+                    checked = loop.time()
+                    fresh = await GameState.objects.filter(
+                        pk=state.pk).afirst()
+                    if fresh is None:
+                        yield _sse_event('gone', {})
+                        return
+                    if fresh.version != state.version:
+                        state, game = fresh, ChessGame.from_dict(fresh.data)
+                        since = min(since, len(game.move_history))
+                        yield _sse_event('state', game_event(game, since))
+                        since = len(game.move_history)
+                        continue
+                if game.game_status == 'active' and not game.paused:
+                    white_time, black_time = game.clock_at(time.time())
+                    yield _sse_event('clock', {
+                        'white_time': white_time,
+                        'black_time': black_time,
+                    })
+                elif recheck:
+                    yield ": keep-alive\n\n"
+        finally:
+            subscription.close()
+
+    response = StreamingHttpResponse(
+        stream(state, game, since), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
 
 
 @require_POST
+@_game_conflict_response
 def set_pause(request):
     """Toggle the game clock between paused and running."""
-    game_data = request.session.get('game')
-    if not game_data:
+    state, game = _load_game(request)
+    if game is None:
         return JsonResponse({'paused': False})
 
     try:
@@ -414,16 +740,13 @@ def set_pause(request):
 
     pause = data.get('pause', True)
 
-    game = ChessGame.from_dict(game_data)
-
     # Only deduct elapsed time when transitioning from running to paused.
     if pause and not game.paused:
         game.update_clock()
     game.paused = pause
     game.last_ts = time.time()
 
-    request.session['game'] = game.to_dict()
-    request.session.modified = True
+    _save_game(request, state, game)
 
     return JsonResponse({
         'paused': game.paused,
@@ -433,16 +756,17 @@ def set_pause(request):
 
 
 @require_POST
+@_game_conflict_response
+@_engine_admission
 def ai_move(request):
     """Let the engine compute and play the best move for the current side."""
-    game_data = request.session.get('game')
-    if not game_data:
+    state, game = _load_game(request)
+    if game is None:
         err_msg = 'No active game.'
         return JsonResponse(
             {'valid': False, 'message': err_msg}, status=400
         )
-
-    game = ChessGame.from_dict(game_data)
+    since = _move_cursor(request, game)
 
     if game.mode != 'ai':
         err_msg = 'Not in AI mode.'
@@ -450,13 +774,20 @@ def ai_move(request):
             {'valid': False, 'message': err_msg}, status=400
         )
 
-    # Depth Mapping — lower depth = faster response
-    difficulty = request.session.get('difficulty', 'medium')
-    depth_map = {'easy': 1, 'medium': 2, 'hard': 3}
-    depth = depth_map.get(difficulty, 2)
+    if _request_flag(request, 'async'):
+        job_id = jobs.submit(state, _ai_depth(request))
+        return JsonResponse(
+            {'valid': True, 'job': job_id, 'status': jobs.PENDING},
+            status=202,
+        )
+
+    best = game.get_ai_move(depth=_ai_depth(request))
+    return _play_ai_move(request, state, game, best, since, game.ai_rung)
 
-    best = game.get_ai_move(depth=depth)
 
+def _play_ai_move(request, state, game, best, since, rung=None):
+    """Play the engine's move *best* (None when it has none), found on
+    the ladder rung *rung*, and build the ``/api/ai-move/`` response."""
     if not best:
         if game.game_status == 'checkmate':
             winner = 'black' if game.current_turn == 'white' else 'white'
@@ -467,8 +798,7 @@ def ai_move(request):
             game_status = 'stalemate'
 
         game.game_status = game_status
-        request.session['game'] = game.to_dict()
-        request.session.modified = True
+        _save_game(request, state, game)
 
         return JsonResponse({
             'valid': True,
@@ -477,8 +807,9 @@ def ai_move(request):
             'current_turn': game.current_turn,
             'white_time': game.white_time,
             'black_time': game.black_time,
-            'move_history': game.move_history,
+            **_history_fields(request, game, since),
             'captured_pieces': game.captured,
+            **_legal_moves_fields(request, game),
             'message': '',
         })
 
@@ -486,16 +817,12 @@ def ai_move(request):
         best['from_row'], best['from_col'],
         best['to_row'],   best['to_col'],
     )
+    # Before saving: nothing after the save may fail the request
+    legal_moves = _legal_moves_fields(request, game)
 
     if success:
-        request.session['game'] = game.to_dict()
-        request.session.modified = True
-
-        if game_status == 'checkmate':
-            winner = 'black' if game.current_turn == 'white' else 'white'
-            record_game_result(request, game.mode, winner, 'checkmate', game.player_color, moves=game.move_history)
-        elif game_status in ('stalemate', 'draw'):
-            record_game_result(request, game.mode, 'draw', game.draw_reason or 'stalemate', game.player_color, moves=game.move_history)
+        _save_game(request, state, game)
+        _record_move_result(request, game, game_status)
 
     return JsonResponse({
         'valid': success,
@@ -507,23 +834,236 @@ def ai_move(request):
         'black_time': game.black_time,
         'time_limit': getattr(game, 'time_limit', 600),
         'increment': getattr(game, 'increment', 0),
-        'move_history': game.move_history,
+        **_history_fields(request, game, since),
         'captured_pieces': game.captured,
         'ai_move': best,
+        'ai_rung': rung,
         'game_status': game_status,
         'draw_reason': game.draw_reason,
         'threefold_warning': game.threefold_warning,
+        **legal_moves,
         'fen': game.generate_fen_key(),
-        'pgn': game.generate_pgn(request.session.get('white_name', 'White'), request.session.get('black_name', 'Black')),
         'white_name': request.session.get('white_name', 'White'),
         'black_name': request.session.get('black_name', 'Black'),
     })
 
+
+def _ai_job_response(request, job_id):
+    """Response for the AI job *job_id*: 202 while the search runs, then
+    the move played as ``/api/ai-move/`` would have played it."""
+    record = jobs.get(job_id)
+    state, game = _load_game(request)
+    if record is None or state is None or record['game_id'] != str(state.pk):
+        return JsonResponse(
+            {'valid': False, 'message': 'Unknown job.'}, status=404
+        )
+
+    status = record['status']
+    if status == jobs.PENDING:
+        return JsonResponse(
+            {'valid': True, 'job': job_id, 'status': status}, status=202
+        )
+    if status == jobs.DONE and record['version'] != state.version:
+        # The game moved on (new move, resignation...) during the search
+        jobs.cancel(job_id)
+        status = jobs.CANCELLED
+    if status == jobs.FAILED and record.get('retry_after'):
+        # The engine did not answer: retryable, the game goes on
+        return _engine_busy_response(EngineBusy(
+            'The engine did not answer. Please retry.',
+            503, record['retry_after']))
+    if status != jobs.DONE:
+        messages = {
+            jobs.CANCELLED: 'The game changed before the AI move was played.',
+            jobs.APPLIED: 'The AI move was already played.',
+            jobs.FAILED: 'The AI search failed.',
+        }
+        return JsonResponse(
+            {'valid': False, 'job': job_id, 'status': status,
+             'message': messages[status]},
+            status=500 if status == jobs.FAILED else 409,
+        )
+
+    response = _play_ai_move(
+        request, state, game, record['move'], _move_cursor(request, game),
+        record.get('rung'))
+    jobs.mark_applied(job_id)
+    return response
+
+
+@require_GET
+@_game_conflict_response
+@_engine_admission
+def ai_move_job(request, job_id):
+    """Poll an AI move started with ``{"async": true}``."""
+    return _ai_job_response(request, job_id)
+
+
+# Server-Sent Events: how long one stream waits before letting the
+# client reconnect, and how often it re-reads a job no update reached it
+# for (a job finished by a process the events backend does not reach)
+AI_JOB_STREAM_SECONDS = 30
+AI_JOB_STREAM_RECHECK = 5
+
+
+def _ai_job_result(request, job_id):
+    """``_ai_job_response``, with conflicts and a busy engine answered as
+    the polling view answers them."""
+    try:
+        return _ai_job_response(request, job_id)
+    except GameState.Conflict:
+        return _conflict_response()
+    except EngineBusy as exc:
+        return _engine_busy_response(exc)
+
+
+@require_GET
+async def ai_move_job_events(request, job_id):
+    """Stream an AI job as Server-Sent Events: ``pending`` comments while
+    the search runs, then one ``result`` event whose data is the poll
+    response body.
+
+    The stream sleeps until the job publishes its end (``jobs``), so
+    under ASGI a waiting client holds no worker thread.
+    """
+    async def stream():
+        subscription = events.Subscription(jobs.event_key(job_id))
+        loop = asyncio.get_running_loop()
+        try:
+            deadline = loop.time() + AI_JOB_STREAM_SECONDS
+            while (await jobs.aget(job_id, {})).get('status') == jobs.PENDING:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    return  # EventSource reconnects
+                yield ": pending\n\n"
+                await subscription.wait(min(remaining, AI_JOB_STREAM_RECHECK))
+        finally:
+            subscription.close()
+        response = await sync_to_async(_ai_job_result)(request, job_id)
+        yield _sse_event('result', json.loads(response.content))
+
+    response = StreamingHttpResponse(
+        stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
 @require_POST
+@_game_conflict_response
+@_engine_admission
+def move_and_reply(request):
+    """Play the player's move and the engine's reply in one request.
+
+    Used in AI mode instead of ``/api/move/`` followed by
+    ``/api/ai-move/``: the game is loaded and written once.  The top
+    level describes the game after the reply, ``move`` the position
+    after the player's move, and ``legal_moves`` (on request) the
+    player's next moves.  When the reply cannot be played the player's
+    move is stored alone and ``ai_move`` is null.
+    """
+    move = _parse_move(request)
+    if move is None:
+        return JsonResponse(
+            {"error": "Invalid board coordinates"},
+            status=400,
+        )
+    from_row, from_col, to_row, to_col, promotion_piece = move
+
+    state, game = _load_game(request)
+    if game is None or game.mode != 'ai':
+        err_msg = 'Not in AI mode.'
+        return JsonResponse(
+            {'valid': False, 'message': err_msg}, status=400
+        )
+    since = _move_cursor(request, game)
+
+    success, message, captured, game_status = game.make_move(
+        from_row, from_col, to_row, to_col, promotion_piece,
+    )
+    if not success:
+        return JsonResponse({
+            'valid': False,
+            'message': message,
+            'board': game.board,
+            'current_turn': game.current_turn,
+            'game_status': game_status,
+        })
+
+    player_move = {
+        'from_row': from_row, 'from_col': from_col,
+        'to_row': to_row, 'to_col': to_col,
+        'message': message,
+        'captured': captured,
+        'board': [row[:] for row in game.board],
+        'current_turn': game.current_turn,
+        'white_time': game.white_time,
+        'black_time': game.black_time,
+        'ply': len(game.move_history),
+        'captured_pieces': {color: pieces[:]
+                            for color, pieces in game.captured.items()},
+        'game_status': game_status,
+        'draw_reason': game.draw_reason,
+        'threefold_warning': game.threefold_warning,
+        'fen': game.generate_fen_key(),
+    }
+
+    best = None
+    message, captured = '', None
+    if game_status not in ('checkmate', 'stalemate', 'draw'):
+        after_player = game.to_dict()
+        try:
+            best = game.get_ai_move(depth=_ai_depth(request))
+            reply = best and game.make_move(
+                best['from_row'], best['from_col'],
+                best['to_row'],   best['to_col'],
+            )
+        except EngineBusy:
+            best = reply = None
+        if reply and reply[0]:
+            _, message, captured, game_status = reply
+        else:
+            # No reply: the player's move is stored alone and the
+            # client falls back to /api/ai-move/
+            best = None
+            game = ChessGame.from_dict(after_player)
+            game.mark_saved(state.data)
+
+    # Before saving: nothing after the save may fail the request
+    legal_moves = _legal_moves_fields(request, game)
+    _save_game(request, state, game)
+    _record_move_result(request, game, game_status)
+
+    return JsonResponse({
+        'valid': True,
+        'move': player_move,
+        'ai_move': best,
+        'ai_rung': game.ai_rung if best else None,
+        'message': message,
+        'captured': captured,
+        'board': game.board,
+        'current_turn': game.current_turn,
+        'white_time': game.white_time,
+        'black_time': game.black_time,
+        'time_limit': getattr(game, 'time_limit', 600),
+        'increment': getattr(game, 'increment', 0),
+        **_history_fields(request, game, since),
+        'captured_pieces': game.captured,
+        'game_status': game_status,
+        'draw_reason': game.draw_reason,
+        'threefold_warning': game.threefold_warning,
+        **legal_moves,
+        'fen': game.generate_fen_key(),
+        'white_name': request.session.get('white_name', 'White'),
+        'black_name': request.session.get('black_name', 'Black'),
+    })
+
+@require_POST
+@_game_conflict_response
 def offer_draw(request):
     """Handle draw offers and agreements."""
-    game_data = request.session.get('game')
-    if not game_data:
+    state, game = _load_game(request)
+    if game is None:
         return JsonResponse(
             {'success': False, 'message': 'No active game.'}, status=400
         )
@@ -543,15 +1083,13 @@ def offer_draw(request):
         )
 
     if action == 'accept':
-        game = ChessGame.from_dict(game_data)
         if game.game_status != 'active':
             return JsonResponse(
                 {'success': False, 'message': 'Game is not active.'}, status=400
             )
         game.game_status = 'draw'
         game.draw_reason = 'agreement'
-        request.session['game'] = game.to_dict()
-        request.session.modified = True
+        _save_game(request, state, game)
         record_game_result(request, game.mode, 'draw', 'agreement', game.player_color, moves=game.move_history)
         return JsonResponse({
             'success': True,
@@ -562,21 +1100,20 @@ def offer_draw(request):
     return JsonResponse({'success': True})
 
 @require_POST
+@_game_conflict_response
 def resign_game(request):
     """Handle a player resigning the game."""
-    game_data = request.session.get('game')
-    if not game_data:
+    state, game = _load_game(request)
+    if game is None:
         return JsonResponse({'valid': False, 'message': 'No active game.'}, status=400)
 
-    game = ChessGame.from_dict(game_data)
-
+    jobs.cancel_for_game(state.pk)
     resigning_player = game.player_color if game.mode == 'ai' else game.current_turn
     winner = 'black' if resigning_player == 'white' else 'white'
     game_status = 'resignation'
 
     game.game_status = game_status
-    request.session['game'] = game.to_dict()
-    request.session.modified = True
+    _save_game(request, state, game)
 
     try:
         record_game_result(request, game.mode, winner, 'resign', game.player_color, moves=game.move_history)
@@ -1322,6 +1859,35 @@ def puzzle_stats_view(request):
         "longest_streak": 0
     })
 
+@require_GET
+def puzzle_view(request):
+    """Serve a precomputed puzzle, optionally filtered by theme/difficulty.
+
+    ``?daily=1`` returns the same puzzle to everyone for the current day.
+    """
+    theme = request.GET.get('theme') or None
+    if theme and theme not in dict(Puzzle.THEME_CHOICES):
+        return JsonResponse({'error': 'Unknown theme'}, status=400)
+    try:
+        difficulty = int(request.GET.get('difficulty') or 0)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid difficulty'}, status=400)
+
+    seed = None
+    if request.GET.get('daily') == '1':
+        seed = timezone.localdate().isoformat()
+
+    puzzle = pick_puzzle(theme, difficulty, seed)
+    if not puzzle:
+        return JsonResponse({'error': 'No puzzle available'}, status=404)
+    return JsonResponse({
+        'id': puzzle.pk,
+        'fen': puzzle.fen,
+        'solution': puzzle.solution,
+        'theme': puzzle.theme,
+        'difficulty': puzzle.difficulty,
+    })
+
 @csrf_exempt
 @require_POST
 def cleanup_cron(request):
@@ -1338,10 +1904,12 @@ def cleanup_cron(request):
 
     try:
         deleted, resigned = cleanup_stale_games()
+        pruned = prune_game_states()
         return JsonResponse({
             'status': 'success',
             'deleted_games': deleted,
-            'resigned_games': resigned
+            'resigned_games': resigned,
+            'pruned_games': pruned,
         })
     except Exception as e:
         return JsonResponse({
@@ -0,0 +1,77 @@
+"""Zobrist position hashing.
+
+Keys are drawn from a splitmix64 generator with a fixed seed so that every
+component (the binary opening book, ``ChessGame`` and the engines) derives
+exactly the same 64-bit hash for a position.  The keys are generated in
+this order:
+
+* 12 x 64 piece-square keys, pieces ordered ``PNBRQKpnbrqk`` and squares
+  numbered ``row * 8 + col`` with row 0 being rank 8,
+* one key XOR-ed in when black is to move,
+* four castling keys for ``K``, ``Q``, ``k`` and ``q``,
+* eight en-passant file keys.
+
+The en-passant file only contributes when the side to move can actually
+capture en passant, matching ``ChessGame._en_passant_key``.
+"""
+
+MASK64 = 0xFFFFFFFFFFFFFFFF
+SEED = 0x436865636B6F7261  # "Checkora"
+
+PIECES = 'PNBRQKpnbrqk'
+CASTLING = 'KQkq'
+
+
+def _splitmix64(state):
+    """Advance the generator; return ``(new_state, value)``."""
+    state = (state + 0x9E3779B97F4A7C15) & MASK64
+    z = state
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & MASK64
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & MASK64
+    return state, z ^ (z >> 31)
+
+
+def _generate_keys():
+    state = SEED
+    keys = []
+    for _ in range(len(PIECES) * 64 + 1 + len(CASTLING) + 8):
+        state, value = _splitmix64(state)
+        keys.append(value)
+    return keys
+
+
+_KEYS = _generate_keys()
+
+PIECE_KEYS = {
+    piece: _KEYS[index * 64:(index + 1) * 64]
+    for index, piece in enumerate(PIECES)
+}
+SIDE_KEY = _KEYS[len(PIECES) * 64]
+CASTLING_KEYS = dict(zip(CASTLING, _KEYS[len(PIECES) * 64 + 1:][:4]))
+EP_FILE_KEYS = _KEYS[len(PIECES) * 64 + 5:]
+
+
+def hash_position(board64, castling, turn, ep_file=None):
+    """Return the 64-bit Zobrist hash of a position.
+
+    *board64* is the engine's 64-char board string, *castling* the
+    ``KQkq``/``-`` rights string, *turn* ``'white'``/``'black'`` and
+    *ep_file* the file (0-7) of a capturable en-passant target, or None.
+    """
+    h = 0
+    for square, piece in enumerate(board64):
+        if piece != '.':
+            h ^= PIECE_KEYS[piece][square]
+    if turn == 'black':
+        h ^= SIDE_KEY
+    for right in castling:
+        if right in CASTLING_KEYS:
+            h ^= CASTLING_KEYS[right]
+    if ep_file is not None:
+        h ^= EP_FILE_KEYS[ep_file]
+    return h
+
+
+def format_hash(value):
+    """Render a hash as the 16-digit hex string used on the wire."""
+    return f"{value:016x}"